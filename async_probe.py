@@ -0,0 +1,255 @@
+"""
+This module is for probing large url lists with plain HTTP requests on a single asyncio event loop, instead of a
+thread per url
+"""
+
+import asyncio
+import datetime
+import http.client
+import socket
+import time
+from urllib.parse import urljoin, urlsplit
+import sys
+sys.path.append(".")
+from http_probe import MAX_REDIRECTS, USER_AGENT, create_ssl_context
+
+MAX_CONNECTIONS = 200
+MAX_CONNECTIONS_PER_HOST = 6
+TIMEOUT = 5.0
+MAX_HEADER_LINES = 100
+
+
+class AsyncProbeEngine(object):
+    """
+    Probes urls concurrently on an asyncio event loop. All the probes of a run share a pool of keep-alive connections
+    and a DNS cache. At most max_connections requests are sent at once, and at most max_connections_per_host to the
+    same host. Every probe has its own timeout, redirects included, and the run has a global deadline.
+    The probes record the same phases as probe_url, so their results are reported by HttpProbe.send_result
+    """
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_connections_per_host=MAX_CONNECTIONS_PER_HOST,
+                 timeout=TIMEOUT):
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.ssl_context = create_ssl_context()
+
+    # run probes all the urls and waits for them for up to deadline seconds. Returns the (url, timestamp, result,
+    # error) of every probe that started, where timestamp is the probe's start time and either result or error is
+    # None. Probes that are still running at the deadline are reported with a timeout error. Urls that did not start
+    # before the deadline are returned as skipped
+    def run(self, urls, deadline=None):
+        return asyncio.run(self.__run(list(urls), deadline))
+
+    async def __run(self, urls, deadline):
+        run = _ProbeRun(self)
+        tasks = [asyncio.ensure_future(run.check(index, url)) for index, url in enumerate(urls)]
+        try:
+            if tasks:
+                await asyncio.wait(tasks, timeout=deadline)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            run.close()
+        outcomes = []
+        skipped = []
+        for index, url in enumerate(urls):
+            if index in run.outcomes:
+                outcomes.append(run.outcomes[index])
+            elif index in run.started:
+                error = socket.timeout("Probe did not finish within the deadline of {} seconds".format(deadline))
+                outcomes.append((url, run.started[index], None, error))
+            else:
+                skipped.append(url)
+        return outcomes, skipped
+
+
+class _ProbeRun(object):
+    """
+    The state of a single engine run: its connection limits, idle connections and resolved hosts
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.started = {}
+        self.outcomes = {}
+        self.__connections = asyncio.Semaphore(engine.max_connections)
+        self.__host_connections = {}
+        self.__idle = {}
+        self.__addresses = {}
+
+    # check probes a single url, once there is a free connection slot for its host
+    async def check(self, index, url):
+        try:
+            result = await self.__probe(index, url)
+            self.outcomes[index] = (url, self.started[index], result, None)
+        except asyncio.TimeoutError:
+            error = socket.timeout("Probe timed out after {} seconds".format(self.engine.timeout))
+            self.outcomes[index] = (url, self.started[index], None, error)
+        except (http.client.HTTPException, OSError, EOFError, ValueError) as e:
+            self.outcomes[index] = (url, self.started[index], None, e)
+
+    # close closes the idle connections of the run
+    def close(self):
+        idle, self.__idle = self.__idle, {}
+        for connections in idle.values():
+            for _, writer in connections:
+                writer.close()
+
+    # __probe sends a GET request to the url, following redirects, and returns the same result as probe_url.
+    # The engine's timeout is the time of the whole probe, redirects included
+    async def __probe(self, index, url):
+        result = {"dns.ms": 0, "connect.ms": 0, "tls.ms": 0, "connection_reused": 1}
+        start = None
+        deadline = None
+        for _ in range(MAX_REDIRECTS + 1):
+            parsed = urlsplit(url)
+            host_connections = self.__host_connections.setdefault(
+                parsed.hostname, asyncio.Semaphore(self.engine.max_connections_per_host))
+            async with host_connections, self.__connections:
+                if start is None:
+                    self.started[index] = datetime.datetime.now(tz=datetime.timezone.utc)
+                    start = time.perf_counter()
+                    deadline = time.monotonic() + self.engine.timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                status, location, body_size = await asyncio.wait_for(self.__request(parsed, result), remaining)
+            if 300 <= status < 400 and location:
+                url = urljoin(url, location)
+                continue
+            result["status_code"] = status
+            result["body_size.bytes"] = body_size
+            result["time_to_complete.ms"] = (time.perf_counter() - start) * 1000
+            return result
+        raise http.client.HTTPException("Exceeded {} redirects".format(MAX_REDIRECTS))
+
+    # __request sends a single GET request, on an idle connection of the origin if there is one.
+    # Returns the status code, the Location header and the body size
+    async def __request(self, parsed, result):
+        origin = "{}://{}".format(parsed.scheme, parsed.netloc)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = "{}?{}".format(path, parsed.query)
+        connections = self.__idle.get(origin)
+        if connections:
+            reader, writer = connections.pop()
+            try:
+                return await self.__exchange(origin, parsed.netloc, path, reader, writer, result)
+            except (http.client.HTTPException, OSError, EOFError):
+                # the server closed the idle connection, the request is sent again on a new one
+                writer.close()
+            except BaseException:
+                writer.close()
+                raise
+        reader, writer = await self.__connect(parsed, result)
+        result["connection_reused"] = 0
+        try:
+            return await self.__exchange(origin, parsed.netloc, path, reader, writer, result)
+        except BaseException:
+            writer.close()
+            raise
+
+    # __exchange writes the request and reads the whole response, adding its time to first byte to the result.
+    # The connection goes back to the idle connections if the server keeps it alive
+    async def __exchange(self, origin, netloc, path, reader, writer, result):
+        request_start = time.perf_counter()
+        writer.write("GET {} HTTP/1.1\r\nHost: {}\r\nUser-Agent: {}\r\nAccept: */*\r\n\r\n".format(
+            path, netloc, USER_AGENT).encode("latin-1"))
+        await writer.drain()
+        status_line = await reader.readline()
+        result["time_to_first_byte.ms"] = (time.perf_counter() - request_start) * 1000
+        if not status_line:
+            raise http.client.RemoteDisconnected("Remote end closed connection without response")
+        parts = status_line.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+            raise http.client.BadStatusLine(status_line)
+        version, status = parts[0], int(parts[1])
+        headers = await self.__read_headers(reader)
+        will_close = version == "HTTP/1.0" or headers.get("connection", "").lower() == "close"
+        if 100 <= status < 200 or status in (204, 304):
+            body_size = 0
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            body_size = await self.__read_chunked(reader)
+        elif "content-length" in headers:
+            body_size = len(await reader.readexactly(int(headers["content-length"])))
+        else:
+            body_size = len(await reader.read())
+            will_close = True
+        if will_close:
+            writer.close()
+        else:
+            self.__idle.setdefault(origin, []).append((reader, writer))
+        return status, headers.get("location"), body_size
+
+    # __read_headers reads the response headers, with lower case names
+    async def __read_headers(self, reader):
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        raise http.client.HTTPException("Got more than {} headers".format(MAX_HEADER_LINES))
+
+    # __read_chunked reads a chunked body and returns its size
+    async def __read_chunked(self, reader):
+        body_size = 0
+        while True:
+            chunk_size = int((await reader.readline()).split(b";")[0].strip(), 16)
+            if chunk_size == 0:
+                await self.__read_headers(reader)
+                return body_size
+            body_size += len(await reader.readexactly(chunk_size))
+            await reader.readline()
+
+    # __connect opens a new connection to the url's origin, and adds the timings of the dns lookup, the tcp connect
+    # and the tls handshake to the result. Like socket.create_connection, every address of the host is tried in turn
+    async def __connect(self, parsed, result):
+        loop = asyncio.get_event_loop()
+        is_https = parsed.scheme == "https"
+        port = parsed.port or (443 if is_https else 80)
+        phase_start = time.perf_counter()
+        addresses = await self.__resolve(loop, parsed.hostname, port)
+        result["dns.ms"] += (time.perf_counter() - phase_start) * 1000
+        phase_start = time.perf_counter()
+        sock = None
+        error = None
+        for family, socket_type, proto, _, address in addresses:
+            sock = socket.socket(family, socket_type, proto)
+            sock.setblocking(False)
+            try:
+                await loop.sock_connect(sock, address)
+                break
+            except OSError as e:
+                sock.close()
+                sock = None
+                error = e
+            except BaseException:
+                sock.close()
+                raise
+        if sock is None:
+            raise error if error is not None else OSError("No addresses were found for {}".format(parsed.hostname))
+        result["connect.ms"] += (time.perf_counter() - phase_start) * 1000
+        try:
+            phase_start = time.perf_counter()
+            if is_https:
+                reader, writer = await asyncio.open_connection(sock=sock, ssl=self.engine.ssl_context,
+                                                               server_hostname=parsed.hostname)
+                result["tls.ms"] += (time.perf_counter() - phase_start) * 1000
+            else:
+                reader, writer = await asyncio.open_connection(sock=sock)
+        except BaseException:
+            sock.close()
+            raise
+        return reader, writer
+
+    # __resolve returns the addresses of a host. Every host is resolved once per run, probes of a host that is being
+    # resolved wait for the same lookup
+    async def __resolve(self, loop, host, port):
+        key = (host, port)
+        if key not in self.__addresses:
+            self.__addresses[key] = asyncio.ensure_future(loop.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        return await asyncio.shield(self.__addresses[key])
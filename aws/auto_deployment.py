@@ -1,44 +1,111 @@
+from dataclasses import dataclass
 import os
 import json
-import boto3
 import time
 import requests
 import datetime
 import sys
 sys.path.append(".")
 import input_validator
+from scheduler import WorkerScheduler, get_run_deadline, get_remaining_seconds
+from shipper import get_listener_url, post_data
 
 
-LOGZIO_CUSTOM_LISTENER = os.environ["LOGZIO_CUSTOM_LISTENER"]
-LOGZIO_METRICS_TOKEN = os.environ["LOGZIO_METRICS_TOKEN"]
-LOGZIO_LOGS_TOKEN = os.environ["LOGZIO_LOGS_TOKEN"]
-LOGZIO_REGION = os.environ["LOGZIO_REGION"]
-SCRAPE_INTERVAL = os.environ["SCRAPE_INTERVAL"]
-REGIONS = list(os.environ["REGIONS"].replace(' ', '').split(","))
-PROTOCOL = os.getenv("PROTOCOL", "https")
-STACK_NAME=os.environ["STACK_NAME"]
-URLS = os.environ["URLS"]
-MEMORY = os.environ["MEMORY"]
 responseStatus = 'SUCCESS'
+# the regions are deployed concurrently, by at most DEPLOYMENT_WORKERS workers
+DEPLOYMENT_WORKERS = 8
+# the stacks' status is polled with an exponential backoff, from the initial delay up to the max delay
+POLL_INITIAL_DELAY_SECONDS = 2
+POLL_MAX_DELAY_SECONDS = 20
+# time kept before the function's timeout for deleting the auto deployment stack
+DELETE_RESERVED_SECONDS = 10
+# how long the stacks are waited for when the context doesn't report the function's remaining time
+DEFAULT_WAIT_SECONDS = 360
+# in create mode a stack is created in every region. In reconcile mode existing stacks are updated only if their
+# parameters changed, and missing stacks are created
+DEPLOYMENT_MODE_CREATE = "create"
+DEPLOYMENT_MODE_RECONCILE = "reconcile"
+STACK_SUCCESS_STATUSES = frozenset(["CREATE_COMPLETE", "UPDATE_COMPLETE", "UPDATE_COMPLETE_CLEANUP_IN_PROGRESS"])
 
-# input validations
-input_validator.is_valid_logzio_token(LOGZIO_METRICS_TOKEN)
-input_validator.is_valid_logzio_token(LOGZIO_LOGS_TOKEN)
-input_validator.is_valid_logzio_region_code(LOGZIO_REGION)
-for region in REGIONS:
-    input_validator.is_valid_system_region("aws",region)
-input_validator.is_valid_function_name(os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
-input_validator.validate_aws_scrape_interval(SCRAPE_INTERVAL)
 
+@dataclass(frozen=True)
+class DeploymentSettings(object):
+    """
+    The settings of the deployment, parsed from the function's environment variables
+    """
+    logzio_listener: str
+    logzio_metrics_token: str
+    logzio_logs_token: str
+    logzio_region: str
+    scrape_interval: str
+    regions: tuple
+    protocol: str
+    stack_name: str
+    urls: str
+    memory: str
+    compression_level: int = None
+    deployment_mode: str = DEPLOYMENT_MODE_CREATE
 
+    # url_label is the urls, without the characters that can't be used in a stack name
+    @property
+    def url_label(self):
+        return _format_url(self.urls)
+
+
+# load_settings reads the deployment settings from the environment variables and validates them. Raises KeyError for
+# missing variables, and ValueError or TypeError for invalid ones
+def load_settings(environ):
+    compression_level = environ.get("GZIP_COMPRESSION_LEVEL", "")
+    settings = DeploymentSettings(logzio_listener=get_listener_url(environ["LOGZIO_REGION"],
+                                                                   environ["LOGZIO_CUSTOM_LISTENER"]),
+                                  logzio_metrics_token=environ["LOGZIO_METRICS_TOKEN"],
+                                  logzio_logs_token=environ["LOGZIO_LOGS_TOKEN"],
+                                  logzio_region=environ["LOGZIO_REGION"],
+                                  scrape_interval=environ["SCRAPE_INTERVAL"],
+                                  regions=tuple(environ["REGIONS"].replace(' ', '').split(",")),
+                                  protocol=environ.get("PROTOCOL", "https"),
+                                  stack_name=environ["STACK_NAME"],
+                                  urls=environ["URLS"],
+                                  memory=environ["MEMORY"],
+                                  compression_level=int(compression_level) if compression_level else None,
+                                  deployment_mode=environ.get("DEPLOYMENT_MODE", DEPLOYMENT_MODE_CREATE))
+    input_validator.is_valid_logzio_token(settings.logzio_metrics_token)
+    input_validator.is_valid_logzio_token(settings.logzio_logs_token)
+    input_validator.is_valid_logzio_region_code(settings.logzio_region)
+    for region in settings.regions:
+        input_validator.is_valid_system_region("aws", region)
+    input_validator.is_valid_function_name(environ.get("AWS_LAMBDA_FUNCTION_NAME"))
+    input_validator.validate_aws_scrape_interval(settings.scrape_interval)
+    input_validator.is_valid_compression_level(settings.compression_level)
+    input_validator.is_valid_deployment_mode(settings.deployment_mode)
+    return settings
+
+
+@dataclass()
+class RegionDeployment(object):
+    """
+    The result of deploying the stack of a region. The action is what was done with the stack (created, updated or
+    unchanged), and the status is the stack's last polled status
+    """
+    region: str
+    stack_name: str
+    action: str = None
+    status: str = None
+    error: str = None
+    duration_s: float = 0
+
+    @property
+    def succeeded(self):
+        return self.status in STACK_SUCCESS_STATUSES
+
+
+# _create_cloudformation_client creates a cloudformation client for the region. boto3 is imported only when a client
+# is created, so importing the module doesn't pay for it. Every client has its own session, since boto3's default
+# session is not thread safe
+def _create_cloudformation_client(region):
+    import boto3
+    return boto3.session.Session().client('cloudformation', region_name=region)
 
-if LOGZIO_CUSTOM_LISTENER == "":
-    if LOGZIO_REGION == "" or LOGZIO_REGION == "us":
-        LOGZIO_LISTENER = "https://listener.logz.io:8071"
-    else:
-        LOGZIO_LISTENER = "https://listener-{}.logz.io:8071".format(LOGZIO_REGION)
-else:
-    LOGZIO_LISTENER = LOGZIO_CUSTOM_LISTENER
 
 # _format_url removes unvalid characters for deployed stack name
 def _format_url(url):
@@ -46,99 +113,167 @@ def _format_url(url):
     return f_url
 
 
-URL_LABEL = _format_url(URLS)
-
-# __send_log sends log to your logz.io account
-def _send_log(message):
+# _send_log sends log to your logz.io account
+def _send_log(settings, message):
     timestamp = _format_timestamp(datetime.datetime.now(tz=datetime.timezone.utc))
     log = {"@timestamp": timestamp, "message": message, "type": "synthetic-monitoring"}
-    _send_data(json.dumps(log), is_metrics=False)
-
-# __send_data sends over HTTPS either a log or a metric to your logz.io account,
-# based on the token 
-def _send_data(data, is_metrics=True):
     try:
-        port = _get_port_by_protocol()
-        token = LOGZIO_METRICS_TOKEN if is_metrics else LOGZIO_LOGS_TOKEN
-        url = "{}/?token={}".format(LOGZIO_LISTENER, token)
-        response = requests.post(url, data=data)
+        response = post_data(settings.logzio_listener, settings.logzio_logs_token, json.dumps(log),
+                             settings.compression_level)
         if not response.ok:
-            # TODO
-            pass
+            print("Listener rejected log with status code {}: {}".format(response.status_code, message))
     except Exception as e:
-        # TODO
-        pass
-
-
-def _get_port_by_protocol():
-    if PROTOCOL == "https":
-        return "8071"
-    else:
-        return "8070"
+        print("Error occurred while trying to send log: {}".format(e))
 
-# __format_timestamp formats a timestamp to logz.io's acceptable timestamp format 'yyyy-MM-ddTHH:mm:ss.SSSZ'
+# _format_timestamp formats a timestamp to logz.io's acceptable timestamp format 'yyyy-MM-ddTHH:mm:ss.SSSZ'
 def _format_timestamp(timestamp):
     return "{}Z".format(timestamp.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3])
 
-# _deploy_stack uses boto3 libarary to deploy cloudforamtion stacks across all regions specified in `regions` parameter 
-def _deploy_stack(region):
+# _get_stack_name returns the name of the stack of a region
+def _get_stack_name(settings, region):
+    return 'logzio-sm-{}-{}'.format(region, settings.url_label)
+
+
+# _get_stack_parameters returns the parameters of the regions' stacks
+def _get_stack_parameters(settings):
+    values = [('logzioURL', settings.logzio_listener),
+              ('memorySize', settings.memory),
+              ('scrapeInterval', settings.scrape_interval),
+              ('logzioRegion', settings.logzio_region),
+              ('urls', settings.urls),
+              ('logzioMetricsToken', settings.logzio_metrics_token),
+              ('logzioLogsToken', settings.logzio_logs_token),
+              ('shippingProtocol', settings.protocol)]
+    return [{'ParameterKey': key, 'ParameterValue': value, 'UsePreviousValue': False} for key, value in values]
+
+
+# _get_template_url returns the url of the template of a region's stack
+def _get_template_url(region):
+    return 'https://sm-template.s3.amazonaws.com/0.0.2/sm-stack-{}.yaml'.format(region)
+
+
+# _deploy_stack creates the cloudformation stack of a region, and returns its name
+def _deploy_stack(settings, client, region):
+    stack_name = _get_stack_name(settings, region)
+    response = client.create_stack(
+        StackName=stack_name,
+        TemplateURL=_get_template_url(region),
+        Parameters=_get_stack_parameters(settings),
+        Capabilities=[
+            'CAPABILITY_IAM'
+        ]
+    )
+    _send_log(settings, json.dumps(response))
+    return stack_name
+
+
+# _describe_stack returns the description of a stack, or None if the stack doesn't exist
+def _describe_stack(client, stack_name):
     try:
-        _send_log("Starting to deploy cloudformation stack to {} region".format(region))
-        client = boto3.client('cloudformation', region_name=region)
-        response = client.create_stack(
-            StackName='logzio-sm-{}-{}'.format(region, URL_LABEL),
-            TemplateURL='https://sm-template.s3.amazonaws.com/0.0.2/sm-stack-{}.yaml'.format(region),
-            Parameters=[
-                {
-                    'ParameterKey': 'logzioURL',
-                    'ParameterValue': LOGZIO_LISTENER,
-                    'UsePreviousValue': False,
-                },
-                {
-                    'ParameterKey': 'memorySize',
-                    'ParameterValue': MEMORY,
-                    'UsePreviousValue': False,
-                },
-                {
-                    'ParameterKey': 'scrapeInterval',
-                    'ParameterValue': SCRAPE_INTERVAL,
-                    'UsePreviousValue': False,
-                },
-                {
-                    'ParameterKey': 'logzioRegion',
-                    'ParameterValue': LOGZIO_REGION,
-                    'UsePreviousValue': False,
-                },
-                {
-                    'ParameterKey': 'urls',
-                    'ParameterValue': URLS,
-                    'UsePreviousValue': False,
-                },
-                {
-                    'ParameterKey': 'logzioMetricsToken',
-                    'ParameterValue': LOGZIO_METRICS_TOKEN,
-                    'UsePreviousValue': False,
-                },
-                {
-                    'ParameterKey': 'logzioLogsToken',
-                    'ParameterValue': LOGZIO_LOGS_TOKEN,
-                    'UsePreviousValue': False,
-                },
-                {
-                    'ParameterKey': 'shippingProtocol',
-                    'ParameterValue': PROTOCOL,
-                    'UsePreviousValue': False,
-                }
-            ],
-            Capabilities=[
-                'CAPABILITY_IAM'
-            ]
+        return client.describe_stacks(StackName=stack_name)['Stacks'][0]
+    except Exception as e:
+        if "does not exist" in str(e):
+            return None
+        raise
 
-        )
-        _send_log(json.dumps(response))
+
+# _get_changed_parameters returns the keys of the parameters whose values differ from the stack's parameters
+def _get_changed_parameters(stack, parameters):
+    current = {parameter['ParameterKey']: parameter.get('ParameterValue') for parameter in stack.get('Parameters', [])}
+    return [parameter['ParameterKey'] for parameter in parameters
+            if current.get(parameter['ParameterKey']) != parameter['ParameterValue']]
+
+
+# _reconcile_stack creates the stack of a region if it doesn't exist, and updates it only if its parameters changed.
+# Returns what was done with the stack: created, updated or unchanged
+def _reconcile_stack(settings, client, region):
+    stack_name = _get_stack_name(settings, region)
+    stack = _describe_stack(client, stack_name)
+    if stack is None:
+        _deploy_stack(settings, client, region)
+        return "created"
+    parameters = _get_stack_parameters(settings)
+    changed = _get_changed_parameters(stack, parameters)
+    if not changed:
+        _send_log(settings, "Cloudformation stack {} at {} region is up to date".format(stack_name, region))
+        return "unchanged"
+    _send_log(settings, "Updating cloudformation stack {} at {} region. changed parameters: {}".format(
+        stack_name, region, ", ".join(changed)))
+    response = client.update_stack(
+        StackName=stack_name,
+        TemplateURL=_get_template_url(region),
+        Parameters=parameters,
+        Capabilities=[
+            'CAPABILITY_IAM'
+        ]
+    )
+    _send_log(settings, json.dumps(response))
+    return "updated"
+
+
+# _wait_for_stack polls the stack's status with an exponential backoff, until it's no longer in progress or the
+# deadline passed. Returns the last polled status
+def _wait_for_stack(client, stack_name, deadline, sleep=time.sleep):
+    delay = POLL_INITIAL_DELAY_SECONDS
+    while True:
+        status = client.describe_stacks(StackName=stack_name)['Stacks'][0]['StackStatus']
+        if status in STACK_SUCCESS_STATUSES or not status.endswith("_IN_PROGRESS"):
+            return status
+        remaining = get_remaining_seconds(deadline)
+        if remaining is not None and remaining <= 0:
+            return status
+        sleep(delay if remaining is None else min(delay, remaining))
+        delay = min(delay * 2, POLL_MAX_DELAY_SECONDS)
+
+
+# _deploy_region deploys the stack of a region with its own client, waits for it, and returns the deployment's result
+def _deploy_region(settings, region, deadline, client_factory, sleep):
+    start = time.monotonic()
+    deployment = RegionDeployment(region=region, stack_name=_get_stack_name(settings, region))
+    try:
+        _send_log(settings, "Starting to deploy cloudformation stack to {} region".format(region))
+        client = client_factory(region)
+        if settings.deployment_mode == DEPLOYMENT_MODE_RECONCILE:
+            deployment.action = _reconcile_stack(settings, client, region)
+        else:
+            _deploy_stack(settings, client, region)
+            deployment.action = "created"
+        deployment.status = _wait_for_stack(client, deployment.stack_name, deadline, sleep)
     except Exception as e:
-        _send_log("Error while creating cloudformation stack at {} region. message: {}".format(region, e))
-        pass
+        deployment.error = str(e)
+        _send_log(settings, "Error while creating cloudformation stack at {} region. message: {}".format(region, e))
+    deployment.duration_s = time.monotonic() - start
+    return deployment
+
+
+# deploy_regions deploys the stacks of all the regions concurrently, and waits until every region is done or the
+# deadline passed. Returns the deployments' results, in the order of the regions
+def deploy_regions(settings, deadline=None, client_factory=None, max_workers=DEPLOYMENT_WORKERS, sleep=None):
+    client_factory = client_factory or _create_cloudformation_client
+    sleep = sleep or time.sleep
+    deployments = {}
+
+    def deploy(region):
+        deployments[region] = _deploy_region(settings, region, deadline, client_factory, sleep)
+
+    WorkerScheduler(max_workers).run(deploy, settings.regions)
+    return [deployments[region] for region in settings.regions]
+
+
+# _format_result formats the result of a region's deployment: its error, or its action and status
+def _format_result(deployment):
+    if deployment.error is not None:
+        return deployment.error
+    return "{} {}".format(deployment.action, deployment.status)
+
+
+# _format_deployment_summary formats the deployments' results: how many regions succeeded, and every region's action,
+# status and duration
+def _format_deployment_summary(deployments, duration_s):
+    regions = ", ".join("{} {} ({:.1f}s)".format(deployment.region, _format_result(deployment), deployment.duration_s)
+                        for deployment in deployments)
+    succeeded = len([deployment for deployment in deployments if deployment.succeeded])
+    return "Deployed {}/{} regions in {:.1f}s: {}".format(succeeded, len(deployments), duration_s, regions)
 
 
 def getResponse(event, context, responseStatus):
@@ -157,34 +292,47 @@ def lambda_handler(event, context):
     try:
         req = requests.put(event['ResponseURL'], data=getResponse(event, context, responseStatus))
         if req.status_code != 200:
-            _send_log(req.text)
+            print(req.text)
             raise Exception('Received non 200 response while sending response to CFN.')
     except requests.exceptions.RequestException as e:
-        _send_log(e)
+        print(e)
         raise
-    
+
+    # the settings are validated after the response was sent, so an invalid setting doesn't leave the stack waiting
+    # for the response
     try:
-        client = boto3.client('cloudformation', region_name="us-east-1")
+        settings = load_settings(os.environ)
+    except (KeyError, ValueError, TypeError) as e:
+        print("Invalid deployment settings: {}".format(e))
+        raise
+
+    try:
+        client = _create_cloudformation_client("us-east-1")
         existing_stack = client.describe_stacks(
-        StackName=STACK_NAME
+        StackName=settings.stack_name
         )
         if existing_stack['Stacks'][0]['StackStatus'] == 'DELETE_IN_PROGRESS':
             return
     except Exception as e:
-        _send_log("Error while checking cloudformation stack status. message: {}".format(e))
-        
+        _send_log(settings, "Error while checking cloudformation stack status. message: {}".format(e))
+
+    # the stacks are waited for until they are done, or until it's time to delete the auto deployment stack
+    deadline = get_run_deadline(context, DELETE_RESERVED_SECONDS)
+    if deadline is None:
+        deadline = time.monotonic() + DEFAULT_WAIT_SECONDS
+    start = time.monotonic()
     try:
-        for region in REGIONS:
-            _deploy_stack(region)
+        deployments = deploy_regions(settings, deadline)
+        summary = _format_deployment_summary(deployments, time.monotonic() - start)
+        print(summary)
+        _send_log(settings, summary)
     except Exception as e:
-        _send_log("Error while creating cloudformation stacks. message: {}".format(e))
-
+        _send_log(settings, "Error while creating cloudformation stacks. message: {}".format(e))
 
-    time.sleep(240)
     try:
-        _send_log("Starting to delete {} cloudformation stack".format(STACK_NAME))
-        client = boto3.client('cloudformation', region_name="us-east-1")
-        response = client.delete_stack(StackName=STACK_NAME)
-        _send_log(json.dumps(response))
+        _send_log(settings, "Starting to delete {} cloudformation stack".format(settings.stack_name))
+        client = _create_cloudformation_client("us-east-1")
+        response = client.delete_stack(StackName=settings.stack_name)
+        _send_log(settings, json.dumps(response))
     except Exception as e:
-        _send_log("Error while deleting {} cloudformation stack. message: {}".format(STACK_NAME,e))
+        _send_log(settings, "Error while deleting {} cloudformation stack. message: {}".format(settings.stack_name,e))
@@ -1,74 +1,447 @@
-import os
 import sys
-import threading
 # For local testing please comment the following line:
 sys.path.append(".")
 # For local testing please uncomment the following line:
 # sys.path.append("..")
-from lights import LightsMonitor
-import input_validator
+from import_timer import ImportTimer
 
-threads = []
+# the imports are timed, and their times are sent with the self metrics of the container's first run
+with ImportTimer() as import_timer:
+    import datetime
+    import functools
+    import json
+    import os
+    from lights import LightsMonitor
+    from monitor_config import get_monitor_config
+    from phase_timer import PhaseTimer, SELF_METRICS_TYPE
+    from load_time_history import LoadTimeHistory, MAX_TIMEOUT_SECONDS, TIMEOUT_FACTOR
+    from http_probe import HttpConnectionPool, HttpProbe, PROBE_ENGINE_ASYNCIO, PROBE_ENGINE_THREADS, \
+        PROBE_TYPE_BROWSER, PROBE_TYPE_HTTP
+    from browser_pool import BrowserPool, create_chrome_driver, STATUS_CODE_MODE_FULL
+    from sharding import LambdaInvoker, ShardCoordinator, MAX_PARALLEL_INVOCATIONS, get_function_timeout, \
+        get_shard_end_time
+    from scheduler import WorkerScheduler, get_max_concurrency, get_remaining_seconds, get_run_deadline
+    from shipper import BackgroundShipper
+    from spool import Spool, DEFAULT_SPOOL_DIR
+    from process_memory import get_process_tree_rss_mb
+    from sys_region_adapter import get_country_code_by_region_and_system
+    import input_validator
+
+DEFAULT_MEMORY_SIZE = 512
+DEFAULT_MAX_BROWSER_USES = 50
+DEFAULT_MAX_BROWSER_MEMORY_MB = 350
+DEFAULT_FLUSH_TIMEOUT = 30
+DEFAULT_PROBE_DEADLINE = 60
+DEFAULT_CHECK_TIME_BUDGET = 20
+# the seconds a browser check may take on top of its page timeout, to launch the browser, collect and send the metrics
+CHECK_OVERHEAD_SECONDS = 15
+# warm_browser_pool keeps the browsers alive between invocations of the same container, when KEEP_BROWSER_WARM is on
+warm_browser_pool = None
+warm_browser_pool_settings = None
+# load_time_history keeps the load times of the urls between invocations of the same container, for the adaptive
+# timeouts
+load_time_history = LoadTimeHistory()
+# cold_start_metrics has the import times of the container's cold start. It's sent with the self metrics of the
+# container's first run, and cleared
+cold_start_metrics = dict(import_timer.get_metrics(), cold_start=1)
 
 
 def lambda_handler(event, context):
+    run_timer = PhaseTimer()
     urls_str = os.getenv("URLS")
-    logs_token = os.getenv("LOGZIO_LOGS_TOKEN")
-    metrics_token = os.getenv("LOGZIO_METRICS_TOKEN")
-    logzio_region_code = os.getenv("LOGZIO_REGION", "")
-    logzio_custom_listener = os.getenv("LOGZIO_CUSTOM_LISTENER", "")
-    aws_region = os.getenv("AWS_REGION")
-    function_name = os.getenv("AWS_LAMBDA_FUNCTION_NAME")
-    system = os.getenv("SYSTEM", "aws")
+    memory_size = int(os.getenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", DEFAULT_MEMORY_SIZE))
+    max_concurrency = os.getenv("MAX_CONCURRENCY")
+    keep_browser_warm = os.getenv("KEEP_BROWSER_WARM", "false").lower() == "true"
+    flush_timeout = float(os.getenv("FLUSH_TIMEOUT", DEFAULT_FLUSH_TIMEOUT))
+    spool_dir = os.getenv("SPOOL_DIR", DEFAULT_SPOOL_DIR)
+    url_settings_str = os.getenv("URL_SETTINGS", "")
+    default_probe = os.getenv("DEFAULT_PROBE", PROBE_TYPE_BROWSER)
+    probe_engine = os.getenv("PROBE_ENGINE", PROBE_ENGINE_THREADS)
+    probe_deadline = float(os.getenv("PROBE_DEADLINE", DEFAULT_PROBE_DEADLINE))
+    max_connections_per_host = os.getenv("MAX_CONNECTIONS_PER_HOST")
+    max_connections_per_host = int(max_connections_per_host) if max_connections_per_host else None
+    check_time_budget = float(os.getenv("CHECK_TIME_BUDGET", DEFAULT_CHECK_TIME_BUDGET))
+    max_dom_complete = float(os.getenv("MAX_DOM_COMPLETE", LightsMonitor.MAX_DOM_COMPLETE))
+    adaptive_timeout = os.getenv("ADAPTIVE_TIMEOUT", "false").lower() == "true"
+    adaptive_timeout_factor = float(os.getenv("ADAPTIVE_TIMEOUT_FACTOR", TIMEOUT_FACTOR))
+    adaptive_timeout_max = float(os.getenv("ADAPTIVE_TIMEOUT_MAX", MAX_TIMEOUT_SECONDS))
+    shard_count = int(os.getenv("SHARD_COUNT", 1))
+    max_parallel_invocations = int(os.getenv("MAX_PARALLEL_INVOCATIONS", MAX_PARALLEL_INVOCATIONS))
+    # the memory threshold is off unless it's set
+    memory_threshold_mb = os.getenv("MEMORY_THRESHOLD_MB", "")
+    memory_threshold_mb = float(memory_threshold_mb) if memory_threshold_mb else None
+
+    config = load_config()
+    urls = create_and_validate_url_list(urls_str)
+    shard = event.get("shard") if isinstance(event, dict) else None
+    end_time = None
+    if shard is not None:
+        # a worker invocation checks only the urls of its shard, and returns before the coordinator's end time
+        urls = input_validator.validate_url_list(shard["urls"])
+        end_time = shard.get("end_time")
+    elif shard_count > 1:
+        invoker = LambdaInvoker(config.function_name, read_timeout=get_function_timeout(context))
+        return run_coordinator(invoker, urls, shard_count, max_parallel_invocations,
+                               config.logzio_listener, config.metrics_token, config.compression_level, flush_timeout,
+                               config.region, config.system, config.function_name,
+                               end_time=get_shard_end_time(context, flush_timeout))
+    # the checks end early enough to leave FLUSH_TIMEOUT seconds for sending the metrics before the function's timeout
+    shutdown_deadline = get_run_deadline(context, end_time=end_time)
+    deadline = get_run_deadline(context, flush_timeout, end_time=end_time)
+    url_settings = create_and_validate_url_settings(url_settings_str)
+    input_validator.is_valid_probe_type(default_probe)
+    input_validator.is_valid_probe_engine(probe_engine)
+    input_validator.is_valid_max_dom_complete(max_dom_complete)
+    input_validator.is_valid_memory_threshold(memory_threshold_mb)
+    browser_urls = [url for url in urls if get_probe_type(url_settings, url, default_probe) == PROBE_TYPE_BROWSER]
+    if probe_engine == PROBE_ENGINE_ASYNCIO:
+        async_urls = [url for url in urls if get_probe_type(url_settings, url, default_probe) == PROBE_TYPE_HTTP]
+        urls = browser_urls
+    else:
+        async_urls = []
+    concurrency = get_max_concurrency(memory_size, int(max_concurrency) if max_concurrency else None)
+    workers = max(1, min(concurrency, len(urls)))
+    browser_pool = get_browser_pool(config.system, max(1, min(workers, len(browser_urls))), keep_browser_warm,
+                                    config.status_code_mode)
+    connection_pool = HttpConnectionPool()
+    spool = Spool(spool_dir) if spool_dir else None
+    metrics_shipper = BackgroundShipper(config.logzio_listener, config.metrics_token,
+                                        compression_level=config.compression_level, spool=spool)
+    logs_shipper = BackgroundShipper(config.logzio_listener, config.logs_token,
+                                     compression_level=config.compression_level)
+    monitor_args = dict(config.get_monitor_args(), metrics_shipper=metrics_shipper, logs_shipper=logs_shipper)
+    browser_args = {**config.get_browser_args(),
+                    "browser_pool": browser_pool,
+                    "load_time_history": load_time_history,
+                    "memory_threshold_mb": memory_threshold_mb}
+    timeout_args = {"default_timeout": max_dom_complete,
+                    "is_adaptive": adaptive_timeout,
+                    "factor": adaptive_timeout_factor,
+                    "max_timeout": adaptive_timeout_max}
+
+    deferred_urls = []
+
+    def run_check(url):
+        settings = url_settings.get(url, {})
+        create_and_run_check(url, get_probe_type(url_settings, url, default_probe), monitor_args,
+                             get_browser_args(browser_args, settings,
+                                              get_max_dom_complete(url, settings, **timeout_args)),
+                             connection_pool)
+
+    # check_url defers browser checks while the function's memory is above the threshold, so they won't start
+    # another browser page on top of it
+    def check_url(url):
+        if get_probe_type(url_settings, url, default_probe) == PROBE_TYPE_BROWSER and \
+                is_above_memory_threshold(memory_threshold_mb):
+            deferred_urls.append(url)
+            return
+        run_check(url)
+
+    def get_budget(url):
+        return get_time_budget(get_probe_type(url_settings, url, default_probe), check_time_budget,
+                               get_max_dom_complete(url, url_settings.get(url, {}), **timeout_args))
+
+    try:
+        if spool is not None:
+            with run_timer.phase("spool_replay"):
+                replay_spool(spool, metrics_shipper)
+        async_skipped = 0
+        if async_urls:
+            engine = create_async_probe_engine(max_connections_per_host)
+            remaining = get_remaining_seconds(deadline)
+            with run_timer.phase("async_probes"):
+                async_skipped = run_async_probes(engine, async_urls,
+                                                 probe_deadline if remaining is None else min(probe_deadline,
+                                                                                              remaining),
+                                                 monitor_args)
+        scheduler = WorkerScheduler(workers)
+        with run_timer.phase("checks"):
+            stats = scheduler.run(check_url, urls, deadline=deadline, get_budget=get_budget)
+        completed = stats.completed - len(deferred_urls)
+        failed = stats.failed
+        skipped = stats.skipped + async_skipped
+        if deferred_urls:
+            with run_timer.phase("deferred_checks"):
+                deferred_stats = run_deferred_checks(run_check, deferred_urls, browser_pool, deadline,
+                                                     get_budget)
+            completed += deferred_stats.completed
+            failed += deferred_stats.failed
+            skipped += deferred_stats.skipped
+        if failed:
+            print("{} of {} url checks failed".format(failed, stats.total))
+        if skipped:
+            print("{} urls were skipped to finish before the function's timeout".format(skipped))
+        send_run_metrics(metrics_shipper, len(async_urls) + stats.total, failed, skipped, len(deferred_urls),
+                         config.region, config.system, config.function_name)
+        send_self_metrics(metrics_shipper, dict(run_timer.get_metrics(), **take_cold_start_metrics()), config.region,
+                          config.system, config.function_name)
+        result = {"total": len(async_urls) + stats.total,
+                  "completed": completed + len(async_urls) - async_skipped,
+                  "failed": failed,
+                  "skipped": skipped,
+                  "deferred": len(deferred_urls)}
+    finally:
+        if not keep_browser_warm:
+            browser_pool.close()
+        connection_pool.close()
+        remaining = get_remaining_seconds(shutdown_deadline)
+        timeout = flush_timeout if remaining is None else min(flush_timeout, remaining)
+        with run_timer.phase("flush"):
+            is_flushed = metrics_shipper.close(timeout)
+            remaining = get_remaining_seconds(shutdown_deadline)
+            logs_timeout = timeout if remaining is None else max(0, min(timeout, remaining))
+            is_logs_flushed = logs_shipper.close(logs_timeout)
+        if not is_flushed:
+            print("Could not send all the metrics within {} seconds".format(timeout))
+        if not is_logs_flushed:
+            print("Could not send all the logs within {} seconds".format(logs_timeout))
+        # a shipper that was not flushed may still be sending or retrying a bulk of replayed metrics, so they are
+        # kept in the spool and replayed again by the next run
+        if spool is not None and is_flushed:
+            commit_spool_replay(spool)
+        print("Metrics shipping stats: {}".format(metrics_shipper.get_stats()))
+        print("Run phase times: {}".format(run_timer.get_metrics()))
+    return result
+
+
+# run_coordinator splits the urls into shards, checks every shard in a worker invocation of the function and sends
+# the completion stats of every shard. The workers return by end_time. Returns the stats of the shards
+def run_coordinator(invoker, urls, shard_count, max_parallel_invocations, listener, metrics_token, compression_level,
+                    flush_timeout, region, system, function_name, end_time=None):
+    coordinator = ShardCoordinator(invoker, shard_count, max_parallel_invocations, end_time)
+    shards_stats = coordinator.run(urls)
+    metrics_shipper = BackgroundShipper(listener, metrics_token, compression_level=compression_level)
+    try:
+        for shard_stats in shards_stats:
+            if shard_stats["error"] is not None:
+                print("Shard {} failed: {}".format(shard_stats["shard"], shard_stats["error"]))
+            send_shard_metrics(metrics_shipper, shard_stats, region, system, function_name)
+    finally:
+        if not metrics_shipper.close(flush_timeout):
+            print("Could not send all the shard metrics within {} seconds".format(flush_timeout))
+    return {"shards": shards_stats}
+
+
+# replay_spool queues the metrics that previous runs could not send, before the new checks start. The replayed metrics
+# take at most half of the shipper's queue, so the run's own metrics still fit. The rest is replayed by the next runs
+def replay_spool(spool, metrics_shipper):
+    try:
+        replayed = spool.replay(metrics_shipper.add_line, metrics_shipper.max_queue_size // 2)
+        if replayed:
+            print("Replaying {} spooled metrics documents".format(replayed))
+    except OSError as e:
+        print("Error occurred while replaying spooled metrics: {}".format(e))
+
+
+# commit_spool_replay removes the replayed metrics from the spool, after the shipper was flushed and they were sent,
+# dropped or spooled again. If the shipper could not be flushed, or the run ends before, they are replayed again by
+# the next run
+def commit_spool_replay(spool):
+    try:
+        spool.commit_replay()
+    except OSError as e:
+        print("Error occurred while removing replayed metrics from the spool: {}".format(e))
+
+
+# run_async_probes probes the http urls on the asyncio engine, and sends their results in the same metrics documents
+# as the threaded http probes. Urls that could not start before the deadline are not reported.
+# Returns the number of skipped urls
+def run_async_probes(engine, urls, deadline, monitor_args):
+    outcomes, skipped = engine.run(urls, deadline)
+    for url, timestamp, result, error in outcomes:
+        try:
+            HttpProbe(url=url, **monitor_args).send_result(timestamp, result, error)
+        except (ValueError, TypeError) as e:
+            print("Error occurred while reporting the probe of {}: {}".format(url, e))
+    if skipped:
+        print("{} of {} http probes did not start within the deadline of {} seconds".format(len(skipped), len(urls),
+                                                                                          deadline))
+    return len(skipped)
+
+
+# is_above_memory_threshold checks if all the processes of the function (python, chromedriver and chrome) use more
+# memory than the threshold (in MB)
+def is_above_memory_threshold(memory_threshold_mb):
+    if memory_threshold_mb is None:
+        return False
+    memory_mb = get_process_tree_rss_mb(os.getpid())
+    return memory_mb is not None and memory_mb > memory_threshold_mb
+
+
+# run_deferred_checks runs the checks that were deferred because the function's memory was above the threshold.
+# The idle browsers are closed to free their memory, and the checks run one at a time. Returns the run's stats
+def run_deferred_checks(run_check, urls, browser_pool, deadline, get_budget):
+    print("{} urls were deferred because the function's memory was above the threshold".format(len(urls)))
+    browser_pool.close_idle()
+    return WorkerScheduler(1).run(run_check, urls, deadline=deadline, get_budget=get_budget)
+
+
+# create_async_probe_engine creates the asyncio engine of the http probes. async_probe (and asyncio) is imported only
+# by the runs that use it
+def create_async_probe_engine(max_connections_per_host=None):
+    from async_probe import AsyncProbeEngine, MAX_CONNECTIONS_PER_HOST
+    if max_connections_per_host is None:
+        max_connections_per_host = MAX_CONNECTIONS_PER_HOST
+    return AsyncProbeEngine(max_connections_per_host=max_connections_per_host)
+
 
-    if is_valid_input(logs_token, metrics_token, logzio_region_code, aws_region, function_name, system):
-        urls = create_and_validate_url_list(urls_str)
+# take_cold_start_metrics returns the import times of the container's cold start on its first run, and an empty dict
+# on the next runs
+def take_cold_start_metrics():
+    global cold_start_metrics
+    metrics, cold_start_metrics = cold_start_metrics, {}
+    return metrics
 
-        for url in urls:
-            t = threading.Thread(target=create_and_run_lights,
-                                 args=(url, logs_token, metrics_token, logzio_region_code,
-                                       aws_region, function_name, logzio_custom_listener, system))
-            threads.append(t)
-            t.start()
 
-        for thread in threads:
-            thread.join()
+# get_time_budget returns the seconds a check of the probe type may take. A browser check may take its page timeout
+# and the check's overhead, and at least check_time_budget. Checks are started only if their budget ends before the
+# run's deadline
+def get_time_budget(probe_type, check_time_budget, page_timeout=None):
+    if probe_type == PROBE_TYPE_HTTP:
+        return HttpProbe.TIMEOUT
+    if page_timeout is None:
+        return check_time_budget
+    return max(check_time_budget, page_timeout + CHECK_OVERHEAD_SECONDS)
 
 
-def is_valid_input(logs_token, metrics_token, logzio_region_code, aws_region, func_name, system):
+# send_shard_metrics sends a metrics document with the completion stats of a shard
+def send_shard_metrics(metrics_shipper, shard_stats, region, system, function_name):
     try:
-        input_validator.is_valid_logzio_token(logs_token)
-        input_validator.is_valid_logzio_token(metrics_token)
-        input_validator.is_valid_logzio_region_code(logzio_region_code)
-        input_validator.is_supported_system(system)
-        input_validator.is_valid_system_region(system, aws_region)
-        input_validator.is_valid_function_name(func_name)
-        return True
+        timestamp = datetime.datetime.now(tz=datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        data = {"@timestamp": "{}Z".format(timestamp),
+                "type": "synthetic-monitoring",
+                "metrics": {"urls_total": shard_stats["urls"],
+                            "urls_completed": shard_stats["completed"],
+                            "urls_failed": shard_stats["failed"],
+                            "urls_skipped": shard_stats["skipped"],
+                            "invocation_failed": 0 if shard_stats["error"] is None else 1,
+                            "invocation_time.ms": shard_stats["invocation_time.ms"]},
+                "dimensions": {"country": get_country_code_by_region_and_system(system, region),
+                               "region": region,
+                               "function_name": function_name,
+                               "shard": shard_stats["shard"]}}
+        metrics_shipper.add(data)
+    except Exception as e:
+        print("Error occurred while sending the shard metrics: {}".format(e))
+
+
+# send_run_metrics sends a metrics document with the number of urls of the run, how many of them failed or were
+# skipped because the function was about to time out, and how many were deferred because of the memory threshold
+def send_run_metrics(metrics_shipper, total, failed, skipped, deferred, region, system, function_name):
+    try:
+        timestamp = datetime.datetime.now(tz=datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        data = {"@timestamp": "{}Z".format(timestamp),
+                "type": "synthetic-monitoring",
+                "metrics": {"urls_total": total, "urls_failed": failed, "urls_skipped": skipped,
+                            "urls_deferred": deferred},
+                "dimensions": {"country": get_country_code_by_region_and_system(system, region),
+                               "region": region,
+                               "function_name": function_name}}
+        metrics_shipper.add(data)
+    except Exception as e:
+        print("Error occurred while sending the run metrics: {}".format(e))
+
+
+# send_self_metrics sends a metrics document with the time (in ms) of every phase of the run. The flush phase ends after
+# the document is sent, so it's only printed
+def send_self_metrics(metrics_shipper, metrics, region, system, function_name):
+    try:
+        timestamp = datetime.datetime.now(tz=datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        data = {"@timestamp": "{}Z".format(timestamp),
+                "type": SELF_METRICS_TYPE,
+                "metrics": metrics,
+                "dimensions": {"country": get_country_code_by_region_and_system(system, region),
+                               "region": region,
+                               "function_name": function_name}}
+        metrics_shipper.add(data)
+    except Exception as e:
+        print("Error occurred while sending the run's self metrics: {}".format(e))
+
+
+# get_browser_pool returns the browser pool for the invocation. In warm mode the pool of the previous invocation
+# is reused, so its browsers skip chrome's cold start. The pool health-checks and resets the browsers between runs,
+# and recycles them after MAX_BROWSER_USES checks or when they use more than MAX_BROWSER_MEMORY_MB
+def get_browser_pool(system, max_browsers, keep_warm, status_code_mode=STATUS_CODE_MODE_FULL):
+    global warm_browser_pool, warm_browser_pool_settings
+    input_validator.is_valid_status_code_mode(status_code_mode)
+    driver_factory = functools.partial(create_chrome_driver, status_code_mode=status_code_mode)
+    if not keep_warm:
+        return BrowserPool(system, max_browsers=max_browsers, driver_factory=driver_factory)
+    settings = (system, max_browsers, status_code_mode)
+    if warm_browser_pool is not None and warm_browser_pool_settings != settings:
+        warm_browser_pool.close()
+        warm_browser_pool = None
+    if warm_browser_pool is None:
+        warm_browser_pool_settings = settings
+        warm_browser_pool = BrowserPool(system,
+                                        max_browsers=max_browsers,
+                                        max_uses=int(os.getenv("MAX_BROWSER_USES", DEFAULT_MAX_BROWSER_USES)),
+                                        max_memory_mb=float(os.getenv("MAX_BROWSER_MEMORY_MB",
+                                                                      DEFAULT_MAX_BROWSER_MEMORY_MB)),
+                                        driver_factory=driver_factory)
+    return warm_browser_pool
+
+
+# load_config returns the settings that are shared by all the checks. They are parsed from the environment and
+# validated once per container
+def load_config():
+    try:
+        return get_monitor_config(os.environ)
     except (ValueError, TypeError) as e:
         print("Could not launch monitor, invalid input: {}".format(e))
         raise e
     except Exception as e:
         print("Unexpected error occurred, could not launch monitor: {}".format(e))
         raise e
-    return False
-
-
-def create_and_run_lights(url, logs_token, metrics_token, logzio_region_code, aws_region, function_name,
-                          custom_listener, system):
-    lights_monitor = LightsMonitor(url=url,
-                                   logs_token=logs_token,
-                                   metrics_token=metrics_token,
-                                   logzio_region_code=logzio_region_code,
-                                   logzio_listener=custom_listener,
-                                   region=aws_region,
-                                   function_name=function_name,
-                                   system=system)
+
+
+# create_and_run_check checks a url with a browser, or with a plain HTTP request for the http probe type
+def create_and_run_check(url, probe_type, monitor_args, browser_args, connection_pool):
+    if probe_type == PROBE_TYPE_HTTP:
+        http_probe = HttpProbe(url=url, connection_pool=connection_pool, **monitor_args)
+        http_probe.monitor()
+        return
+    lights_monitor = LightsMonitor(url=url, **monitor_args, **browser_args)
     lights_monitor.monitor()
 
 
+# get_browser_args adds the request filters of the url's settings and its page timeout to the browser check arguments
+def get_browser_args(browser_args, settings, max_dom_complete):
+    filters = {key: settings[key] for key in ["block", "block_resource_types", "allow_hosts"] if key in settings}
+    return dict(browser_args, max_dom_complete=max_dom_complete, **filters)
+
+
+# get_max_dom_complete returns the page timeout of a url: the timeout of its settings if it was set, otherwise its
+# adaptive timeout (p99 of its recent load times multiplied by factor, up to max_timeout) in adaptive mode,
+# or the default timeout
+def get_max_dom_complete(url, settings, default_timeout, is_adaptive, factor, max_timeout):
+    if "max_dom_complete" in settings:
+        return float(settings["max_dom_complete"])
+    if is_adaptive:
+        return load_time_history.get_timeout(url, default_timeout, factor=factor, max_timeout=max_timeout)
+    return default_timeout
+
+
+# get_probe_type returns the probe type that is set for the url, or the default probe type
+def get_probe_type(url_settings, url, default_probe=PROBE_TYPE_BROWSER):
+    return url_settings.get(url, {}).get("probe", default_probe)
+
+
 def create_and_validate_url_list(urls_str):
     try:
         urls = [url.strip() for url in urls_str.split(",")]
     except ValueError as e:
         raise ValueError("Can't start monitoring. Error while getting URLs: {}".format(e))
     return input_validator.validate_url_list(urls)
+
+
+# create_and_validate_url_settings parses the per url settings, a json object that maps a url to its settings
+def create_and_validate_url_settings(url_settings_str):
+    if not url_settings_str:
+        return {}
+    try:
+        url_settings = json.loads(url_settings_str)
+    except ValueError as e:
+        raise ValueError("Can't start monitoring. Error while getting URL settings: {}".format(e))
+    input_validator.validate_url_settings(url_settings)
+    return url_settings
@@ -0,0 +1,330 @@
+"""
+This module is for launching headless chrome web drivers and sharing a bounded number of them between url checks
+"""
+
+import re
+import threading
+import time
+from selenium.common import exceptions
+import sys
+sys.path.append(".")
+import input_validator
+from process_memory import get_process_tree_rss_mb
+
+CHROME_ARGUMENTS = [
+    '--autoplay-policy=user-gesture-required',
+    '--disable-background-networking',
+    '--disable-background-timer-throttling',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-breakpad',
+    '--disable-client-side-phishing-detection',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-dev-shm-usage',
+    '--disable-domain-reliability',
+    '--disable-extensions',
+    '--disable-features=AudioServiceOutOfProcess',
+    '--disable-hang-monitor',
+    '--disable-ipc-flooding-protection',
+    '--disable-notifications',
+    '--disable-offer-store-unmasked-wallet-cards',
+    '--disable-popup-blocking',
+    '--disable-print-preview',
+    '--disable-prompt-on-repost',
+    '--disable-renderer-backgrounding',
+    '--disable-setuid-sandbox',
+    '--disable-speech-api',
+    '--disable-sync',
+    '--disk-cache-size=33554432',
+    '--hide-scrollbars',
+    '--ignore-gpu-blacklist',
+    '--ignore-certificate-errors',
+    '--metrics-recording-only',
+    '--mute-audio',
+    '--no-default-browser-check',
+    '--no-first-run',
+    '--no-pings',
+    '--no-sandbox',
+    '--no-zygote',
+    '--password-store=basic',
+    '--use-gl=swiftshader',
+    '--use-mock-keychain',
+    '--single-process',
+    '--headless']
+
+
+# STATUS_CODE_MODE_FULL records all the performance events, STATUS_CODE_MODE_NETWORK records only the events of the
+# Network domain, which are enough to find the page's status code
+STATUS_CODE_MODE_FULL = "full"
+STATUS_CODE_MODE_NETWORK = "network"
+
+
+# RESOURCE_TYPE_EXTENSIONS are the file extensions of each resource type that can be blocked. Chrome can block
+# requests by their url only, so the types are matched by the extension at the end of the url's path
+RESOURCE_TYPE_EXTENSIONS = {
+    "image": ["png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico", "bmp"],
+    "font": ["woff", "woff2", "ttf", "otf", "eot"],
+    "media": ["mp4", "webm", "ogg", "ogv", "mp3", "wav", "m4a", "mov", "m3u8"],
+    "stylesheet": ["css"],
+    "script": ["js"],
+}
+
+
+# get_extension_patterns returns the url patterns that match a file extension at the end of a url's path, with or
+# without a query
+def get_extension_patterns(extension):
+    return ["*.{}".format(extension), "*.{}?*".format(extension)]
+
+
+# matches_url_pattern checks if a url matches a blocked url pattern, in which '*' matches any characters
+def matches_url_pattern(url, pattern):
+    expression = ".*".join(re.escape(part) for part in pattern.split("*"))
+    return re.fullmatch(expression, url, re.DOTALL) is not None
+
+
+# get_blocked_url_patterns returns the url patterns that chrome should block for the blocked url patterns and
+# resource types of a check. Patterns that match the checked url are left out, so the page itself is never blocked
+def get_blocked_url_patterns(block=None, block_resource_types=None, url=None):
+    patterns = list(block or [])
+    for resource_type in block_resource_types or []:
+        for extension in RESOURCE_TYPE_EXTENSIONS[resource_type]:
+            patterns.extend(get_extension_patterns(extension))
+    if url is not None:
+        patterns = [pattern for pattern in patterns if not matches_url_pattern(url, pattern)]
+    return patterns
+
+
+# get_allow_hosts_arguments returns the chrome arguments that fail the dns lookup of every host that is not allowed,
+# so requests to other hosts fail before they are sent. A host pattern may start with a '*.' wildcard
+def get_allow_hosts_arguments(allow_hosts=None):
+    if not allow_hosts:
+        return ()
+    rules = ["MAP * ~NOTFOUND"] + ["EXCLUDE {}".format(host) for host in sorted(set(allow_hosts))]
+    return ("--host-resolver-rules={}".format(", ".join(rules)),)
+
+
+# create_chrome_driver sets up a new headless chrome web driver for the given system, with extra launch arguments
+def create_chrome_driver(system, status_code_mode=STATUS_CODE_MODE_FULL, launch_arguments=()):
+    # selenium's webdriver package takes most of the module's import time, so it's imported only when a browser is
+    # launched. Containers that only run http probes never import it
+    from selenium import webdriver
+    from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+    desired_capabilities = DesiredCapabilities.CHROME.copy()
+    desired_capabilities['goog:loggingPrefs'] = {'browser': 'ALL', 'performance': 'ALL'}
+    # driver.get returns after DOMContentLoaded, the rest of the page load is awaited by the check itself
+    desired_capabilities['pageLoadStrategy'] = 'eager'
+    options = webdriver.ChromeOptions()
+    for argument in CHROME_ARGUMENTS + list(launch_arguments):
+        options.add_argument(argument)
+    if status_code_mode == STATUS_CODE_MODE_NETWORK:
+        options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+    if system != "none":
+        options.binary_location = get_chrome_binary_by_system(system)
+    return webdriver.Chrome(desired_capabilities=desired_capabilities, options=options)
+
+
+# get_chrome_binary_by_system returns the path to the web driver binary, according to the system that's being used
+def get_chrome_binary_by_system(system):
+    if system == "aws":
+        return "/opt/bin/chromium"
+
+
+# get_driver_memory_mb returns the resident memory (in MB) of a driver's chromedriver and chrome processes,
+# or None if it can't be measured
+def get_driver_memory_mb(driver):
+    try:
+        return get_process_tree_rss_mb(driver.service.process.pid)
+    except AttributeError:
+        return None
+
+
+class BrowserPool(object):
+    """
+    Pool of headless chrome web drivers. Launches up to max_browsers drivers on demand and hands them out to url
+    checks. A released driver is reset to a fresh tab with cleared cookies, cache and logs before it is reused.
+    Drivers are recycled after max_uses checks, or when their processes use more than max_memory_mb.
+    Checks that need a browser with extra launch arguments get a driver that was launched with the same arguments.
+    When the pool is full, idle drivers with other arguments are closed to make room for them.
+    """
+
+    def __init__(self, system, max_browsers=1, max_uses=None, max_memory_mb=None,
+                 driver_factory=create_chrome_driver):
+        input_validator.is_valid_max_browsers(max_browsers)
+        self.system = system
+        self.max_browsers = max_browsers
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.__driver_factory = driver_factory
+        # the idle drivers, the most recently released one last
+        self.__idle = []
+        self.__lock = threading.Lock()
+        # notified when a driver is released or a slot is freed, so waiting checks can take or launch a driver
+        self.__condition = threading.Condition(self.__lock)
+        self.__drivers = []
+        self.__uses = {}
+        self.__launch_arguments = {}
+
+    # acquire returns a healthy idle driver that was launched with the launch arguments, launching a new one if the
+    # pool is not full yet. If all drivers are busy, it waits for one to be released
+    def acquire(self, timeout=None, launch_arguments=()):
+        launch_arguments = tuple(launch_arguments)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            driver = self.__take_idle(launch_arguments)
+            if driver is not None:
+                return driver
+            driver = self.__launch(launch_arguments)
+            if driver is not None:
+                return driver
+            with self.__condition:
+                # wait until a driver is released or a slot is freed, then take or launch a driver again
+                while not self.__idle and len(self.__drivers) >= self.max_browsers:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise exceptions.TimeoutException("No browser was released within {} seconds"
+                                                          .format(timeout))
+                    self.__condition.wait(remaining)
+
+    # release resets a driver that finished a check and returns it to the pool.
+    # A driver that can't be reset or has to be recycled is closed, and a new one will be launched instead.
+    # With recycle, the driver is closed even if it didn't reach its max uses or max memory
+    def release(self, driver, recycle=False):
+        with self.__lock:
+            uses = self.__uses.get(driver, 0) + 1
+            self.__uses[driver] = uses
+        if recycle or self.__should_recycle(driver, uses):
+            self.__discard(driver)
+            return
+        try:
+            self.__reset(driver)
+        except Exception:
+            self.__discard(driver)
+            return
+        with self.__condition:
+            self.__idle.append(driver)
+            self.__condition.notify()
+
+    # close quits all the drivers that were launched by the pool
+    def close(self):
+        with self.__condition:
+            drivers, self.__drivers = self.__drivers, []
+            self.__idle = []
+            self.__uses = {}
+            self.__launch_arguments = {}
+            self.__condition.notify_all()
+        for driver in drivers:
+            self.__quit(driver)
+
+    # close_idle quits the drivers that are not in use, to free their memory. Returns the number of closed drivers
+    def close_idle(self):
+        with self.__lock:
+            idle, self.__idle = self.__idle, []
+        for driver in idle:
+            self.__discard(driver)
+        return len(idle)
+
+    # size returns the number of drivers that are currently launched
+    def size(self):
+        with self.__lock:
+            return len(self.__drivers)
+
+    # __take_idle takes a healthy idle driver that was launched with the launch arguments, or returns None if there
+    # is none. If the pool is full, the least recently used idle driver with other arguments is closed to free a slot
+    def __take_idle(self, launch_arguments):
+        while True:
+            other = None
+            with self.__lock:
+                driver = self.__pop_idle(launch_arguments)
+                if driver is None and self.__idle and len(self.__drivers) >= self.max_browsers:
+                    other = self.__idle.pop(0)
+            if driver is None:
+                if other is not None:
+                    self.__discard(other)
+                return None
+            if self.__is_healthy(driver):
+                return driver
+            self.__discard(driver)
+
+    # __pop_idle removes and returns the most recently used idle driver that was launched with the launch arguments,
+    # or returns None if there is none. Should be called while holding the lock
+    def __pop_idle(self, launch_arguments):
+        for index in range(len(self.__idle) - 1, -1, -1):
+            if self.__launch_arguments.get(self.__idle[index], ()) == launch_arguments:
+                return self.__idle.pop(index)
+        return None
+
+    # __launch launches a new driver if the pool is not full, otherwise returns None
+    def __launch(self, launch_arguments=()):
+        with self.__lock:
+            if len(self.__drivers) >= self.max_browsers:
+                return None
+            # reserve the slot before launching, so concurrent checks won't exceed max_browsers
+            self.__drivers.append(None)
+        try:
+            if launch_arguments:
+                driver = self.__driver_factory(self.system, launch_arguments=launch_arguments)
+            else:
+                driver = self.__driver_factory(self.system)
+        except Exception:
+            with self.__condition:
+                self.__drivers.remove(None)
+                self.__condition.notify()
+            raise
+        with self.__lock:
+            self.__drivers[self.__drivers.index(None)] = driver
+            self.__launch_arguments[driver] = launch_arguments
+        return driver
+
+    # __discard quits a driver and frees its slot in the pool, waking up a check that waits for a driver
+    def __discard(self, driver):
+        with self.__condition:
+            if driver in self.__drivers:
+                self.__drivers.remove(driver)
+            self.__uses.pop(driver, None)
+            self.__launch_arguments.pop(driver, None)
+            self.__condition.notify()
+        self.__quit(driver)
+
+    # __should_recycle checks if a driver reached its max uses or max memory
+    def __should_recycle(self, driver, uses):
+        if self.max_uses is not None and uses >= self.max_uses:
+            return True
+        if self.max_memory_mb is not None:
+            memory_mb = get_driver_memory_mb(driver)
+            if memory_mb is not None and memory_mb > self.max_memory_mb:
+                return True
+        return False
+
+    # __is_healthy checks that an idle driver's browser still responds
+    def __is_healthy(self, driver):
+        try:
+            driver.current_window_handle
+            return True
+        except Exception:
+            return False
+
+    # __reset opens a fresh tab, closes the tabs of the previous check and clears the browser's state
+    def __reset(self, driver):
+        origin = driver.execute_script("return window.location.origin")
+        if origin and origin.startswith("http"):
+            driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": []})
+        old_handles = driver.window_handles
+        driver.execute_script("window.open('about:blank', '_blank');")
+        new_handles = [handle for handle in driver.window_handles if handle not in old_handles]
+        for handle in old_handles:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(new_handles[0])
+        # drain the logs of the previous check, so they won't be mixed with the next one
+        driver.get_log('performance')
+        driver.get_log('browser')
+
+    # __quit closes a driver, ignoring errors from drivers that already crashed
+    def __quit(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
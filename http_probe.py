@@ -0,0 +1,329 @@
+"""
+This module is for checking urls with a plain HTTP request, without launching a browser
+"""
+
+from dataclasses import dataclass
+import datetime
+import http.client
+import json
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+import sys
+sys.path.append(".")
+import input_validator
+from shipper import BulkShipper, get_listener_url, post_data
+from sys_region_adapter import get_country_code_by_region_and_system
+
+PROBE_TYPE_BROWSER = "browser"
+PROBE_TYPE_HTTP = "http"
+# the engines that run the http probes. The asyncio engine lives in async_probe, which is imported only when it's used
+PROBE_ENGINE_THREADS = "threads"
+PROBE_ENGINE_ASYNCIO = "asyncio"
+MAX_REDIRECTS = 5
+USER_AGENT = "LightS-probe"
+# the body is read in chunks, so the probe's deadline is checked while a slow body is read
+BODY_CHUNK_SIZE = 64 * 1024
+
+
+# create_ssl_context creates the ssl context of the probes. Like the browser checks, certificate errors are ignored
+def create_ssl_context():
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class HttpConnectionPool(object):
+    """
+    Keeps idle keep-alive connections by origin, so probes of the same origin in a run reuse their connection
+    """
+
+    def __init__(self):
+        self.ssl_context = create_ssl_context()
+        self.__idle = {}
+        self.__lock = threading.Lock()
+
+    # get returns an idle connection to the origin, or None if there is none
+    def get(self, origin):
+        with self.__lock:
+            connections = self.__idle.get(origin)
+            if connections:
+                return connections.pop()
+        return None
+
+    # put returns a connection to the pool after its response was fully read
+    def put(self, origin, connection):
+        with self.__lock:
+            self.__idle.setdefault(origin, []).append(connection)
+
+    # close closes all the idle connections
+    def close(self):
+        with self.__lock:
+            idle, self.__idle = self.__idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+# probe_url sends a GET request to the url, following redirects, and returns the timings of its phases (in ms),
+# the status code and the body size. Phases of connections that were reused from the pool are 0.
+# The whole probe, including the dns lookups, the redirects and reading the body, has timeout seconds to complete.
+# Raises socket.timeout when it doesn't
+def probe_url(url, timeout, connection_pool):
+    result = {"dns.ms": 0, "connect.ms": 0, "tls.ms": 0, "connection_reused": 1}
+    start = time.perf_counter()
+    deadline = time.monotonic() + timeout
+    for _ in range(MAX_REDIRECTS + 1):
+        parsed = urlsplit(url)
+        origin = "{}://{}".format(parsed.scheme, parsed.netloc)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = "{}?{}".format(path, parsed.query)
+        connection = connection_pool.get(origin)
+        if connection is not None:
+            try:
+                response, body_size = _get(connection, path, result, deadline)
+            except socket.timeout:
+                connection.close()
+                raise
+            except (http.client.HTTPException, OSError):
+                # the server closed the idle connection, the request is sent again on a new one
+                connection.close()
+                connection = None
+        if connection is None:
+            connection = _connect(parsed, deadline, connection_pool.ssl_context, result)
+            result["connection_reused"] = 0
+            try:
+                response, body_size = _get(connection, path, result, deadline)
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                raise
+        if response.will_close:
+            connection.close()
+        else:
+            connection_pool.put(origin, connection)
+        location = response.getheader("Location")
+        if 300 <= response.status < 400 and location:
+            url = urljoin(url, location)
+            continue
+        result["status_code"] = response.status
+        result["body_size.bytes"] = body_size
+        result["time_to_complete.ms"] = (time.perf_counter() - start) * 1000
+        return result
+    raise http.client.HTTPException("Exceeded {} redirects".format(MAX_REDIRECTS))
+
+
+# _get sends a GET request on the connection and reads the whole response, adding its time to first byte
+# to the result. Returns the response and the size of its body
+def _get(connection, path, result, deadline):
+    request_start = time.perf_counter()
+    if connection.sock is None:
+        raise http.client.NotConnected("The connection was closed")
+    connection.sock.settimeout(_get_remaining(deadline))
+    connection.request("GET", path, headers={"User-Agent": USER_AGENT})
+    response = connection.getresponse()
+    result["time_to_first_byte.ms"] = (time.perf_counter() - request_start) * 1000
+    body_size = 0
+    while True:
+        if connection.sock is not None:
+            connection.sock.settimeout(_get_remaining(deadline))
+        # read1 returns after a single read from the socket, so a body that trickles in can't outlive the deadline
+        chunk = response.read1(BODY_CHUNK_SIZE)
+        if not chunk:
+            # the body was read, closing the response lets the connection send the next request
+            response.close()
+            return response, body_size
+        body_size += len(chunk)
+
+
+# _connect opens a new connection to the url's origin, and adds the timings of the dns lookup, the tcp connect
+# and the tls handshake to the result. Like socket.create_connection, every address of the host is tried in turn
+def _connect(parsed, deadline, ssl_context, result):
+    is_https = parsed.scheme == "https"
+    port = parsed.port or (443 if is_https else 80)
+    phase_start = time.perf_counter()
+    addresses = _resolve(parsed.hostname, port, deadline)
+    result["dns.ms"] += (time.perf_counter() - phase_start) * 1000
+    phase_start = time.perf_counter()
+    sock = None
+    error = None
+    for family, socket_type, proto, _, address in addresses:
+        sock = socket.socket(family, socket_type, proto)
+        try:
+            sock.settimeout(_get_remaining(deadline))
+            sock.connect(address)
+            break
+        except OSError as e:
+            sock.close()
+            sock = None
+            error = e
+            if isinstance(e, socket.timeout):
+                raise
+    if sock is None:
+        raise error if error is not None else OSError("No addresses were found for {}".format(parsed.hostname))
+    result["connect.ms"] += (time.perf_counter() - phase_start) * 1000
+    try:
+        if is_https:
+            phase_start = time.perf_counter()
+            sock.settimeout(_get_remaining(deadline))
+            sock = ssl_context.wrap_socket(sock, server_hostname=parsed.hostname)
+            result["tls.ms"] += (time.perf_counter() - phase_start) * 1000
+            connection = http.client.HTTPSConnection(parsed.hostname, port, context=ssl_context)
+        else:
+            connection = http.client.HTTPConnection(parsed.hostname, port)
+    except BaseException:
+        sock.close()
+        raise
+    connection.sock = sock
+    return connection
+
+
+# _resolve looks up the addresses of a host. The lookup can't be given a timeout, so it runs on its own thread and is
+# waited for until the deadline
+def _resolve(host, port, deadline):
+    lookup = {}
+
+    def resolve():
+        try:
+            lookup["addresses"] = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except Exception as e:
+            lookup["error"] = e
+
+    resolver = threading.Thread(target=resolve, daemon=True)
+    resolver.start()
+    resolver.join(_get_remaining(deadline))
+    if resolver.is_alive():
+        raise socket.timeout("The dns lookup of {} timed out".format(host))
+    if "error" in lookup:
+        raise lookup["error"]
+    return lookup["addresses"]
+
+
+# _get_remaining returns the seconds that are left until the probe's deadline. Raises socket.timeout if it passed
+def _get_remaining(deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise socket.timeout("The probe timed out")
+    return remaining
+
+
+@dataclass()
+class HttpProbe(object):
+    """
+    Object for checking a url with a plain HTTP request and sending its metrics to logz.io.
+    The metrics document has the same shape as the page metrics of LightsMonitor
+    """
+    # class constants:
+    SUCCESS = 1
+    FAILURE = 0
+    TIMEOUT = 5.0
+
+    url: str
+    metrics_token: str
+    logs_token: str
+    region: str
+    logzio_region_code: str
+    logzio_listener: str
+    function_name: str
+    system: str
+    connection_pool: object = None
+    compression_level: int = None
+    metrics_shipper: object = None
+    # a shipper that batches the probe's logs. If it's not given, every log is sent in its own request
+    logs_shipper: object = None
+    # the MonitorConfig the shared settings were taken from. They were validated when the config was created, so only
+    # the url is validated
+    config: object = None
+
+    # __post_init__ validates the user's input and sets up logz.io listener
+    def __post_init__(self):
+        input_validator.is_valid_url(self.url)
+        if self.config is not None:
+            return
+        input_validator.is_valid_logzio_token(self.logs_token)
+        input_validator.is_valid_logzio_token(self.metrics_token)
+        input_validator.is_valid_logzio_region_code(self.logzio_region_code)
+        input_validator.is_supported_system(self.system)
+        input_validator.is_valid_system_region(self.system, self.region)
+        input_validator.is_valid_function_name(self.function_name)
+        input_validator.is_valid_compression_level(self.compression_level)
+        self.logzio_listener = get_listener_url(self.logzio_region_code, self.logzio_listener)
+
+    # monitor probes the url and sends its metrics to logz.io
+    def monitor(self):
+        # the pool is created only when the url is probed, results of other probes are sent without one
+        if self.connection_pool is None:
+            self.connection_pool = HttpConnectionPool()
+        timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
+        try:
+            result = probe_url(self.url, self.TIMEOUT, self.connection_pool)
+            self.send_result(timestamp, result)
+        except (http.client.HTTPException, OSError) as e:
+            self.send_result(timestamp, None, e)
+
+    # send_result creates the metrics document of a probe that started at timestamp, and sends it to logz.io.
+    # A probe that failed with an error is reported as down
+    def send_result(self, timestamp, result, error=None):
+        if error is not None:
+            metrics = {"up": self.FAILURE}
+            self.__send_log("Error occurred while probing url: {}".format(error))
+        else:
+            metrics = dict(result)
+            status_code = metrics["status_code"]
+            if 200 <= status_code < 300:
+                metrics["up"] = self.SUCCESS
+            elif 400 <= status_code < 600:
+                metrics["up"] = self.FAILURE
+                self.__send_log("Url {} returned status code {} for region {}".format(self.url, status_code,
+                                                                                     self.region))
+        data = {"@timestamp": self.__format_timestamp(timestamp),
+                "type": "synthetic-monitoring",
+                "metrics": metrics,
+                "dimensions": {"country": self.__get_country_code(), "region": self.region, "url": self.url}}
+        self.__send_metrics(data)
+
+    # __send_metrics sends the metrics with the shared metrics shipper if it was given, otherwise right away
+    def __send_metrics(self, data):
+        try:
+            if self.metrics_shipper is not None:
+                if not self.metrics_shipper.add(data):
+                    self.__send_log("Could not send metrics to the listener")
+                return
+            shipper = BulkShipper(self.logzio_listener, self.metrics_token, compression_level=self.compression_level)
+            shipper.add(data)
+            if not shipper.flush():
+                self.__send_log("Listener rejected a bulk of metrics")
+        except Exception as e:
+            self.__send_log("Error occurred while trying to send metrics. {}".format(e))
+
+    # __send_log sends log to your logz.io account, with the shared logs shipper if it was given, otherwise right away
+    def __send_log(self, message):
+        try:
+            timestamp = self.__format_timestamp(datetime.datetime.now(tz=datetime.timezone.utc))
+            log = {"@timestamp": timestamp, "message": message, "type": "synthetic-monitoring",
+                   "lambda_function": self.function_name, "region": self.region, "url": self.url}
+            if self.logs_shipper is not None:
+                if not self.logs_shipper.add(log):
+                    print("Could not send log to the listener: {}".format(message))
+                return
+            response = post_data(self.logzio_listener, self.logs_token, json.dumps(log), self.compression_level)
+            if not response.ok:
+                print("Listener rejected log with status code {}: {}".format(response.status_code, message))
+        except Exception as e:
+            print("Error occurred while trying to send log: {}".format(e))
+
+    # __get_country_code converts the system's region to the matching country code, to appear in the metrics
+    def __get_country_code(self):
+        if self.config is not None:
+            return self.config.country_code
+        try:
+            return get_country_code_by_region_and_system(self.system, self.region)
+        except ValueError:
+            self.__send_log("{} region is not supported".format(self.region))
+
+    # __format_timestamp formats a timestamp to logz.io's acceptable timestamp format 'yyyy-MM-ddTHH:mm:ss.SSSZ'
+    def __format_timestamp(self, timestamp):
+        return "{}Z".format(timestamp.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3])
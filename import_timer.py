@@ -0,0 +1,58 @@
+"""
+This module is for measuring how long the imports of a module take, like python's -X importtime, so the import time
+of a cold start can be sent as a metric
+"""
+
+import builtins
+import threading
+import time
+import sys
+
+# COLD_START_IMPORT_BUDGET_MS is the documented budget for the imports of the lambda handler's module
+COLD_START_IMPORT_BUDGET_MS = 300
+TOP_SLOWEST_IMPORTS = 10
+
+
+class ImportTimer(object):
+    """
+    Times the imports that run inside its with block. Every module that is imported for the first time gets its
+    cumulative import time (in ms), including the modules it imports, like the cumulative column of -X importtime.
+    Modules that were already imported and relative imports are not timed
+    """
+
+    def __init__(self):
+        self.times_ms = {}
+        self.total_ms = 0
+        self.__import = None
+        self.__start = None
+        self.__thread = None
+
+    def __enter__(self):
+        self.__thread = threading.get_ident()
+        self.__import = builtins.__import__
+        builtins.__import__ = self.__timed_import
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.total_ms = (time.perf_counter() - self.__start) * 1000
+        builtins.__import__ = self.__import
+
+    # get_metrics returns the total import time, and the import times of the slowest modules
+    def get_metrics(self, top_slowest=TOP_SLOWEST_IMPORTS):
+        metrics = {"import_total.ms": self.total_ms}
+        slowest = sorted(self.times_ms.items(), key=lambda item: item[1], reverse=True)[:top_slowest]
+        for name, import_ms in slowest:
+            metrics["import_time.{}.ms".format(name.replace(".", "_"))] = import_ms
+        return metrics
+
+    # __timed_import imports a module with the original __import__, and records its import time if it's imported for
+    # the first time
+    def __timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level != 0 or name in sys.modules or threading.get_ident() != self.__thread:
+            return self.__import(name, globals, locals, fromlist, level)
+        start = time.perf_counter()
+        try:
+            return self.__import(name, globals, locals, fromlist, level)
+        finally:
+            self.times_ms[name] = (time.perf_counter() - start) * 1000
@@ -7,13 +7,19 @@ import sys
 sys.path.append('.')
 import sys_region_adapter
 
+# the patterns are compiled once, when the module is imported
+TOKEN_PATTERN = re.compile(r"\b[a-zA-Z]{32}\b")
+URL_PATTERN = re.compile('^(http:\/\/www\.|https:\/\/www\.|http:\/\/|https:\/\/)?[a-z0-9]+([\-\.]{1}[a-z0-9]+)*\.[a-z]{2,5}(:[0-9]{1,5})?(\/.*)?$')
+ALLOW_HOST_PATTERN = re.compile(r'^(\*\.)?[a-z0-9]+([\-\.][a-z0-9]+)*$')
+SCRAPE_INTERVAL_PATTERN = re.compile(r'^rate\([0-9]+ (minute|minutes|hour|hours|day|days)\)$')
+VALID_LOGZIO_REGIONS = frozenset(["au", "ca", "eu", "nl", "uk", "us", "wa"])
+
 
 # is_valid_logzio_token checks if a given token is a valid logz.io token
 def is_valid_logzio_token(token):
     if type(token) is not str:
         raise TypeError("Token should be a string")
-    regex = r"\b[a-zA-Z]{32}\b"
-    match_obj = re.search(regex, token)
+    match_obj = TOKEN_PATTERN.search(token)
     if match_obj is not None and match_obj.group() is not None:
         if any(char.islower() for char in token) and any(char.isupper() for char in token):
             return True
@@ -25,9 +31,8 @@ def is_valid_logzio_token(token):
 def is_valid_logzio_region_code(logzio_region_code):
     if logzio_region_code is None or type(logzio_region_code) is not str:
         raise TypeError("Logzio region code should be a string")
-    valid_logzio_regions = ["au", "ca", "eu", "nl", "uk", "us", "wa"]
     if logzio_region_code != "":
-        if logzio_region_code not in valid_logzio_regions:
+        if logzio_region_code not in VALID_LOGZIO_REGIONS:
             raise ValueError("invalid logzio region code: {}. cannot start monitoring".format(logzio_region_code))
     return True
 
@@ -60,12 +65,42 @@ def validate_url_list(urls):
     return valid_urls
 
 
+# validate_url_settings checks that the per url settings map valid urls to supported settings:
+# probe - how the url is checked, with a "browser" (default) or a plain "http" request
+# block - url patterns of requests that the browser blocks
+# block_resource_types - resource types that the browser blocks
+# allow_hosts - the only hosts (besides the url's host) that the browser sends requests to
+# max_dom_complete - how long (in seconds) the browser waits for the page to load
+def validate_url_settings(url_settings):
+    if type(url_settings) is not dict:
+        raise TypeError("URL settings should be a dictionary")
+    for url, settings in url_settings.items():
+        is_valid_url(url)
+        if type(settings) is not dict:
+            raise TypeError("Settings of url {} should be a dictionary".format(url))
+        for key, value in settings.items():
+            if key == "probe":
+                is_valid_probe_type(value)
+            elif key == "block":
+                is_valid_url_patterns(value)
+            elif key == "block_resource_types":
+                is_valid_blocked_resource_types(value)
+            elif key == "allow_hosts":
+                is_valid_allow_hosts(value)
+            elif key == "max_dom_complete":
+                if type(value) not in [int, float]:
+                    raise TypeError("max_dom_complete of url {} should be a number".format(url))
+                is_valid_max_dom_complete(float(value))
+            else:
+                raise ValueError("Unsupported setting for url {}: {}".format(url, key))
+    return True
+
+
 # is_valid_url checks with a regex that a url is in a valid format
 def is_valid_url(url):
     if type(url) is not str:
         raise TypeError("URL should be a string")
-    regex = '^(http:\/\/www\.|https:\/\/www\.|http:\/\/|https:\/\/)?[a-z0-9]+([\-\.]{1}[a-z0-9]+)*\.[a-z]{2,5}(:[0-9]{1,5})?(\/.*)?$'
-    match_obj = re.search(regex, url)
+    match_obj = URL_PATTERN.search(url)
     if match_obj is not None and match_obj.group() is not None:
         return True
     raise ValueError("URL is invalid: {}".format(url))
@@ -92,14 +127,162 @@ def is_valid_max_dom_complete(max_dom_complete):
     return True
 
 
+# is_valid_positive_integer checks if the value of the named setting is a positive integer
+def is_valid_positive_integer(value, name):
+    if type(value) is not int:
+        raise TypeError("{} should be an integer".format(name))
+    elif value <= 0:
+        raise ValueError("Invalid {} value. Should be a positive integer".format(name))
+    return True
+
+
+# is_valid_max_browsers checks if max_browsers is a positive integer
+def is_valid_max_browsers(max_browsers):
+    return is_valid_positive_integer(max_browsers, "max_browsers")
+
+
+# is_valid_max_concurrency checks if max_concurrency is a positive integer
+def is_valid_max_concurrency(max_concurrency):
+    return is_valid_positive_integer(max_concurrency, "max_concurrency")
+
+
+# is_valid_compression_level checks if compression_level is None (no compression) or a gzip level between 1 and 9
+def is_valid_compression_level(compression_level):
+    if compression_level is None:
+        return True
+    if type(compression_level) is not int:
+        raise TypeError("Compression level should be an integer")
+    elif not 1 <= compression_level <= 9:
+        raise ValueError("Invalid compression_level value. Should be between 1 and 9")
+    return True
+
+
+# is_valid_status_code_mode checks that the status code mode is one of the supported modes
+def is_valid_status_code_mode(status_code_mode):
+    if type(status_code_mode) is not str:
+        raise TypeError("Status code mode should be a string")
+    if status_code_mode not in ["full", "network"]:
+        raise ValueError("Invalid status code mode: {}. Should be full or network".format(status_code_mode))
+    return True
+
+
+# is_valid_completion_event checks that the completion event is one of the events a check can wait for
+def is_valid_completion_event(completion_event):
+    if type(completion_event) is not str:
+        raise TypeError("Completion event should be a string")
+    if completion_event not in ["domcontentloaded", "load", "networkidle"]:
+        raise ValueError("Invalid completion event: {}. Should be domcontentloaded, load or networkidle"
+                         .format(completion_event))
+    return True
+
+
+# is_valid_probe_type checks that a url is checked with a "browser" or with a plain "http" request
+def is_valid_probe_type(probe_type):
+    if type(probe_type) is not str:
+        raise TypeError("Probe type should be a string")
+    if probe_type not in ["browser", "http"]:
+        raise ValueError("Invalid probe: {}. Should be browser or http".format(probe_type))
+    return True
+
+
+# is_valid_probe_engine checks that the http probes run on worker "threads" or on an "asyncio" event loop
+def is_valid_probe_engine(probe_engine):
+    if type(probe_engine) is not str:
+        raise TypeError("Probe engine should be a string")
+    if probe_engine not in ["threads", "asyncio"]:
+        raise ValueError("Invalid probe engine: {}. Should be threads or asyncio".format(probe_engine))
+    return True
+
+
+# is_valid_resource_metrics_mode checks that resource metrics are sent for "all" the resources, or "aggregate"d
+def is_valid_resource_metrics_mode(resource_metrics_mode):
+    if type(resource_metrics_mode) is not str:
+        raise TypeError("Resource metrics mode should be a string")
+    if resource_metrics_mode not in ["all", "aggregate"]:
+        raise ValueError("Invalid resource metrics mode: {}. Should be all or aggregate".format(resource_metrics_mode))
+    return True
+
+
+# is_valid_top_slowest_resources checks if the number of slowest resources to send is a non-negative integer
+def is_valid_top_slowest_resources(top_slowest_resources):
+    if type(top_slowest_resources) is not int:
+        raise TypeError("Number of slowest resources should be an integer")
+    if top_slowest_resources < 0:
+        raise ValueError("Number of slowest resources should not be negative")
+    return True
+
+
+# is_valid_url_patterns checks that url patterns are None or a list of non-empty strings, where '*' matches any
+# characters
+def is_valid_url_patterns(url_patterns):
+    if url_patterns is None:
+        return True
+    if type(url_patterns) is not list or any(type(pattern) is not str for pattern in url_patterns):
+        raise TypeError("URL patterns should be a list of strings")
+    if "" in url_patterns:
+        raise ValueError("URL patterns should not be empty")
+    return True
+
+
+# is_valid_blocked_resource_types checks that blocked resource types are None or a list of resource types that can be
+# blocked
+def is_valid_blocked_resource_types(resource_types):
+    if resource_types is None:
+        return True
+    if type(resource_types) is not list:
+        raise TypeError("Blocked resource types should be a list")
+    for resource_type in resource_types:
+        if resource_type not in ["image", "font", "media", "stylesheet", "script"]:
+            raise ValueError("Invalid blocked resource type: {}. Should be image, font, media, stylesheet or script"
+                             .format(resource_type))
+    return True
+
+
+# is_valid_allow_hosts checks that allowed hosts are None or a list of host names, which may start with a '*.'
+# wildcard
+def is_valid_allow_hosts(allow_hosts):
+    if allow_hosts is None:
+        return True
+    if type(allow_hosts) is not list or any(type(host) is not str for host in allow_hosts):
+        raise TypeError("Allowed hosts should be a list of strings")
+    for host in allow_hosts:
+        if ALLOW_HOST_PATTERN.match(host) is None:
+            raise ValueError("Invalid allowed host: {}".format(host))
+    return True
+
+
+# is_valid_shard_count checks if the number of shards is a positive integer
+def is_valid_shard_count(shard_count):
+    return is_valid_positive_integer(shard_count, "shard_count")
+
+
+# is_valid_memory_threshold checks that the memory threshold is None (no threshold) or a positive number of MB
+def is_valid_memory_threshold(memory_threshold_mb):
+    if memory_threshold_mb is None:
+        return True
+    if type(memory_threshold_mb) not in [int, float]:
+        raise TypeError("Memory threshold should be a number")
+    if memory_threshold_mb <= 0:
+        raise ValueError("Memory threshold should be a positive number")
+    return True
+
+
+# is_valid_deployment_mode checks that the auto deployment's mode is one of the supported modes
+def is_valid_deployment_mode(deployment_mode):
+    if type(deployment_mode) is not str:
+        raise TypeError("Deployment mode should be a string")
+    if deployment_mode not in ["create", "reconcile"]:
+        raise ValueError("Invalid deployment mode: {}. Should be create or reconcile".format(deployment_mode))
+    return True
+
+
 # validate_aws_scrape_interval validates the scrape interval for the lambda functions
 def validate_aws_scrape_interval(scrape_interval):
     if scrape_interval is None or scrape_interval == "":
         raise ValueError("Must enter value scrape interval")
     if scrape_interval is not None and type(scrape_interval) is not str:
         raise TypeError("Invalid type for scrape interval")
-    regex = r'^rate\([0-9]+ (minute|minutes|hour|hours|day|days)\)$'
-    match_obj = re.search(regex, scrape_interval)
+    match_obj = SCRAPE_INTERVAL_PATTERN.search(scrape_interval)
     if match_obj is not None and match_obj.group() is not None:
         return True
     else:
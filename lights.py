@@ -1,14 +1,19 @@
 from dataclasses import dataclass
 import datetime
 import json
-import requests
-from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+import os
+import time
+from urllib.parse import urlsplit
 from selenium.common import exceptions
-from selenium import webdriver
-from selenium.webdriver.support.ui import WebDriverWait
 import sys
 sys.path.append(".")
 import input_validator
+from browser_pool import create_chrome_driver, get_allow_hosts_arguments, get_blocked_url_patterns, \
+    get_driver_memory_mb, STATUS_CODE_MODE_FULL, STATUS_CODE_MODE_NETWORK
+from phase_timer import PhaseTimer, SELF_METRICS_TYPE
+from process_memory import PeakMemorySampler, get_peak_rss_mb, get_process_tree_rss_mb
+from resource_stats import get_resource_origin, get_slowest_resources, summarize_resources
+from shipper import BulkShipper, get_listener_url, post_data, serialize_document
 from sys_region_adapter import get_country_code_by_region_and_system
 
 
@@ -22,6 +27,60 @@ class LightsMonitor(object):
     FAILURE = 0
     TOKEN_LENGTH = 32
     MAX_DOM_COMPLETE = 5.0
+    # completion events that a check can wait for before collecting the metrics
+    COMPLETION_EVENT_DOM_CONTENT_LOADED = "domcontentloaded"
+    COMPLETION_EVENT_LOAD = "load"
+    COMPLETION_EVENT_NETWORK_IDLE = "networkidle"
+    # NETWORK_IDLE_MS is how long no resources should finish loading after the load event, for the network to be idle
+    NETWORK_IDLE_MS = 500
+    # resource metrics modes: a document for every resource, or summaries per resource type and origin with
+    # documents only for the slowest resources
+    RESOURCE_METRICS_ALL = "all"
+    RESOURCE_METRICS_AGGREGATE = "aggregate"
+    TOP_SLOWEST_RESOURCES = 10
+    # WAIT_FOR_COMPLETION_SCRIPT waits in the browser for the completion event, and calls back once it happened.
+    # Network idle is detected with a PerformanceObserver on the resource entries
+    WAIT_FOR_COMPLETION_SCRIPT = """
+        var completionEvent = arguments[0], networkIdleMs = arguments[1], callback = arguments[arguments.length - 1];
+        function complete() {
+            callback(true);
+        }
+        if (completionEvent === 'domcontentloaded') {
+            if (document.readyState !== 'loading') {
+                return complete();
+            }
+            document.addEventListener('DOMContentLoaded', complete);
+        } else if (completionEvent === 'load') {
+            if (document.readyState === 'complete') {
+                return complete();
+            }
+            window.addEventListener('load', complete);
+        } else {
+            var idleTimer = null;
+            var waitForIdle = function () {
+                clearTimeout(idleTimer);
+                idleTimer = setTimeout(complete, networkIdleMs);
+            };
+            new PerformanceObserver(waitForIdle).observe({entryTypes: ['resource']});
+            if (document.readyState === 'complete') {
+                waitForIdle();
+            } else {
+                window.addEventListener('load', waitForIdle);
+            }
+        }
+    """
+    # PERFORMANCE_SNAPSHOT_SCRIPT collects the page's navigation timing, ready state and resource timings
+    # in a single round trip to the browser
+    PERFORMANCE_SNAPSHOT_SCRIPT = """
+        var timing = window.performance.timing;
+        var resources = window.performance.getEntriesByType('resource').map(function (r) {
+            return {name: r.name, initiatorType: r.initiatorType, fetchStart: r.fetchStart,
+                    responseEnd: r.responseEnd, duration: r.duration, transferSize: r.transferSize};
+        });
+        return {navigationStart: timing.navigationStart, requestStart: timing.requestStart,
+                responseStart: timing.responseStart, domComplete: timing.domComplete,
+                readyState: document.readyState, resources: resources};
+    """
 
     url: str
     metrics_token: str
@@ -31,213 +90,306 @@ class LightsMonitor(object):
     logzio_listener: str
     function_name: str
     system: str
+    browser_pool: object = None
+    compression_level: int = None
+    metrics_shipper: object = None
+    # a shipper that batches the check's logs. If it's not given, every log is sent in its own request
+    logs_shipper: object = None
+    status_code_mode: str = STATUS_CODE_MODE_FULL
+    completion_event: str = COMPLETION_EVENT_LOAD
+    resource_metrics: str = RESOURCE_METRICS_ALL
+    top_slowest_resources: int = TOP_SLOWEST_RESOURCES
+    block: list = None
+    block_resource_types: list = None
+    allow_hosts: list = None
+    max_dom_complete: float = MAX_DOM_COMPLETE
+    load_time_history: object = None
+    memory_threshold_mb: float = None
+    # the MonitorConfig the shared settings were taken from. They were validated when the config was created, so only
+    # the url's own settings are validated
+    config: object = None
 
     # __post_init__ validates the user's input and sets up logz.io listener
     def __post_init__(self):
-        if not self.__validate_input():
+        # the documents of a check share their dimensions and the snapshot's timestamp, they are computed once
+        self.__dimensions = None
+        self.__snapshot_timestamp = None
+        if self.config is not None:
+            self.__validate_url_input()
             return
-
-        if self.logzio_listener != "":
+        if not self.__validate_input():
             return
 
-        if self.logzio_region_code == "" or self.logzio_region_code == "us":
-            self.logzio_listener = "https://listener.logz.io:8071"
-        else:
-            self.logzio_listener = "https://listener-{}.logz.io:8071".format(self.logzio_region_code)
-
-    class dom_is_completed(object):
-        """
-        An expectation for checking that the DOM elements load is complete.
-        """
+        self.logzio_listener = get_listener_url(self.logzio_region_code, self.logzio_listener)
 
-        def __init__(self):
-            pass
-
-        def __call__(self, driver):
-            return self.__get_status_ready(driver)
-
-        def __get_status_ready(self, driver):
-            js_script = "return document.readyState"
-            ready_response = driver.execute_script(js_script)
-            return ready_response == 'complete'
-
-    # monitor sets up and runs the web driver, gets relevant metrics and sends them to logz.io
+    # monitor sets up and runs the web driver, gets relevant metrics and sends them to logz.io. The time of every
+    # phase of the check and the peak memory of the function and the browser during the check are sent along with the
+    # metrics, in a synthetic-monitoring-self document. If the function's memory went above memory_threshold_mb, the
+    # browser is recycled before the next check
     def monitor(self):
-        driver = self.__get_driver()
+        self.__phase_timer = PhaseTimer()
+        with self.__phase_timer.phase("driver_launch"):
+            driver = self.__get_driver()
         if driver:
+            memory_sampler = self.__create_memory_sampler(driver).start()
             is_dom_complete = False
+            is_timed_out = False
+            load_start = time.monotonic()
             try:
-                driver.get(self.url)
-                wait = WebDriverWait(driver, self.MAX_DOM_COMPLETE)
-                check_dom = self.dom_is_completed()
-                is_dom_complete = wait.until(check_dom)
+                self.__block_requests(driver)
+                driver.set_page_load_timeout(self.max_dom_complete)
+                with self.__phase_timer.phase("get"):
+                    driver.get(self.url)
+                with self.__phase_timer.phase("dom_wait"):
+                    is_dom_complete = self.__wait_for_completion(driver, load_start)
             except exceptions.TimeoutException:
-                self.__send_log("domComplete event didn't occur within the time limit")
+                is_timed_out = True
+                self.__send_log("{} event didn't occur within the time limit".format(self.completion_event))
             except Exception as e:
                 self.__send_log("Error occurred while trying to load page: {}".format(e))
             finally:
-                all_metrics = []
-                # Whole DOM metric
-                web_metrics = self.__get_page_metrics(driver, is_dom_complete)
-                all_metrics.append(web_metrics)
-                # Resource metrics
-                resources = driver.execute_script("return window.performance.getEntriesByType('resource')")
-                for r in resources:
-                    resource_metric = self.__get_resource_metrics(driver, r)
-                    if resource_metric:
-                        all_metrics.append(resource_metric)
-
-                if all_metrics:
-                    for metric in all_metrics:
-                        self.__send_metrics(metric)
-                    self.__create_and_send_supervision_metric(len(all_metrics))
-                    self.__send_log("Sending {} metrics documents".format(len(all_metrics)))
-                driver.quit()
+                shipper = self.metrics_shipper
+                if shipper is None:
+                    shipper = BulkShipper(self.logzio_listener, self.metrics_token,
+                                          compression_level=self.compression_level)
+                try:
+                    all_metrics = []
+                    # the collection phase includes the status_code phase
+                    with self.__phase_timer.phase("collection"):
+                        snapshot = driver.execute_script(self.PERFORMANCE_SNAPSHOT_SCRIPT)
+                        # Whole DOM metric
+                        web_metrics = self.__get_page_metrics(driver, snapshot, is_dom_complete)
+                        all_metrics.append(web_metrics)
+                        if is_timed_out:
+                            self.__record_load_time((time.monotonic() - load_start) * 1000)
+                        elif "time_to_complete.ms" in web_metrics.get("metrics", {}):
+                            self.__record_load_time(web_metrics["metrics"]["time_to_complete.ms"])
+                        # Resource metrics
+                        resources = snapshot["resources"]
+                        if self.resource_metrics == self.RESOURCE_METRICS_AGGREGATE:
+                            all_metrics.extend(self.__get_aggregated_resource_metrics(snapshot))
+                            resources = get_slowest_resources(resources, self.top_slowest_resources)
+                        for r in resources:
+                            resource_metric = self.__get_resource_metrics(snapshot, r)
+                            if resource_metric:
+                                all_metrics.append(resource_metric)
+
+                    if all_metrics:
+                        with self.__phase_timer.phase("serialization"):
+                            lines = [serialize_document(metric) for metric in all_metrics]
+                        with self.__phase_timer.phase("send"):
+                            for line in lines:
+                                self.__send_line(shipper, line)
+                            self.__create_and_send_supervision_metric(shipper, len(all_metrics))
+                            # a shared metrics shipper is flushed by its owner, after all the checks are done
+                            if shipper is not self.metrics_shipper:
+                                self.__flush_metrics(shipper)
+                        self.__send_log("Sending {} metrics documents".format(len(all_metrics)))
+                finally:
+                    memory_peaks = memory_sampler.stop()
+                    python_peak_mb = get_peak_rss_mb()
+                    if python_peak_mb is not None:
+                        memory_peaks["python_peak_rss.mb"] = python_peak_mb
+                    with self.__phase_timer.phase("driver_release"):
+                        self.__release_driver(driver, self.__is_above_memory_threshold(memory_peaks))
+                    self.__create_and_send_self_metric(shipper, memory_peaks)
+                    if shipper is not self.metrics_shipper:
+                        self.__flush_metrics(shipper)
 
     # __validate_input validates the user input with the input_validator module
     def __validate_input(self):
-        input_validator.is_valid_url(self.url)
         input_validator.is_valid_logzio_token(self.logs_token)
         input_validator.is_valid_logzio_token(self.metrics_token)
         input_validator.is_valid_logzio_region_code(self.logzio_region_code)
         input_validator.is_supported_system(self.system)
         input_validator.is_valid_system_region(self.system, self.region)
         input_validator.is_valid_function_name(self.function_name)
+        input_validator.is_valid_compression_level(self.compression_level)
+        input_validator.is_valid_status_code_mode(self.status_code_mode)
+        input_validator.is_valid_completion_event(self.completion_event)
+        input_validator.is_valid_resource_metrics_mode(self.resource_metrics)
+        input_validator.is_valid_top_slowest_resources(self.top_slowest_resources)
+        return self.__validate_url_input()
+
+    # __validate_url_input validates the url and its own settings with the input_validator module
+    def __validate_url_input(self):
+        input_validator.is_valid_url(self.url)
+        input_validator.is_valid_url_patterns(self.block)
+        input_validator.is_valid_blocked_resource_types(self.block_resource_types)
+        input_validator.is_valid_allow_hosts(self.allow_hosts)
+        input_validator.is_valid_max_dom_complete(self.max_dom_complete)
+        input_validator.is_valid_memory_threshold(self.memory_threshold_mb)
         return True
 
-    # __get_driver sets up the headless chrome web driver
+    # __wait_for_completion waits in a single async script for the completion event of the page, until max_dom_complete
+    # seconds passed since the page load started
+    def __wait_for_completion(self, driver, load_start):
+        remaining = self.max_dom_complete - (time.monotonic() - load_start)
+        if remaining <= 0:
+            raise exceptions.TimeoutException("The page load took all of the {} seconds".format(self.max_dom_complete))
+        driver.set_script_timeout(remaining)
+        return driver.execute_async_script(self.WAIT_FOR_COMPLETION_SCRIPT, self.completion_event,
+                                           self.NETWORK_IDLE_MS) is True
+
+    # __record_load_time adds the page's load time to the load time history, if it was given
+    def __record_load_time(self, load_time_ms):
+        if self.load_time_history is not None:
+            self.load_time_history.add(self.url, load_time_ms)
+
+    # __block_requests makes the browser block the requests of the blocked url patterns and resource types
+    def __block_requests(self, driver):
+        patterns = get_blocked_url_patterns(self.block, self.block_resource_types, self.url)
+        if patterns:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+
+    # __get_launch_arguments returns the chrome arguments the check's browser should be launched with. With allowed
+    # hosts, the browser can only reach them and the url's own host
+    def __get_launch_arguments(self):
+        if not self.allow_hosts:
+            return ()
+        return get_allow_hosts_arguments(self.allow_hosts + [urlsplit(self.url).hostname])
+
+    # __get_driver sets up the headless chrome web driver, or takes one from the browser pool if it was given
     def __get_driver(self):
         try:
-            desired_capabilities = DesiredCapabilities.CHROME
-            desired_capabilities['goog:loggingPrefs'] = {'browser': 'ALL', 'performance': 'ALL'}
-            options = webdriver.ChromeOptions()
-            lambda_options = [
-                '--autoplay-policy=user-gesture-required',
-                '--disable-background-networking',
-                '--disable-background-timer-throttling',
-                '--disable-backgrounding-occluded-windows',
-                '--disable-breakpad',
-                '--disable-client-side-phishing-detection',
-                '--disable-component-update',
-                '--disable-default-apps',
-                '--disable-dev-shm-usage',
-                '--disable-domain-reliability',
-                '--disable-extensions',
-                '--disable-features=AudioServiceOutOfProcess',
-                '--disable-hang-monitor',
-                '--disable-ipc-flooding-protection',
-                '--disable-notifications',
-                '--disable-offer-store-unmasked-wallet-cards',
-                '--disable-popup-blocking',
-                '--disable-print-preview',
-                '--disable-prompt-on-repost',
-                '--disable-renderer-backgrounding',
-                '--disable-setuid-sandbox',
-                '--disable-speech-api',
-                '--disable-sync',
-                '--disk-cache-size=33554432',
-                '--hide-scrollbars',
-                '--ignore-gpu-blacklist',
-                '--ignore-certificate-errors',
-                '--metrics-recording-only',
-                '--mute-audio',
-                '--no-default-browser-check',
-                '--no-first-run',
-                '--no-pings',
-                '--no-sandbox',
-                '--no-zygote',
-                '--password-store=basic',
-                '--use-gl=swiftshader',
-                '--use-mock-keychain',
-                '--single-process',
-                '--headless']
-            for argument in lambda_options:
-                options.add_argument(argument)
-            if self.system != "none":
-                options.binary_location = self.__get_chrome_binary_by_system()
-            driver = webdriver.Chrome(desired_capabilities=desired_capabilities, options=options)
-            return driver
+            if self.browser_pool is not None:
+                return self.browser_pool.acquire(launch_arguments=self.__get_launch_arguments())
+            return create_chrome_driver(self.system, self.status_code_mode, self.__get_launch_arguments())
         except exceptions.WebDriverException as e:
             self.__send_log("Error creating web driver. {}".format(e))
             return {}
 
-    # __send_log sends log to your logz.io account
+    # __create_memory_sampler creates a sampler of the resident memory of the driver's processes, and of all the
+    # processes of the function together. The python process's peak is kept by the kernel, so it isn't sampled
+    def __create_memory_sampler(self, driver):
+        pid = os.getpid()
+        return PeakMemorySampler({"chrome_peak_rss.mb": lambda: get_driver_memory_mb(driver),
+                                  "total_peak_rss.mb": lambda: get_process_tree_rss_mb(pid)})
+
+    # __is_above_memory_threshold checks if the peak memory of all the function's processes went above the memory
+    # threshold during the check
+    def __is_above_memory_threshold(self, memory_peaks):
+        total_mb = memory_peaks.get("total_peak_rss.mb")
+        if self.memory_threshold_mb is None or total_mb is None or total_mb <= self.memory_threshold_mb:
+            return False
+        self.__send_log("Memory use of {:.0f} MB is above the threshold of {} MB, recycling the browser".format(
+            total_mb, self.memory_threshold_mb))
+        return True
+
+    # __release_driver returns the driver to the browser pool, or quits it if the monitor created it.
+    # With recycle, the pool closes the driver instead of reusing it
+    def __release_driver(self, driver, recycle=False):
+        if self.browser_pool is not None:
+            self.browser_pool.release(driver, recycle=recycle)
+        else:
+            driver.quit()
+
+    # __send_log sends log to your logz.io account, with the shared logs shipper if it was given, otherwise right away
     def __send_log(self, message):
         timestamp = self.__format_timestamp(datetime.datetime.now(tz=datetime.timezone.utc))
         log = {"@timestamp": timestamp, "message": message, "type": "synthetic-monitoring",
                "lambda_function": self.function_name, "region": self.region,
                "url": self.url}
-        self.__send_data(json.dumps(log), is_metrics=False)
+        try:
+            if self.logs_shipper is not None:
+                if not self.logs_shipper.add(log):
+                    print("Could not send log to the listener: {}".format(message))
+                return
+            response = post_data(self.logzio_listener, self.logs_token, json.dumps(log), self.compression_level)
+            if not response.ok:
+                print("Listener rejected log with status code {}: {}".format(response.status_code, message))
+        except Exception as e:
+            print("Error occurred while trying to send log: {}".format(e))
 
-    # __send_metrics sends metrics to your logz.io account
-    def __send_metrics(self, metrics):
+    # __send_metrics adds metrics to the shipper, which sends them to your logz.io account in bulks
+    def __send_metrics(self, shipper, metrics):
         try:
-            self.__send_data(json.dumps(metrics))
+            if not shipper.add(metrics):
+                self.__send_log("Could not send metrics to the listener")
         except Exception as e:
             self.__send_log("Error occurred while trying to send metrics. {}".format(e))
 
-    # __send_data sends over HTTPS either a log or a metric to your logz.io account,
-    # based on the token & is_metrics flag
-    def __send_data(self, data, is_metrics=True):
+    # __send_line adds an already serialized metrics document to the shipper
+    def __send_line(self, shipper, line):
         try:
-            token = self.metrics_token if is_metrics else self.logs_token
-            url = "{}/?token={}".format(self.logzio_listener, token)
-            response = requests.post(url, data=data)
-            if not response.ok:
-                # TODO
-                pass
+            if not shipper.add_line(line):
+                self.__send_log("Could not send metrics to the listener")
         except Exception as e:
-            # TODO
-            pass
+            self.__send_log("Error occurred while trying to send metrics. {}".format(e))
 
-    # __get_page_metrics creates the web page metric
-    def __get_page_metrics(self, driver, is_dom_complete):
+    # __flush_metrics sends the metrics that are left in the shipper's bulk to your logz.io account
+    def __flush_metrics(self, shipper):
         try:
-            js_script_timestamp = "return window.performance.timing.navigationStart"
-            timestamp = datetime.datetime.fromtimestamp(
-                self.__ms_to_seconds(driver.execute_script(js_script_timestamp)),
-                tz=datetime.timezone.utc)
-            data = {"@timestamp": self.__format_timestamp(timestamp),
+            if not shipper.flush():
+                self.__send_log("Listener rejected a bulk of metrics")
+        except Exception as e:
+            self.__send_log("Error occurred while trying to send metrics. {}".format(e))
+
+    # __get_page_metrics creates the web page metric from the page's performance snapshot
+    def __get_page_metrics(self, driver, snapshot, is_dom_complete):
+        try:
+            data = {"@timestamp": self.__get_snapshot_timestamp(snapshot),
                     "type": "synthetic-monitoring",
-                    "metrics": self.__create_metrics(driver, is_dom_complete)}
-            dimensions = {"country": self.__get_country_code(), "region": self.region, "url": self.url}
-            data["dimensions"] = dimensions
+                    "metrics": self.__create_metrics(driver, snapshot, is_dom_complete)}
+            data["dimensions"] = self.__get_dimensions()
             return data
         except Exception as e:
             self.__send_log("Error occurred while getting page metrics: {}".format(e))
             return {}
 
-    # __get_resource_metrics creates the resource metrics
-    def __get_resource_metrics(self, driver, resource):
+    # __get_resource_metrics creates the resource metrics from a resource entry of the page's performance snapshot
+    def __get_resource_metrics(self, snapshot, resource):
         try:
-            js_script_timestamp = "return window.performance.timing.navigationStart"
-            timestamp = datetime.datetime.fromtimestamp(
-                self.__ms_to_seconds(driver.execute_script(js_script_timestamp)),
-                tz=datetime.timezone.utc)
-            data = {"@timestamp": self.__format_timestamp(timestamp),
+            data = {"@timestamp": self.__get_snapshot_timestamp(snapshot),
                     "type": "synthetic-monitoring",
                     "metrics": self.__create_resource_metrics(resource)}
-            dimensions = {"country": self.__get_country_code(), "region": self.region, "url": self.url,
-                          "resource_name": resource["name"], "resource_type": resource['initiatorType']}
+            dimensions = dict(self.__get_dimensions())
+            dimensions["resource_name"] = resource["name"]
+            dimensions["resource_type"] = resource['initiatorType']
             data["dimensions"] = dimensions
             return data
         except Exception as e:
             self.__send_log("Error occurred while getting resource metrics: {}".format(e))
             return {}
 
-    # __create_metrics gets data from the web driver's Timing API and calculates the metrics values for the page metric
-    def __create_metrics(self, driver, is_dom_complete):
+    # __get_aggregated_resource_metrics creates a summary metric for every resource type (initiatorType) and every
+    # origin of the page's resources
+    def __get_aggregated_resource_metrics(self, snapshot):
+        try:
+            timestamp = self.__get_snapshot_timestamp(snapshot)
+            groupings = [("resource_type", lambda resource: resource["initiatorType"]),
+                         ("resource_origin", get_resource_origin)]
+            all_metrics = []
+            for dimension, key in groupings:
+                for group, summary in summarize_resources(snapshot["resources"], key).items():
+                    dimensions = dict(self.__get_dimensions())
+                    dimensions[dimension] = group
+                    all_metrics.append({"@timestamp": timestamp,
+                                        "type": "synthetic-monitoring",
+                                        "metrics": summary,
+                                        "dimensions": dimensions})
+            return all_metrics
+        except Exception as e:
+            self.__send_log("Error occurred while aggregating resource metrics: {}".format(e))
+            return []
+
+    # __create_metrics calculates the metrics values for the page metric from the Timing API values of the snapshot
+    def __create_metrics(self, driver, snapshot, is_dom_complete):
         try:
             metrics = {}
-            navigation_start = driver.execute_script("return window.performance.timing.navigationStart")
-            request_start = driver.execute_script("return window.performance.timing.requestStart")
-            response_start = driver.execute_script("return window.performance.timing.responseStart")
+            navigation_start = snapshot["navigationStart"]
+            request_start = snapshot["requestStart"]
+            response_start = snapshot["responseStart"]
+            # when waiting for DOMContentLoaded only, the DOM may still be loading when the page is considered loaded
+            is_dom_complete = is_dom_complete and snapshot["domComplete"] > 0
             if is_dom_complete:
-                dom_complete = driver.execute_script("return window.performance.timing.domComplete")
-                metrics["time_to_complete.ms"] = dom_complete - navigation_start
+                metrics["time_to_complete.ms"] = snapshot["domComplete"] - navigation_start
             metrics["time_to_first_byte.ms"] = response_start - request_start
             metrics["dom_is_complete"] = 1 if is_dom_complete else 0
-            status_code = self.__get_page_status_code(driver)
+            with self.__phase_timer.phase("status_code"):
+                response = self.__get_page_response(driver)
+            status_code = response.get("status")
             if status_code:
                 metrics["status_code"] = status_code
                 if 200 <= status_code < 300:
@@ -245,8 +397,9 @@ class LightsMonitor(object):
                 elif 400 <= status_code < 600:
                     metrics["up"] = self.FAILURE
                     self.__send_log(
-                        "Page {} returned status code {} for region {}".format(driver.current_url, status_code,
-                                                                               self.region))
+                        "Page {} returned status code {} for region {}{}".format(driver.current_url, status_code,
+                                                                                 self.region,
+                                                                                 self.__format_response(response)))
             return metrics
         except Exception as e:
             self.__send_log("Error creating page's metrics. {}".format(e))
@@ -266,6 +419,8 @@ class LightsMonitor(object):
 
     # __get_country_code converts the system's region to the matching country code, to appear in the metrics
     def __get_country_code(self):
+        if self.config is not None:
+            return self.config.country_code
         try:
             country_code = get_country_code_by_region_and_system(self.system, self.region)
             return country_code
@@ -273,16 +428,42 @@ class LightsMonitor(object):
             self.__send_log("{} region is not supported").format(self.region)
             pass
 
-    # __get_page_status_code gets the page's status code (e.g. 200, 404, 500...)
-    def __get_page_status_code(self, driver):
+    # __get_page_response gets the page's status code (e.g. 200, 404, 500...) from the performance logs.
+    # In network status code mode, a few more fields of the main document's response are returned with it
+    def __get_page_response(self, driver):
         try:
             performance_logs = driver.get_log('performance')
-            status_code = self.__get_status(performance_logs)
-            return int(status_code)
+            if self.status_code_mode == STATUS_CODE_MODE_NETWORK:
+                return self.__get_document_response(performance_logs)
+            return {"status": int(self.__get_status(performance_logs))}
         except Exception as e:
             self.__send_log("Error occurred while getting performance logs: {}".format(e))
             return {}
 
+    # __get_document_response finds the response of the main document in the network events of the logs.
+    # Only the Network.responseReceived events of documents are parsed, the rest of the entries are skipped
+    def __get_document_response(self, logs):
+        for log in logs:
+            message = log['message']
+            if not message or '"Network.responseReceived"' not in message or '"Document"' not in message:
+                continue
+            params = json.loads(message)['message']['params']
+            if params.get('type') == 'Document':
+                response = params['response']
+                return {"status": int(response['status']),
+                        "protocol": response.get('protocol'),
+                        "remote_ip_address": response.get('remoteIPAddress'),
+                        "mime_type": response.get('mimeType')}
+        return {}
+
+    # __format_response formats the response fields that were found in addition to the status code, for logging
+    def __format_response(self, response):
+        fields = ["{}: {}".format(key, value) for key, value in response.items()
+                  if key != "status" and value is not None]
+        if not fields:
+            return ""
+        return " ({})".format(", ".join(fields))
+
     # __get_status extracts the page status code from its logs
     def __get_status(self, logs):
         for log in logs:
@@ -299,22 +480,48 @@ class LightsMonitor(object):
 
     # __create_and_send_supervision_metric creates a metric with the number of metrics that were sent, and sends it to
     # your logz.io account
-    def __create_and_send_supervision_metric(self, num_metrics):
+    def __create_and_send_supervision_metric(self, shipper, num_metrics):
         try:
             timestamp = self.__format_timestamp(datetime.datetime.now(tz=datetime.timezone.utc))
             data = {"@timestamp": timestamp,
                     "type": "synthetic-monitoring",
                     "metrics": {"metrics_sent": num_metrics}}
-            dimensions = {"country": self.__get_country_code(), "region": self.region, "url": self.url}
-            data["dimensions"] = dimensions
-            self.__send_metrics(data)
+            data["dimensions"] = self.__get_dimensions()
+            self.__send_metrics(shipper, data)
         except Exception as e:
             self.__send_log("Error occured while creating supervision metric:\n{}".format(e))
 
-    # __get_chrome_binary_by_system returns the path to the web driver binary, according to the system that's being used
-    def __get_chrome_binary_by_system(self):
-        if self.system == "aws":
-            return "/opt/bin/chromium"
+    # __create_and_send_self_metric creates a metric with the time (in ms) of every phase of the check and the peak
+    # memory (in MB) during the check, and sends it to your logz.io account
+    def __create_and_send_self_metric(self, shipper, memory_peaks):
+        try:
+            timestamp = self.__format_timestamp(datetime.datetime.now(tz=datetime.timezone.utc))
+            metrics = self.__phase_timer.get_metrics()
+            metrics.update(memory_peaks)
+            data = {"@timestamp": timestamp,
+                    "type": SELF_METRICS_TYPE,
+                    "metrics": metrics}
+            data["dimensions"] = self.__get_dimensions()
+            self.__send_metrics(shipper, data)
+        except Exception as e:
+            self.__send_log("Error occurred while creating self metric:\n{}".format(e))
+
+    # __get_dimensions returns the dimensions that all the documents of the check have. They are created once, and
+    # documents with more dimensions copy them
+    def __get_dimensions(self):
+        if self.__dimensions is None:
+            self.__dimensions = {"country": self.__get_country_code(), "region": self.region, "url": self.url}
+        return self.__dimensions
+
+    # __get_snapshot_timestamp returns the snapshot's navigation start as a formatted timestamp. It's formatted once
+    # for all the documents of the snapshot
+    def __get_snapshot_timestamp(self, snapshot):
+        navigation_start = snapshot["navigationStart"]
+        if self.__snapshot_timestamp is None or self.__snapshot_timestamp[0] != navigation_start:
+            timestamp = datetime.datetime.fromtimestamp(self.__ms_to_seconds(navigation_start),
+                                                        tz=datetime.timezone.utc)
+            self.__snapshot_timestamp = (navigation_start, self.__format_timestamp(timestamp))
+        return self.__snapshot_timestamp[1]
 
     # __format_timestamp formats a timestamp to logz.io's acceptable timestamp format 'yyyy-MM-ddTHH:mm:ss.SSSZ'
     def __format_timestamp(self, timestamp):
@@ -0,0 +1,48 @@
+"""
+This module is for keeping the recent load times of every url, and deriving the url's page timeout from them
+"""
+
+import collections
+import threading
+import sys
+sys.path.append(".")
+from resource_stats import percentile
+
+MAX_SAMPLES = 50
+MIN_SAMPLES = 5
+TIMEOUT_PERCENTILE = 99
+TIMEOUT_FACTOR = 2.0
+MIN_TIMEOUT_SECONDS = 1.0
+MAX_TIMEOUT_SECONDS = 30.0
+
+
+class LoadTimeHistory(object):
+    """
+    The last max_samples load times (in ms) of every url. A check that timed out is recorded with the time it waited,
+    so the timeout of a url that keeps timing out grows with every run until it reaches the max timeout
+    """
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.__samples = {}
+        self.__lock = threading.Lock()
+
+    # add records a load time of the url
+    def add(self, url, load_time_ms):
+        with self.__lock:
+            samples = self.__samples.get(url)
+            if samples is None:
+                samples = collections.deque(maxlen=self.max_samples)
+                self.__samples[url] = samples
+            samples.append(load_time_ms)
+
+    # get_timeout returns the url's p99 load time multiplied by factor (in seconds), between min_timeout and
+    # max_timeout. Returns default_timeout until min_samples load times of the url were recorded
+    def get_timeout(self, url, default_timeout, factor=TIMEOUT_FACTOR, min_timeout=MIN_TIMEOUT_SECONDS,
+                    max_timeout=MAX_TIMEOUT_SECONDS, min_samples=MIN_SAMPLES):
+        with self.__lock:
+            samples = sorted(self.__samples.get(url, []))
+        if len(samples) < min_samples:
+            return default_timeout
+        timeout = percentile(samples, TIMEOUT_PERCENTILE) * factor / 1000
+        return min(max_timeout, max(min_timeout, timeout))
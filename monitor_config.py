@@ -0,0 +1,134 @@
+"""
+This module is for the monitoring settings that are shared by all the checks of a container
+"""
+
+from dataclasses import dataclass
+import threading
+import sys
+sys.path.append(".")
+import input_validator
+from browser_pool import STATUS_CODE_MODE_FULL
+from lights import LightsMonitor
+from shipper import get_listener_url
+from sys_region_adapter import get_country_code_by_region_and_system
+
+# the environment variables the config is parsed from
+CONFIG_VARIABLES = ("LOGZIO_LOGS_TOKEN", "LOGZIO_METRICS_TOKEN", "LOGZIO_REGION", "LOGZIO_CUSTOM_LISTENER",
+                    "AWS_REGION", "AWS_LAMBDA_FUNCTION_NAME", "SYSTEM", "GZIP_COMPRESSION_LEVEL", "STATUS_CODE_MODE",
+                    "COMPLETION_EVENT", "RESOURCE_METRICS", "TOP_SLOWEST_RESOURCES")
+
+_cached_config = None
+_cached_variables = None
+_cache_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class MonitorConfig(object):
+    """
+    The validated settings that are shared by all the checks. A config can't be changed after it was created, and the
+    checks that are created with it skip the validation of its settings
+    """
+    __slots__ = ("logs_token", "metrics_token", "logzio_region_code", "logzio_listener", "region", "function_name",
+                 "system", "country_code", "compression_level", "status_code_mode", "completion_event",
+                 "resource_metrics", "top_slowest_resources")
+
+    logs_token: str
+    metrics_token: str
+    logzio_region_code: str
+    # the listener's url, after the region code was resolved
+    logzio_listener: str
+    region: str
+    function_name: str
+    system: str
+    country_code: str
+    compression_level: int
+    status_code_mode: str
+    completion_event: str
+    resource_metrics: str
+    top_slowest_resources: int
+
+    # get_monitor_args returns the arguments of a check (LightsMonitor or HttpProbe) with the config's settings
+    def get_monitor_args(self):
+        return {"logs_token": self.logs_token,
+                "metrics_token": self.metrics_token,
+                "logzio_region_code": self.logzio_region_code,
+                "logzio_listener": self.logzio_listener,
+                "region": self.region,
+                "function_name": self.function_name,
+                "system": self.system,
+                "compression_level": self.compression_level,
+                "config": self}
+
+    # get_browser_args returns the arguments of a browser check (LightsMonitor) with the config's settings
+    def get_browser_args(self):
+        return {"status_code_mode": self.status_code_mode,
+                "completion_event": self.completion_event,
+                "resource_metrics": self.resource_metrics,
+                "top_slowest_resources": self.top_slowest_resources}
+
+
+# create_monitor_config validates the settings and creates a config with them. Raises ValueError or TypeError for
+# invalid settings
+def create_monitor_config(logs_token, metrics_token, logzio_region_code, logzio_listener, region, function_name,
+                          system, compression_level=None, status_code_mode=STATUS_CODE_MODE_FULL,
+                          completion_event=LightsMonitor.COMPLETION_EVENT_LOAD,
+                          resource_metrics=LightsMonitor.RESOURCE_METRICS_ALL,
+                          top_slowest_resources=LightsMonitor.TOP_SLOWEST_RESOURCES):
+    input_validator.is_valid_logzio_token(logs_token)
+    input_validator.is_valid_logzio_token(metrics_token)
+    input_validator.is_valid_logzio_region_code(logzio_region_code)
+    input_validator.is_supported_system(system)
+    input_validator.is_valid_system_region(system, region)
+    input_validator.is_valid_function_name(function_name)
+    input_validator.is_valid_compression_level(compression_level)
+    input_validator.is_valid_status_code_mode(status_code_mode)
+    input_validator.is_valid_completion_event(completion_event)
+    input_validator.is_valid_resource_metrics_mode(resource_metrics)
+    input_validator.is_valid_top_slowest_resources(top_slowest_resources)
+    return MonitorConfig(logs_token=logs_token,
+                         metrics_token=metrics_token,
+                         logzio_region_code=logzio_region_code,
+                         logzio_listener=get_listener_url(logzio_region_code, logzio_listener),
+                         region=region,
+                         function_name=function_name,
+                         system=system,
+                         country_code=get_country_code_by_region_and_system(system, region),
+                         compression_level=compression_level,
+                         status_code_mode=status_code_mode,
+                         completion_event=completion_event,
+                         resource_metrics=resource_metrics,
+                         top_slowest_resources=top_slowest_resources)
+
+
+# get_monitor_config returns the config of the environment's settings. The config is parsed and validated once per
+# container, and parsed again only if the settings changed
+def get_monitor_config(environ):
+    global _cached_config, _cached_variables
+    variables = tuple(environ.get(name) for name in CONFIG_VARIABLES)
+    with _cache_lock:
+        if _cached_config is not None and _cached_variables == variables:
+            return _cached_config
+    config = parse_monitor_config(environ)
+    with _cache_lock:
+        _cached_config = config
+        _cached_variables = variables
+    return config
+
+
+# parse_monitor_config parses the settings from the environment variables and creates a config with them
+def parse_monitor_config(environ):
+    compression_level = environ.get("GZIP_COMPRESSION_LEVEL")
+    return create_monitor_config(logs_token=environ.get("LOGZIO_LOGS_TOKEN"),
+                                 metrics_token=environ.get("LOGZIO_METRICS_TOKEN"),
+                                 logzio_region_code=environ.get("LOGZIO_REGION", ""),
+                                 logzio_listener=environ.get("LOGZIO_CUSTOM_LISTENER", ""),
+                                 region=environ.get("AWS_REGION"),
+                                 function_name=environ.get("AWS_LAMBDA_FUNCTION_NAME"),
+                                 system=environ.get("SYSTEM", "aws"),
+                                 compression_level=int(compression_level) if compression_level else None,
+                                 status_code_mode=environ.get("STATUS_CODE_MODE", STATUS_CODE_MODE_FULL),
+                                 completion_event=environ.get("COMPLETION_EVENT",
+                                                              LightsMonitor.COMPLETION_EVENT_LOAD),
+                                 resource_metrics=environ.get("RESOURCE_METRICS", LightsMonitor.RESOURCE_METRICS_ALL),
+                                 top_slowest_resources=int(environ.get("TOP_SLOWEST_RESOURCES",
+                                                                       LightsMonitor.TOP_SLOWEST_RESOURCES)))
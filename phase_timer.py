@@ -0,0 +1,41 @@
+"""
+This module is for timing the phases of a check or a run, to find where its time went
+"""
+
+import contextlib
+import threading
+import time
+
+SELF_METRICS_TYPE = "synthetic-monitoring-self"
+
+
+class PhaseTimer(object):
+    """
+    Records the duration of named phases, in ms. A phase that runs more than once adds up, and phases may be nested
+    """
+
+    def __init__(self):
+        self.__start = time.perf_counter()
+        self.__phases = {}
+        self.__lock = threading.Lock()
+
+    # phase times the code in its with block as the named phase
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    # add adds a duration (in ms) to the named phase
+    def add(self, name, duration_ms):
+        with self.__lock:
+            self.__phases[name] = self.__phases.get(name, 0) + duration_ms
+
+    # get_metrics returns the durations of the phases, and the total time since the timer was created
+    def get_metrics(self):
+        with self.__lock:
+            metrics = {"{}.ms".format(name): duration_ms for name, duration_ms in self.__phases.items()}
+        metrics["total.ms"] = (time.perf_counter() - self.__start) * 1000
+        return metrics
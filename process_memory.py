@@ -0,0 +1,164 @@
+"""
+This module is for measuring the memory usage of processes, based on the /proc filesystem
+"""
+
+import os
+import threading
+
+PROC_DIR = "/proc"
+# the processes' memory is sampled coarsely, a sample reads a few files of every process of the tree
+SAMPLE_INTERVAL_SECONDS = 0.5
+
+
+# get_process_tree_rss_mb returns the resident memory (in MB) of a process and all of its descendants,
+# or None if it can't be measured on this system
+def get_process_tree_rss_mb(pid):
+    if pid is None or not os.path.isdir(os.path.join(PROC_DIR, str(pid))):
+        return None
+    total_kb = 0
+    for tree_pid in get_process_tree(pid):
+        rss_kb = get_process_rss_kb(tree_pid)
+        if rss_kb is not None:
+            total_kb += rss_kb
+    return total_kb / 1024
+
+
+# get_process_rss_mb returns the resident memory (in MB) of a single process, without its descendants, or None if it
+# can't be measured on this system
+def get_process_rss_mb(pid):
+    rss_kb = get_process_rss_kb(pid)
+    return None if rss_kb is None else rss_kb / 1024
+
+
+# get_peak_rss_mb returns the peak resident memory (in MB) of the current process since it started, or None if it
+# can't be measured on this system. The kernel keeps the peak, so it doesn't have to be sampled. It's read from the
+# process's status, since getrusage's ru_maxrss may lag behind it
+def get_peak_rss_mb():
+    peak_kb = get_process_rss_kb(os.getpid(), "VmHWM:")
+    return None if peak_kb is None else peak_kb / 1024
+
+
+# get_process_tree returns the pid of a process and the pids of all of its descendants. The children of every process
+# are read from its children files, so only the processes of the tree are read. Kernels without children files fall
+# back to reading the parent of every process
+def get_process_tree(pid):
+    children_by_parent = None
+    tree = [pid]
+    index = 0
+    while index < len(tree):
+        children = _get_children(tree[index])
+        if children is None:
+            if children_by_parent is None:
+                children_by_parent = _get_children_by_parent()
+            children = children_by_parent.get(tree[index], [])
+        tree.extend(children)
+        index += 1
+    return tree
+
+
+# get_process_rss_kb returns the resident memory (in KB) of a single process, or None if it already exited. The field
+# may be VmHWM: for the process's peak resident memory
+def get_process_rss_kb(pid, field="VmRSS:"):
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), "status")) as status:
+            for line in status:
+                if line.startswith(field):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return 0
+
+
+class PeakMemorySampler(object):
+    """
+    Samples memory measurements in the background, from start() until stop(), and keeps the peak (in MB) of every
+    measurement. measurements maps a name to a function that returns MB, or None when it can't measure
+    """
+
+    def __init__(self, measurements, interval=SAMPLE_INTERVAL_SECONDS):
+        self.measurements = measurements
+        self.interval = interval
+        self.peaks_mb = {}
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    # start samples the measurements once, and keeps sampling them in the background
+    def start(self):
+        self.__sample()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+        return self
+
+    # stop samples the measurements a last time and stops the sampling. Returns the peaks
+    def stop(self):
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+        self.__sample()
+        return self.peaks_mb
+
+    # __run samples the measurements until the sampler is stopped
+    def __run(self):
+        while not self.__stopped.wait(self.interval):
+            self.__sample()
+
+    # __sample takes a sample of every measurement and updates its peak
+    def __sample(self):
+        for name, measure in self.measurements.items():
+            try:
+                memory_mb = measure()
+            except Exception:
+                memory_mb = None
+            if memory_mb is not None:
+                self.peaks_mb[name] = max(self.peaks_mb.get(name, 0), memory_mb)
+
+
+# _get_children reads the children of a process from the children files of its threads. Returns None if the kernel
+# doesn't have children files, and an empty list if the process already exited
+def _get_children(pid):
+    task_dir = os.path.join(PROC_DIR, str(pid), "task")
+    try:
+        threads = os.listdir(task_dir)
+    except OSError:
+        return []
+    children = []
+    for thread in threads:
+        try:
+            with open(os.path.join(task_dir, thread, "children")) as children_file:
+                children.extend(int(child) for child in children_file.read().split())
+        except FileNotFoundError:
+            if not os.path.isdir(os.path.join(task_dir, thread)):
+                continue
+            return None
+        except (OSError, ValueError):
+            continue
+    return children
+
+
+# _get_children_by_parent maps the pid of every process to the pids of its children
+def _get_children_by_parent():
+    children_by_parent = {}
+    for entry in os.listdir(PROC_DIR):
+        if not entry.isdigit():
+            continue
+        parent = _get_parent_pid(entry)
+        if parent is not None:
+            children_by_parent.setdefault(parent, []).append(int(entry))
+    return children_by_parent
+
+
+# _get_parent_pid reads the parent pid of a process from its stat file
+def _get_parent_pid(pid):
+    try:
+        with open(os.path.join(PROC_DIR, pid, "stat")) as stat:
+            # the process name is wrapped with parentheses and may contain spaces
+            fields = stat.read().rsplit(")", 1)[1].split()
+            return int(fields[1])
+    except (OSError, ValueError, IndexError):
+        return None
@@ -0,0 +1,56 @@
+"""
+This module is for summarizing the resource timings of a page into a few statistics per group of resources
+"""
+
+import math
+from urllib.parse import urlsplit
+
+PERCENTILES = [50, 90, 99]
+
+
+# get_resource_duration returns how much time (in ms) it took for a resource entry to load
+def get_resource_duration(resource):
+    return resource["responseEnd"] - resource["fetchStart"]
+
+
+# get_resource_origin returns the origin (scheme://host[:port]) of a resource's url. Urls without a host, like data:
+# urls, are grouped by their scheme
+def get_resource_origin(resource):
+    parsed = urlsplit(resource["name"])
+    if not parsed.netloc:
+        return "{}:".format(parsed.scheme)
+    return "{}://{}".format(parsed.scheme, parsed.netloc)
+
+
+# percentile returns the nearest-rank percentile of a sorted, non-empty list of values
+def percentile(sorted_values, percent):
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+# summarize_resources groups the resource entries by key(resource), and returns the summary of every group
+def summarize_resources(resources, key):
+    groups = {}
+    for resource in resources:
+        groups.setdefault(key(resource), []).append(resource)
+    return {group: summarize(group_resources) for group, group_resources in groups.items()}
+
+
+# summarize returns the count, the sum, percentiles and max of the durations, and the total and max transfer size
+# of resource entries. Resources from the cache or from other origins without Timing-Allow-Origin have a transfer
+# size of 0
+def summarize(resources):
+    durations = sorted(get_resource_duration(resource) for resource in resources)
+    transfer_sizes = [resource.get("transferSize") or 0 for resource in resources]
+    summary = {"count": len(durations), "time_to_complete_sum.ms": sum(durations)}
+    for percent in PERCENTILES:
+        summary["time_to_complete_p{}.ms".format(percent)] = percentile(durations, percent)
+    summary["time_to_complete_max.ms"] = durations[-1]
+    summary["transfer_size_sum.bytes"] = sum(transfer_sizes)
+    summary["transfer_size_max.bytes"] = max(transfer_sizes)
+    return summary
+
+
+# get_slowest_resources returns the n resource entries that took the longest to load, slowest first
+def get_slowest_resources(resources, n):
+    return sorted(resources, key=get_resource_duration, reverse=True)[:n]
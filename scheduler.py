@@ -0,0 +1,122 @@
+"""
+This module is for running url checks on a bounded number of worker threads, sized by the memory of the function
+"""
+
+import queue
+import threading
+import time
+import sys
+sys.path.append(".")
+import input_validator
+
+# memory kept for the python runtime, the rest is divided between the workers' browsers
+RESERVED_MEMORY_MB = 100
+MEMORY_PER_WORKER_MB = 200
+# time kept before the function's timeout, after the metrics were flushed
+SAFETY_MARGIN_SECONDS = 2
+
+
+# get_max_concurrency returns the number of checks that can run at once. An explicit max_concurrency wins,
+# otherwise it's the number of browsers that fit in the function's memory size
+def get_max_concurrency(memory_size_mb, max_concurrency=None):
+    if max_concurrency is not None:
+        input_validator.is_valid_max_concurrency(max_concurrency)
+        return max_concurrency
+    return max(1, (memory_size_mb - RESERVED_MEMORY_MB) // MEMORY_PER_WORKER_MB)
+
+
+# get_run_deadline returns the time.monotonic() deadline by which the checks of an invocation should end: the
+# function's remaining execution time, minus the reserved seconds (for flushing the metrics) and a safety margin.
+# If end_time (a time.time() by which the invocation should return, like a shard's end time) is given, the deadline
+# is before it too. Returns None if neither the context nor end_time limit the invocation
+def get_run_deadline(context, reserved_seconds=0, end_time=None):
+    try:
+        remaining = context.get_remaining_time_in_millis() / 1000
+    except AttributeError:
+        remaining = None
+    if end_time is not None:
+        remaining = end_time - time.time() if remaining is None else min(remaining, end_time - time.time())
+    if remaining is None:
+        return None
+    return time.monotonic() + remaining - reserved_seconds - SAFETY_MARGIN_SECONDS
+
+
+# get_remaining_seconds returns the seconds that are left until the deadline, or None if there is no deadline
+def get_remaining_seconds(deadline):
+    if deadline is None:
+        return None
+    return max(0, deadline - time.monotonic())
+
+
+class RunStats(object):
+    """
+    The state of a single scheduler run
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.errors = []
+        self.__lock = threading.Lock()
+
+    # add_result records the result of a single task
+    def add_result(self, error=None):
+        with self.__lock:
+            if error is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+                self.errors.append(error)
+
+    # add_skipped records a task that was not started
+    def add_skipped(self):
+        with self.__lock:
+            self.skipped += 1
+
+
+class WorkerScheduler(object):
+    """
+    Runs a task for every item of a work queue, with at most max_workers tasks running at once
+    """
+
+    def __init__(self, max_workers):
+        input_validator.is_valid_max_concurrency(max_workers)
+        self.max_workers = max_workers
+
+    # run runs task(item) for all items and waits for them to finish. Every run has its own queue, workers and stats,
+    # so nothing is left over for the next invocation of a warm container.
+    # With a deadline, an item is started only if its time budget (get_budget(item) seconds) ends before the
+    # deadline. Items that are not started are counted as skipped
+    def run(self, task, items, deadline=None, get_budget=None):
+        work_queue = queue.Queue()
+        for item in items:
+            work_queue.put(item)
+        stats = RunStats(work_queue.qsize())
+        workers = [threading.Thread(target=self.__work, args=(task, work_queue, stats, deadline, get_budget))
+                   for _ in range(min(self.max_workers, stats.total))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return stats
+
+    # __work takes items from the queue until it's empty
+    def __work(self, task, work_queue, stats, deadline, get_budget):
+        while True:
+            try:
+                item = work_queue.get_nowait()
+            except queue.Empty:
+                return
+            if deadline is not None:
+                budget = get_budget(item) if get_budget is not None else 0
+                if get_remaining_seconds(deadline) < budget:
+                    stats.add_skipped()
+                    continue
+            try:
+                task(item)
+                stats.add_result()
+            except Exception as e:
+                print("Error occurred while running task for {}: {}".format(item, e))
+                stats.add_result(e)
@@ -0,0 +1,152 @@
+"""
+This module is for splitting a large url list into shards, and checking every shard in its own function invocation
+"""
+
+import json
+import math
+import threading
+import time
+import zlib
+import sys
+sys.path.append(".")
+import input_validator
+from scheduler import SAFETY_MARGIN_SECONDS, WorkerScheduler
+
+MAX_PARALLEL_INVOCATIONS = 10
+# a worker may run for up to the function's timeout, which is at most 15 minutes
+MAX_FUNCTION_TIMEOUT_SECONDS = 900
+
+
+# get_shard returns the shard of a url. A url always lands in the same shard for the same number of shards, so every
+# url is checked by the same worker on every run
+def get_shard(url, shard_count):
+    return zlib.crc32(url.encode("utf-8")) % shard_count
+
+
+# split_into_shards splits the urls into shard_count lists, keeping the order of the urls in every shard
+def split_into_shards(urls, shard_count):
+    shards = [[] for _ in range(shard_count)]
+    for url in urls:
+        shards[get_shard(url, shard_count)].append(url)
+    return shards
+
+
+# create_shard_event creates the event of a worker invocation that checks the urls of a single shard. end_time is the
+# time.time() by which the worker should return
+def create_shard_event(index, count, urls, end_time=None):
+    shard = {"index": index, "count": count, "urls": urls}
+    if end_time is not None:
+        shard["end_time"] = end_time
+    return {"shard": shard}
+
+
+# get_shard_end_time returns the time.time() by which the workers should return, so the coordinator still has the
+# reserved seconds (for sending the stats of the shards) and a safety margin before its own timeout. The workers are
+# invocations of the same function, so they can't outlive the coordinator's deadline even if they start late.
+# Returns None if the context doesn't report the remaining time
+def get_shard_end_time(context, reserved_seconds=0):
+    try:
+        remaining_ms = context.get_remaining_time_in_millis()
+    except AttributeError:
+        return None
+    return time.time() + remaining_ms / 1000 - reserved_seconds - SAFETY_MARGIN_SECONDS
+
+
+# get_function_timeout returns the function's timeout in seconds. The coordinator starts at the beginning of its
+# invocation, so its remaining time is about the timeout of the function, and of its workers
+def get_function_timeout(context):
+    try:
+        return math.ceil(context.get_remaining_time_in_millis() / 1000)
+    except AttributeError:
+        return MAX_FUNCTION_TIMEOUT_SECONDS
+
+
+# create_lambda_client creates a lambda client that waits for a synchronous invocation for up to read_timeout seconds.
+# It never retries, since a retried invocation would check the shard again and send its metrics twice
+def create_lambda_client(read_timeout):
+    # boto3 is only needed by coordinators, so workers don't pay for its import
+    import boto3
+    from botocore.config import Config
+    return boto3.client("lambda", config=Config(read_timeout=read_timeout, retries={"max_attempts": 0}))
+
+
+class InProcessInvoker(object):
+    """
+    Invokes a handler in the current process. The event and the result are serialized like in a real invocation
+    """
+
+    def __init__(self, handler, context=None):
+        self.handler = handler
+        self.context = context
+
+    # invoke runs the handler with the event and returns its result
+    def invoke(self, event):
+        result = self.handler(json.loads(json.dumps(event)), self.context)
+        return json.loads(json.dumps(result))
+
+
+class LambdaInvoker(object):
+    """
+    Invokes a lambda function synchronously, and waits for its result for up to read_timeout seconds
+    """
+
+    def __init__(self, function_name, client=None, read_timeout=MAX_FUNCTION_TIMEOUT_SECONDS):
+        self.function_name = function_name
+        self.client = client if client is not None else create_lambda_client(read_timeout)
+
+    # invoke invokes the function with the event and returns its result. Raises RuntimeError if the function failed
+    def invoke(self, event):
+        response = self.client.invoke(FunctionName=self.function_name,
+                                      InvocationType="RequestResponse",
+                                      Payload=json.dumps(event).encode("utf-8"))
+        payload = response["Payload"].read()
+        if response.get("FunctionError"):
+            raise RuntimeError("Invocation of {} failed: {}".format(self.function_name, payload.decode("utf-8")))
+        return json.loads(payload) if payload else None
+
+
+class ShardCoordinator(object):
+    """
+    Splits a url list into shard_count shards, invokes a worker for every shard through the invoker, with at most
+    max_parallel invocations at once, and collects the completion stats of every shard.
+    The workers get the end_time (a time.time()) by which they should return, so shards that start late end in time
+    """
+
+    def __init__(self, invoker, shard_count, max_parallel=MAX_PARALLEL_INVOCATIONS, end_time=None):
+        input_validator.is_valid_shard_count(shard_count)
+        input_validator.is_valid_max_concurrency(max_parallel)
+        self.invoker = invoker
+        self.shard_count = shard_count
+        self.max_parallel = max_parallel
+        self.end_time = end_time
+
+    # run checks the urls on the workers and returns the stats of every shard, in the order of the shards.
+    # Empty shards are not invoked
+    def run(self, urls):
+        shards = split_into_shards(urls, self.shard_count)
+        indexes = [index for index, shard in enumerate(shards) if shard]
+        stats = {}
+        lock = threading.Lock()
+
+        def invoke_shard(index):
+            shard_stats = self.__invoke(index, shards[index])
+            with lock:
+                stats[index] = shard_stats
+
+        if indexes:
+            WorkerScheduler(min(self.max_parallel, len(indexes))).run(invoke_shard, indexes)
+        return [stats[index] for index in indexes]
+
+    # __invoke invokes the worker of a shard, and returns the shard's stats. The result of the worker has the
+    # numbers of completed, failed and skipped urls
+    def __invoke(self, index, urls):
+        stats = {"shard": index, "urls": len(urls), "completed": 0, "failed": 0, "skipped": 0, "error": None}
+        start = time.perf_counter()
+        try:
+            result = self.invoker.invoke(create_shard_event(index, self.shard_count, urls, self.end_time)) or {}
+            for key in ["completed", "failed", "skipped"]:
+                stats[key] = result.get(key, 0)
+        except Exception as e:
+            stats["error"] = str(e)
+        stats["invocation_time.ms"] = (time.perf_counter() - start) * 1000
+        return stats
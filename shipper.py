@@ -0,0 +1,308 @@
+"""
+This module is for shipping metrics and logs to the logz.io listener in bulks, over a shared keep-alive session
+"""
+
+import gzip
+import json
+import queue
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+try:
+    # orjson serializes documents faster than json, straight to bytes. It's optional
+    import orjson
+except ImportError:
+    orjson = None
+
+# the listener accepts up to 10 MB per request, we keep the bulks well below that
+MAX_BULK_SIZE_BYTES = 2 * 1024 * 1024
+SESSION_POOL_SIZE = 10
+MAX_QUEUE_SIZE = 10000
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 8
+# how long the background sender waits for new documents before checking if it was closed
+IDLE_POLL_SECONDS = 0.2
+# how long a request to the listener may wait for the connection and for the response, so a stuck request doesn't
+# hold the sender
+REQUEST_TIMEOUT_SECONDS = 10
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# get_session returns the requests session that's shared by all the shippers of the container,
+# so the connections to the listener are reused between checks and invocations
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=SESSION_POOL_SIZE, pool_maxsize=SESSION_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+# serialize_document serializes a document to a line of a bulk, with orjson if it's installed. Documents that orjson
+# can't serialize fall back to json
+def serialize_document(document):
+    if orjson is not None:
+        try:
+            return orjson.dumps(document)
+        except TypeError:
+            pass
+    return json.dumps(document).encode("utf-8")
+
+
+# get_listener_url returns the custom listener if it was set, otherwise the logz.io listener of the region
+def get_listener_url(logzio_region_code, custom_listener=""):
+    if custom_listener != "":
+        return custom_listener
+    if logzio_region_code == "" or logzio_region_code == "us":
+        return "https://listener.logz.io:8071"
+    return "https://listener-{}.logz.io:8071".format(logzio_region_code)
+
+
+# is_retryable_status checks if a request that got the status code may succeed when it's sent again
+def is_retryable_status(status_code):
+    return status_code == 429 or 500 <= status_code < 600
+
+
+# post_data sends a single request body to the listener with the given token, and returns the response.
+# If compression_level is set, the body is gzip compressed with that level
+def post_data(listener, token, data, compression_level=None, timeout=REQUEST_TIMEOUT_SECONDS):
+    url = "{}/?token={}".format(listener, token)
+    headers = {}
+    if compression_level is not None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        data = gzip.compress(data, compresslevel=compression_level)
+        headers["Content-Encoding"] = "gzip"
+    return get_session().post(url, data=data, headers=headers, timeout=timeout)
+
+
+class BulkShipper(object):
+    """
+    Buffers documents and sends them to the listener as newline-delimited bulks of up to max_bulk_size bytes
+    (before compression)
+    """
+
+    def __init__(self, listener, token, max_bulk_size=MAX_BULK_SIZE_BYTES, compression_level=None):
+        self.listener = listener
+        self.token = token
+        self.max_bulk_size = max_bulk_size
+        self.compression_level = compression_level
+        self.__buffer = bytearray()
+        self.__lock = threading.Lock()
+
+    # add serializes a document and adds it to the current bulk. A full bulk is sent before the document is added.
+    # Returns False if a bulk had to be sent and failed
+    def add(self, document):
+        return self.add_line(serialize_document(document))
+
+    # add_line adds an already serialized document to the current bulk. A full bulk is sent before the document is
+    # added. Returns False if a bulk had to be sent and failed
+    def add_line(self, line):
+        with self.__lock:
+            bulk = None
+            if self.__buffer and len(self.__buffer) + 1 + len(line) > self.max_bulk_size:
+                bulk = self.__take_bulk()
+            # the lines are written straight into the bulk's buffer, so sending it doesn't join them again
+            if self.__buffer:
+                self.__buffer += b"\n"
+            self.__buffer += line
+        if bulk is not None:
+            return self.__send_bulk(bulk)
+        return True
+
+    # flush sends the documents that are left in the buffer. Returns False if the bulk failed
+    def flush(self):
+        with self.__lock:
+            bulk = self.__take_bulk()
+        if bulk is None:
+            return True
+        return self.__send_bulk(bulk)
+
+    # __take_bulk empties the buffer and returns its content as a newline-delimited body
+    def __take_bulk(self):
+        if not self.__buffer:
+            return None
+        bulk = bytes(self.__buffer)
+        self.__buffer = bytearray()
+        return bulk
+
+    # __send_bulk sends a bulk to the listener
+    def __send_bulk(self, bulk):
+        response = post_data(self.listener, self.token, bulk, self.compression_level)
+        return response.ok
+
+
+class BackgroundShipper(object):
+    """
+    Sends documents to the listener from a background thread, so the checks don't wait for the listener.
+    Documents wait in a bounded in-memory queue and are sent in bulks of up to max_bulk_size bytes.
+    Bulks that fail with 429, 5xx or a connection error are retried with exponential backoff.
+    If a spool is given, documents that could not be sent because of a temporary failure, a full queue or the flush
+    deadline are written to it instead of being dropped.
+    The number of sent, retried, spooled and dropped documents is kept in the shipper's counters
+    """
+
+    def __init__(self, listener, token, max_queue_size=MAX_QUEUE_SIZE, max_bulk_size=MAX_BULK_SIZE_BYTES,
+                 compression_level=None, max_retries=MAX_RETRIES, backoff_seconds=BACKOFF_SECONDS, spool=None):
+        self.listener = listener
+        self.token = token
+        self.max_bulk_size = max_bulk_size
+        self.compression_level = compression_level
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.spool = spool
+        self.max_queue_size = max_queue_size
+        self.sent = 0
+        self.retried = 0
+        self.spooled = 0
+        self.dropped = 0
+        self.__queue = queue.Queue(maxsize=max_queue_size)
+        self.__pending = 0
+        self.__condition = threading.Condition()
+        self.__closed = threading.Event()
+        self.__thread = None
+
+    # add serializes a document and queues it for sending. Returns False if the queue is full and it wasn't queued
+    def add(self, document):
+        return self.add_line(serialize_document(document))
+
+    # add_line queues an already serialized document for sending. Returns False if the queue is full and it wasn't
+    # queued
+    def add_line(self, line):
+        with self.__condition:
+            self.__start()
+            try:
+                self.__queue.put_nowait(line)
+            except queue.Full:
+                self.__give_up([line], can_spool=True)
+                return False
+            self.__pending += 1
+        return True
+
+    # flush waits until all the queued documents were sent, retried out or dropped, for up to timeout seconds.
+    # Returns False if there are documents left when the deadline passes
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__condition:
+            while self.__pending > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.__condition.wait(remaining)
+        return True
+
+    # close flushes the shipper for up to timeout seconds and stops its background thread.
+    # Documents that are still queued after the deadline are spooled, if the shipper has a spool.
+    # Returns False if there were documents left that were not sent
+    def close(self, timeout=None):
+        is_flushed = self.flush(timeout)
+        self.__closed.set()
+        if not is_flushed and self.spool is not None:
+            lines = []
+            while True:
+                try:
+                    lines.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self.__condition:
+                self.__give_up(lines, can_spool=True)
+                self.__pending -= len(lines)
+                self.__condition.notify_all()
+        return is_flushed
+
+    # get_stats returns the shipper's counters
+    def get_stats(self):
+        with self.__condition:
+            return {"sent": self.sent, "retried": self.retried, "spooled": self.spooled, "dropped": self.dropped,
+                    "pending": self.__pending}
+
+    # __start starts the background thread on the first document
+    def __start(self):
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+
+    # __run takes documents from the queue and sends them in bulks, until the shipper is closed
+    def __run(self):
+        carry = None
+        while True:
+            if carry is not None:
+                line, carry = carry, None
+            else:
+                try:
+                    line = self.__queue.get(timeout=IDLE_POLL_SECONDS)
+                except queue.Empty:
+                    if self.__closed.is_set():
+                        return
+                    continue
+            lines = [line]
+            size = len(line) + 1
+            while True:
+                try:
+                    line = self.__queue.get_nowait()
+                except queue.Empty:
+                    break
+                if size + len(line) + 1 > self.max_bulk_size:
+                    carry = line
+                    break
+                lines.append(line)
+                size += len(line) + 1
+            self.__send_bulk(lines)
+
+    # __send_bulk sends a bulk of documents, retrying with exponential backoff when the failure is temporary.
+    # It never raises, so the background thread keeps running and the bulk's documents are never left pending
+    def __send_bulk(self, lines):
+        is_sent = False
+        is_temporary_failure = False
+        try:
+            bulk = b"\n".join(lines)
+            for attempt in range(self.max_retries + 1):
+                if attempt > 0:
+                    with self.__condition:
+                        self.retried += len(lines)
+                    time.sleep(min(self.backoff_seconds * 2 ** (attempt - 1), MAX_BACKOFF_SECONDS))
+                try:
+                    response = post_data(self.listener, self.token, bulk, self.compression_level)
+                except requests.exceptions.RequestException:
+                    is_temporary_failure = True
+                    continue
+                if response.ok:
+                    is_sent = True
+                    break
+                is_temporary_failure = is_retryable_status(response.status_code)
+                if not is_temporary_failure:
+                    break
+        except Exception as e:
+            # an unexpected error would fail the bulk again, so it's dropped rather than spooled
+            print("Error occurred while sending a bulk to the listener: {}".format(e))
+            is_temporary_failure = False
+        finally:
+            with self.__condition:
+                if is_sent:
+                    self.sent += len(lines)
+                else:
+                    self.__give_up(lines, can_spool=is_temporary_failure)
+                self.__pending -= len(lines)
+                self.__condition.notify_all()
+
+    # __give_up spools documents that could not be sent, or drops them if they can't be spooled.
+    # Should be called while holding the condition
+    def __give_up(self, lines, can_spool):
+        if not lines:
+            return
+        if can_spool and self.spool is not None:
+            try:
+                self.spool.append(lines)
+                self.spooled += len(lines)
+                return
+            except OSError:
+                pass
+        self.dropped += len(lines)
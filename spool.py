@@ -0,0 +1,139 @@
+"""
+This module is for keeping metrics that could not be sent in an append-only file, to be replayed on the next run
+"""
+
+import os
+import threading
+import time
+
+DEFAULT_SPOOL_DIR = "/tmp/lights-spool"
+MAX_FILE_SIZE_BYTES = 5 * 1024 * 1024
+MAX_FILES = 4
+CURRENT_FILE_NAME = "metrics.ndjson"
+ROTATED_FILE_PREFIX = "metrics-"
+REPLAY_SUFFIX = ".replaying"
+PARTIAL_FILE_NAME = "partial.tmp"
+
+
+class Spool(object):
+    """
+    Newline-delimited spool of serialized documents. The current file is rotated when it reaches max_file_size
+    bytes, and only the newest max_files sealed files are kept, whether they were claimed for replay or not, so the
+    spool never grows past max_file_size * (max_files + 1) bytes.
+    Replayed documents stay in the spool until the replay is committed, so documents of a run that ended before they
+    were sent are replayed again by the next run
+    """
+
+    def __init__(self, directory=DEFAULT_SPOOL_DIR, max_file_size=MAX_FILE_SIZE_BYTES, max_files=MAX_FILES):
+        self.directory = directory
+        self.max_file_size = max_file_size
+        self.max_files = max_files
+        self.dropped_files = 0
+        # the offsets up to which the claimed files were replayed, by their paths
+        self.__replayed = {}
+        self.__lock = threading.Lock()
+
+    # append writes serialized documents (bytes, without a trailing newline) to the end of the spool
+    def append(self, lines):
+        if not lines:
+            return
+        with self.__lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, CURRENT_FILE_NAME)
+            with open(path, "ab") as spool_file:
+                spool_file.write(b"\n".join(lines) + b"\n")
+                size = spool_file.tell()
+            if size >= self.max_file_size:
+                self.__rotate(path)
+
+    # replay passes the spooled documents to add_line, oldest first, up to max_lines documents. The files are renamed
+    # before they are read, so other runs don't replay them at the same time. The replayed documents are removed from
+    # the spool only by commit_replay. Returns the number of replayed documents
+    def replay(self, add_line, max_lines=None):
+        replayed = 0
+        for path in self.__claim():
+            if max_lines is not None and replayed >= max_lines:
+                break
+            if path in self.__replayed:
+                continue
+            try:
+                spool_file = open(path, "rb")
+            except FileNotFoundError:
+                # the file was dropped by a rotation since it was claimed
+                continue
+            with spool_file:
+                while max_lines is None or replayed < max_lines:
+                    line = spool_file.readline()
+                    if not line:
+                        break
+                    line = line.rstrip(b"\n")
+                    if line:
+                        add_line(line)
+                        replayed += 1
+                offset = spool_file.tell()
+            with self.__lock:
+                if os.path.exists(path):
+                    self.__replayed[path] = offset
+        return replayed
+
+    # commit_replay removes the replayed documents from the spool. It should be called once the replayed documents
+    # were sent, dropped or spooled again. Files that were replayed partly keep the documents that were not replayed
+    def commit_replay(self):
+        with self.__lock:
+            replayed, self.__replayed = self.__replayed, {}
+            for path, offset in replayed.items():
+                if offset >= os.path.getsize(path):
+                    os.remove(path)
+                    continue
+                partial_path = os.path.join(self.directory, PARTIAL_FILE_NAME)
+                with open(path, "rb") as spool_file, open(partial_path, "wb") as partial_file:
+                    spool_file.seek(offset)
+                    partial_file.write(spool_file.read())
+                os.replace(partial_path, path)
+
+    # size returns the total size (in bytes) of the spool files
+    def size(self):
+        current = os.path.join(self.directory, CURRENT_FILE_NAME)
+        size = os.path.getsize(current) if os.path.exists(current) else 0
+        return size + sum(os.path.getsize(path) for path in self.__list_files())
+
+    # __rotate seals the current file and removes the oldest files above max_files
+    def __rotate(self, path):
+        os.rename(path, self.__new_rotated_path())
+        self.__drop_oldest()
+
+    # __drop_oldest removes the oldest sealed files above max_files, including the files that were claimed for
+    # replay, so the spool stays bounded while the listener is down
+    def __drop_oldest(self):
+        sealed = self.__list_files()
+        for old_path in sealed[:max(0, len(sealed) - self.max_files)]:
+            os.remove(old_path)
+            self.__replayed.pop(old_path, None)
+            self.dropped_files += 1
+
+    # __claim renames the spool files for replay and returns their paths, oldest first. Files that were claimed
+    # by a run that didn't finish replaying them are claimed again
+    def __claim(self):
+        with self.__lock:
+            current = os.path.join(self.directory, CURRENT_FILE_NAME)
+            if os.path.exists(current):
+                os.rename(current, self.__new_rotated_path())
+                self.__drop_oldest()
+            claimed = []
+            for path in self.__list_files():
+                if not path.endswith(REPLAY_SUFFIX):
+                    os.rename(path, path + REPLAY_SUFFIX)
+                    path += REPLAY_SUFFIX
+                claimed.append(path)
+            return claimed
+
+    # __new_rotated_path returns a path for a sealed spool file. The names sort by the time they were sealed
+    def __new_rotated_path(self):
+        return os.path.join(self.directory, "{}{:020d}.ndjson".format(ROTATED_FILE_PREFIX, time.time_ns()))
+
+    # __list_files returns the paths of the sealed spool files, oldest first
+    def __list_files(self):
+        if not os.path.isdir(self.directory):
+            return []
+        rotated = sorted(name for name in os.listdir(self.directory) if name.startswith(ROTATED_FILE_PREFIX))
+        return [os.path.join(self.directory, name) for name in rotated]
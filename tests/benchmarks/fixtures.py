@@ -0,0 +1,196 @@
+"""
+This module is for serving synthetic pages and a stand-in logz.io listener from local HTTP servers, for the benchmarks
+"""
+
+import contextlib
+from dataclasses import dataclass
+import gzip
+import http.server
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+import sys
+sys.path.append('../..')
+from process_memory import get_process_tree_rss_mb, PeakMemorySampler as BasePeakMemorySampler
+
+# FIXTURE_DOMAIN is resolved to the local servers. The url validation needs a top level domain, so "localhost" and
+# ip addresses can't be monitored
+FIXTURE_DOMAIN = "lights.test"
+PAGES_HOST = "pages.{}".format(FIXTURE_DOMAIN)
+LISTENER_HOST = "listener.{}".format(FIXTURE_DOMAIN)
+
+
+@dataclass()
+class PageFixture(object):
+    """
+    A synthetic page with resources_count resources of resource_size bytes each. The page and every resource are
+    delayed by their latency
+    """
+    name: str
+    resources_count: int = 10
+    resource_size: int = 10 * 1024
+    latency_ms: int = 0
+    resource_latency_ms: int = 0
+    status_code: int = 200
+
+
+DEFAULT_FIXTURES = [PageFixture("small", resources_count=5, resource_size=2 * 1024),
+                    PageFixture("heavy", resources_count=150, resource_size=20 * 1024),
+                    PageFixture("slow", resources_count=10, latency_ms=500, resource_latency_ms=200),
+                    PageFixture("error", resources_count=0, status_code=500)]
+
+
+# create_page creates the html of a page fixture. Its resources alternate between scripts and stylesheets
+def create_page(fixture):
+    tags = []
+    for i in range(fixture.resources_count):
+        if i % 2:
+            tags.append('<link rel="stylesheet" href="/resources/{}/{}.css">'.format(fixture.name, i))
+        else:
+            tags.append('<script src="/resources/{}/{}.js"></script>'.format(fixture.name, i))
+    return "<!DOCTYPE html><html><head><title>{}</title>{}</head><body><p>{}</p></body></html>".format(
+        fixture.name, "".join(tags), fixture.name).encode("utf-8")
+
+
+# create_resource creates the content of a resource of a page fixture: a comment (valid in scripts and stylesheets)
+# of the fixture's resource size
+def create_resource(fixture):
+    return "/*{}*/\n".format("x" * max(0, fixture.resource_size - 5)).encode("utf-8")
+
+
+class FixtureServer(object):
+    """
+    Serves the page fixtures at /pages/<name> and their resources at /resources/<name>/<index>.<js|css>
+    """
+
+    def __init__(self, fixtures=None):
+        self.fixtures = {fixture.name: fixture for fixture in (fixtures or DEFAULT_FIXTURES)}
+        fixtures_by_name = self.fixtures
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parts = urlsplit(self.path).path.strip("/").split("/")
+                fixture = fixtures_by_name.get(parts[1]) if len(parts) > 1 else None
+                if fixture is None:
+                    return self.__respond(404, b"", "text/plain")
+                if parts[0] == "pages":
+                    time.sleep(fixture.latency_ms / 1000)
+                    return self.__respond(fixture.status_code, create_page(fixture), "text/html")
+                time.sleep(fixture.resource_latency_ms / 1000)
+                content_type = "text/css" if parts[-1].endswith(".css") else "application/javascript"
+                self.__respond(200, create_resource(fixture), content_type)
+
+            def __respond(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    # get_url returns the url of a page fixture. The query makes distinct urls of the same page
+    def get_url(self, name, query=None):
+        url = "http://{}:{}/pages/{}".format(PAGES_HOST, self.port, name)
+        return url if query is None else "{}?{}".format(url, query)
+
+    # close stops the server
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StandInListener(object):
+    """
+    Stands in for the logz.io listener. Counts the requests, the bytes and the documents it receives
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.documents = 0
+        self.__lock = threading.Lock()
+        listener = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                size = len(body)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                listener.add_request(size, len([line for line in body.split(b"\n") if line]))
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://{}:{}".format(LISTENER_HOST, self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    # add_request records a received request
+    def add_request(self, size, documents):
+        with self.__lock:
+            self.requests += 1
+            self.bytes += size
+            self.documents += documents
+
+    # get_stats returns the listener's counters
+    def get_stats(self):
+        with self.__lock:
+            return {"requests": self.requests, "bytes": self.bytes, "documents": self.documents}
+
+    # close stops the server
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class PeakMemorySampler(BasePeakMemorySampler):
+    """
+    Samples the resident memory of the current process and its children (chromedriver and chrome) in the background,
+    and keeps the peak
+    """
+
+    def __init__(self, interval=0.05):
+        super().__init__({"tree": lambda: get_process_tree_rss_mb(os.getpid())}, interval)
+
+    @property
+    def peak_mb(self):
+        return self.peaks_mb.get("tree", 0)
+
+
+# resolve_fixture_domain resolves the fixture domain to the local servers, for the http probes and the listener
+@contextlib.contextmanager
+def resolve_fixture_domain():
+    getaddrinfo = socket.getaddrinfo
+
+    def resolve(host, port, *args, **kwargs):
+        if isinstance(host, str) and (host == FIXTURE_DOMAIN or host.endswith("." + FIXTURE_DOMAIN)):
+            host = "127.0.0.1"
+        return getaddrinfo(host, port, *args, **kwargs)
+
+    socket.getaddrinfo = resolve
+    try:
+        yield
+    finally:
+        socket.getaddrinfo = getaddrinfo
+
+
+# get_chrome_resolver_arguments returns the chrome arguments that resolve the fixture domain to the local servers
+def get_chrome_resolver_arguments():
+    return ("--host-resolver-rules=MAP *.{} 127.0.0.1".format(FIXTURE_DOMAIN),)
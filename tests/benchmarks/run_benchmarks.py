@@ -0,0 +1,198 @@
+"""
+Benchmarks of the monitoring pipeline against local page fixtures and a stand-in listener.
+Run from this directory: python run_benchmarks.py [--copies N] [--output results.json] [--skip-browser]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import time
+from unittest import mock
+import sys
+sys.path.append('../..')
+sys.path.append('../../aws')
+from fixtures import FixtureServer, StandInListener, PeakMemorySampler, resolve_fixture_domain, \
+    get_chrome_resolver_arguments
+from browser_pool import BrowserPool, create_chrome_driver, STATUS_CODE_MODE_FULL
+from lights import LightsMonitor
+from import_timer import COLD_START_IMPORT_BUDGET_MS
+import lambda_function
+
+TEST_LOGS_TOKEN = "logsLogzioTokenlogzioTokenLogzio"
+TEST_METRICS_TOKEN = "metricsLogzioTokenlogzioTokenLog"
+TEST_REGION = "us-east-1"
+TEST_FUNCTION_NAME = "lights-benchmark"
+# modules that the handler imports only when they are used, and that a cold start should not import
+DEFERRED_MODULES = ["asyncio", "boto3", "selenium.webdriver"]
+# the script that imports the handler in a fresh interpreter, and prints its import times and the deferred modules
+# that were imported
+COLD_START_SCRIPT = """
+import json, sys
+sys.path[:0] = sys.argv[1:3]
+import lambda_function
+print(json.dumps({"metrics": lambda_function.cold_start_metrics,
+                  "imported": [name for name in sys.argv[3:] if name in sys.modules]}))
+"""
+
+
+# count_round_trips counts the commands a driver sends to chromedriver. Every WebDriver command, including the
+# devtools commands, goes through driver.execute
+def count_round_trips(driver):
+    execute = driver.execute
+    driver.round_trips = 0
+
+    def counted_execute(command, params=None):
+        driver.round_trips += 1
+        return execute(command, params)
+
+    driver.execute = counted_execute
+    return driver
+
+
+# create_benchmark_driver launches a chrome driver that resolves the fixture domain locally and counts its round trips
+def create_benchmark_driver(system, status_code_mode=STATUS_CODE_MODE_FULL, launch_arguments=()):
+    return count_round_trips(create_chrome_driver(system, status_code_mode,
+                                                  get_chrome_resolver_arguments() + tuple(launch_arguments)))
+
+
+# benchmark_monitor checks every page fixture with LightsMonitor.monitor() on a warm browser, and returns a result per
+# url with its wall time, WebDriver round trips and listener requests
+def benchmark_monitor(fixture_server, listener):
+    results = []
+    pool = BrowserPool("none", max_browsers=1, driver_factory=create_benchmark_driver)
+    try:
+        # launch the browser before the first measurement, so every url is measured on a warm browser
+        pool.release(pool.acquire())
+        for name in fixture_server.fixtures:
+            url = fixture_server.get_url(name)
+            driver = pool.acquire()
+            pool.release(driver)
+            round_trips = driver.round_trips
+            listener_requests = listener.get_stats()["requests"]
+            with PeakMemorySampler() as memory:
+                start = time.perf_counter()
+                LightsMonitor(url=url,
+                              logs_token=TEST_LOGS_TOKEN,
+                              metrics_token=TEST_METRICS_TOKEN,
+                              logzio_region_code="us",
+                              logzio_listener=listener.url,
+                              region=TEST_REGION,
+                              function_name=TEST_FUNCTION_NAME,
+                              system="none",
+                              browser_pool=pool).monitor()
+                wall_time = time.perf_counter() - start
+            results.append({"scenario": "monitor",
+                            "url": url,
+                            "wall_time_per_url.ms": wall_time * 1000,
+                            "webdriver_round_trips": driver.round_trips - round_trips,
+                            "listener_requests": listener.get_stats()["requests"] - listener_requests,
+                            "peak_rss.mb": memory.peak_mb})
+    finally:
+        pool.close()
+    return results
+
+
+# benchmark_handler runs the lambda handler once for the urls with the given environment, and returns the run's
+# wall time (total and per url), listener requests and peak memory
+def benchmark_handler(scenario, urls, listener, environment):
+    handler_environment = {"LOGZIO_METRICS_TOKEN": TEST_METRICS_TOKEN,
+                           "LOGZIO_LOGS_TOKEN": TEST_LOGS_TOKEN,
+                           "LOGZIO_CUSTOM_LISTENER": listener.url,
+                           "URLS": ",".join(urls),
+                           "AWS_LAMBDA_FUNCTION_NAME": TEST_FUNCTION_NAME,
+                           "AWS_REGION": TEST_REGION,
+                           "SYSTEM": "none",
+                           "SPOOL_DIR": ""}
+    handler_environment.update(environment)
+    listener_stats = listener.get_stats()
+    with mock.patch.dict(os.environ, handler_environment), PeakMemorySampler() as memory:
+        start = time.perf_counter()
+        lambda_function.lambda_handler({}, None)
+        wall_time = time.perf_counter() - start
+    return {"scenario": scenario,
+            "urls": len(urls),
+            "wall_time.ms": wall_time * 1000,
+            "wall_time_per_url.ms": wall_time * 1000 / len(urls),
+            "listener_requests": listener.get_stats()["requests"] - listener_stats["requests"],
+            "listener_documents": listener.get_stats()["documents"] - listener_stats["documents"],
+            "peak_rss.mb": memory.peak_mb}
+
+
+# benchmark_cold_start imports the handler in fresh interpreters, and returns the median import time of the runs, the
+# documented import budget and the deferred modules that were imported
+def benchmark_cold_start(runs=5):
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+    outputs = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT, root, os.path.join(root, "aws")] +
+                                DEFERRED_MODULES, check=True, stdout=subprocess.PIPE, cwd=root).stdout
+        outputs.append(json.loads(output.decode("utf-8").splitlines()[-1]))
+    import_time = statistics.median(output["metrics"]["import_total.ms"] for output in outputs)
+    return {"scenario": "cold-start-imports",
+            "import_time.ms": import_time,
+            "import_budget.ms": COLD_START_IMPORT_BUDGET_MS,
+            "within_budget": import_time <= COLD_START_IMPORT_BUDGET_MS,
+            "deferred_modules_imported": ",".join(sorted(set(name for output in outputs
+                                                             for name in output["imported"])))}
+
+
+# run_benchmarks runs all the benchmarks, and returns their results
+def run_benchmarks(copies=50, skip_browser=False):
+    fixture_server = FixtureServer()
+    listener = StandInListener()
+    results = [benchmark_cold_start()]
+    try:
+        with resolve_fixture_domain():
+            urls = [fixture_server.get_url(name, "copy={}".format(i))
+                    for name in fixture_server.fixtures for i in range(copies)]
+            results.append(benchmark_handler("handler-http-threads", urls, listener,
+                                             {"DEFAULT_PROBE": "http", "PROBE_ENGINE": "threads"}))
+            results.append(benchmark_handler("handler-http-asyncio", urls, listener,
+                                             {"DEFAULT_PROBE": "http", "PROBE_ENGINE": "asyncio"}))
+            if skip_browser or shutil.which("chromedriver") is None:
+                print("Skipping the browser benchmarks, chromedriver was not found")
+            else:
+                results.extend(benchmark_monitor(fixture_server, listener))
+                browser_urls = [fixture_server.get_url(name) for name in fixture_server.fixtures]
+                with mock.patch("lambda_function.create_chrome_driver", create_benchmark_driver):
+                    results.append(benchmark_handler("handler-browser", browser_urls, listener, {}))
+    finally:
+        fixture_server.close()
+        listener.close()
+    return results
+
+
+# print_results prints the results as a table
+def print_results(results):
+    columns = ["scenario", "url", "urls", "wall_time.ms", "wall_time_per_url.ms", "webdriver_round_trips",
+               "listener_requests", "listener_documents", "peak_rss.mb", "import_time.ms", "import_budget.ms",
+               "within_budget", "deferred_modules_imported"]
+    columns = [column for column in columns if any(column in result for result in results)]
+    rows = [[__format_value(result.get(column, "")) for column in columns] for result in results]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+# __format_value formats a result value for the table
+def __format_value(value):
+    if isinstance(value, float):
+        return "{:.1f}".format(value)
+    return str(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the monitoring pipeline against local page fixtures")
+    parser.add_argument("--copies", type=int, default=50, help="copies of every page in the http probe runs")
+    parser.add_argument("--output", help="a file to write the results to, as json")
+    parser.add_argument("--skip-browser", action="store_true", help="run only the http probe benchmarks")
+    args = parser.parse_args()
+    benchmark_results = run_benchmarks(args.copies, args.skip_browser)
+    print_results(benchmark_results)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(benchmark_results, output_file, indent=2)
@@ -0,0 +1,141 @@
+from unittest import TestCase
+import http.server
+import json
+import socket
+import threading
+import time
+from unittest import mock
+import sys
+sys.path.append('..')
+import input_validator
+from async_probe import AsyncProbeEngine
+
+
+class ProbedHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/health")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/slow":
+            time.sleep(1)
+        if self.path == "/slow-redirect":
+            time.sleep(0.2)
+            self.send_response(302)
+            self.send_header("Location", "/slow-redirect")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/chunked":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in [b"hello ", b"world"]:
+                self.wfile.write("{:x}\r\n".format(len(chunk)).encode("ascii") + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        status = 503 if self.path == "/down" else 200
+        body = json.dumps({"path": self.path}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# resolve_to_localhost resolves the test hostname to the local test server
+def resolve_to_localhost(host, port, *args, **kwargs):
+    return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", port))]
+
+
+class TestAsyncProbeEngine(TestCase):
+    TEST_HOST = "probe.example.com"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ProbedHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = "http://{}:{}".format(cls.TEST_HOST, cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.resolver = mock.patch("async_probe.socket.getaddrinfo", side_effect=resolve_to_localhost)
+        self.getaddrinfo = self.resolver.start()
+
+    def tearDown(self):
+        self.resolver.stop()
+
+    # Tests the engine probes all the urls with the phases of probe_url, and resolves the host once
+    def test_run(self):
+        paths = ["/redirect", "/down", "/chunked"] + ["/health?id={}".format(i) for i in range(20)]
+        urls = [self.base_url + path for path in paths]
+        outcomes, skipped = AsyncProbeEngine(max_connections_per_host=2).run(urls, deadline=10)
+        self.assertEqual(skipped, [])
+        self.assertEqual([outcome[0] for outcome in outcomes], urls)
+        results = {url: result for url, _, result, error in outcomes}
+        self.assertTrue(all(error is None for _, _, _, error in outcomes))
+        self.assertEqual(results[urls[0]]["status_code"], 200)
+        self.assertEqual(results[urls[0]]["body_size.bytes"], len(json.dumps({"path": "/health"})))
+        self.assertEqual(results[urls[1]]["status_code"], 503)
+        self.assertEqual(results[urls[2]]["body_size.bytes"], len("hello world"))
+        for result in results.values():
+            for phase in ["dns.ms", "connect.ms", "tls.ms", "connection_reused", "time_to_first_byte.ms",
+                          "time_to_complete.ms"]:
+                self.assertIn(phase, result)
+        # with 2 connections per host, the other probes reuse their connections
+        self.assertLessEqual(sum(1 for result in results.values() if result["connection_reused"] == 0), 2)
+        self.assertEqual(self.getaddrinfo.call_count, 1)
+
+    # Tests probes that are running at the deadline fail with a timeout, and probes that didn't start are skipped
+    def test_deadline(self):
+        urls = [self.base_url + "/slow", self.base_url + "/health"]
+        outcomes, skipped = AsyncProbeEngine(max_connections_per_host=1).run(urls, deadline=0.3)
+        self.assertEqual(len(outcomes), 1)
+        url, timestamp, result, error = outcomes[0]
+        self.assertEqual(url, urls[0])
+        self.assertIsNone(result)
+        self.assertIsInstance(error, socket.timeout)
+        self.assertEqual(skipped, [urls[1]])
+
+    # Tests the timeout is the time of the whole probe, and not of every redirect
+    def test_probe_timeout(self):
+        start = time.monotonic()
+        outcomes, skipped = AsyncProbeEngine(timeout=0.5).run([self.base_url + "/slow-redirect"], deadline=10)
+        self.assertIsInstance(outcomes[0][3], socket.timeout)
+        self.assertLess(time.monotonic() - start, 1)
+
+    # Tests every address of the host is tried in turn, so an unreachable first address doesn't fail the probe
+    def test_probe_next_address(self):
+        def resolve(host, port, *args, **kwargs):
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.2", port))] + \
+                resolve_to_localhost(host, port)
+
+        self.getaddrinfo.side_effect = resolve
+        outcomes, skipped = AsyncProbeEngine().run([self.base_url + "/health"], deadline=5)
+        self.assertIsNone(outcomes[0][3])
+        self.assertEqual(outcomes[0][2]["status_code"], 200)
+
+    # Tests a url that can't be reached is returned with its error
+    def test_unreachable(self):
+        outcomes, skipped = AsyncProbeEngine().run(["http://{}:1/health".format(self.TEST_HOST)], deadline=5)
+        self.assertIsNone(outcomes[0][2])
+        self.assertIsInstance(outcomes[0][3], OSError)
+
+    # Tests the probe engine raises ValueError and TypeError for invalid engines
+    def test_invalid_probe_engine(self):
+        self.assertTrue(input_validator.is_valid_probe_engine("asyncio"))
+        with self.assertRaises(ValueError):
+            input_validator.is_valid_probe_engine("processes")
+        with self.assertRaises(TypeError):
+            input_validator.is_valid_probe_engine(None)
@@ -0,0 +1,196 @@
+from unittest import TestCase
+from unittest import mock
+import gzip
+import json
+import os
+import threading
+import time
+import requests_mock
+import sys
+sys.path.append('..')
+sys.path.append('../aws')
+import auto_deployment
+
+
+class StubCloudFormationClient(object):
+    """
+    Stands in for a cloudformation client of a region. Every describe_stacks call returns the next status of the
+    stack, and the last status once they ran out
+    """
+
+    def __init__(self, region, statuses=("CREATE_IN_PROGRESS", "CREATE_COMPLETE"), create_error=None, parameters=None):
+        self.region = region
+        self.statuses = list(statuses)
+        self.create_error = create_error
+        # the parameters of the existing stack, None if the stack doesn't exist
+        self.parameters = parameters
+        self.created = []
+        self.updated = []
+
+    def create_stack(self, **kwargs):
+        if self.create_error is not None:
+            raise self.create_error
+        self.created.append(kwargs)
+        return {"StackId": "arn:aws:cloudformation:{}:stack/{}".format(self.region, kwargs["StackName"])}
+
+    def update_stack(self, **kwargs):
+        self.updated.append(kwargs)
+        self.parameters = {p["ParameterKey"]: p["ParameterValue"] for p in kwargs["Parameters"]}
+        return {"StackId": "arn:aws:cloudformation:{}:stack/{}".format(self.region, kwargs["StackName"])}
+
+    def describe_stacks(self, StackName):
+        if self.parameters is None and not self.created:
+            raise Exception("Stack with id {} does not exist".format(StackName))
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        parameters = [{"ParameterKey": key, "ParameterValue": value} for key, value in (self.parameters or {}).items()]
+        return {"Stacks": [{"StackName": StackName, "StackStatus": status, "Parameters": parameters}]}
+
+    def delete_stack(self, StackName):
+        self.deleted = StackName
+        return {}
+
+
+class TestAutoDeployment(TestCase):
+    TEST_ENVIRONMENT = {"LOGZIO_CUSTOM_LISTENER": "",
+                        "LOGZIO_METRICS_TOKEN": "metricsLogzioTokenlogzioTokenLog",
+                        "LOGZIO_LOGS_TOKEN": "logsLogzioTokenlogzioTokenLogzio",
+                        "LOGZIO_REGION": "eu",
+                        "SCRAPE_INTERVAL": "rate(5 minutes)",
+                        "REGIONS": "us-east-1, eu-west-1",
+                        "STACK_NAME": "logzio-sm-auto-deployment",
+                        "URLS": "https://example.com,https://logz.io",
+                        "MEMORY": "512",
+                        "AWS_LAMBDA_FUNCTION_NAME": "auto-deployment"}
+
+    # Tests the module can be imported without its environment variables, and boto3 is not imported with it
+    def test_import(self):
+        self.assertNotIn("boto3", sys.modules)
+
+    # Tests the settings are read from the environment variables
+    def test_load_settings(self):
+        settings = auto_deployment.load_settings(self.TEST_ENVIRONMENT)
+        self.assertEqual(settings.logzio_listener, "https://listener-eu.logz.io:8071")
+        self.assertEqual(settings.regions, ("us-east-1", "eu-west-1"))
+        self.assertEqual(settings.protocol, "https")
+        self.assertIsNone(settings.compression_level)
+        self.assertEqual(settings.url_label, "httpsexamplecomhttpslogzio")
+
+    # Tests logs are sent to the listener with the logs token, and compressed with the shared shipper's gzip settings
+    def test_send_log(self):
+        settings = auto_deployment.load_settings(dict(self.TEST_ENVIRONMENT, GZIP_COMPRESSION_LEVEL="5"))
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            auto_deployment._send_log(settings, "deployed")
+        request = m.request_history[0]
+        self.assertEqual(request.url, "https://listener-eu.logz.io:8071/?token={}".format(
+            self.TEST_ENVIRONMENT["LOGZIO_LOGS_TOKEN"]))
+        self.assertEqual(request.headers["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(request.body))["message"], "deployed")
+
+    # Tests missing and invalid settings raise errors
+    def test_invalid_settings(self):
+        with self.assertRaises(KeyError):
+            auto_deployment.load_settings({})
+        with self.assertRaises(ValueError):
+            auto_deployment.load_settings(dict(self.TEST_ENVIRONMENT, LOGZIO_LOGS_TOKEN="invalid"))
+        with self.assertRaises(ValueError):
+            auto_deployment.load_settings(dict(self.TEST_ENVIRONMENT, SCRAPE_INTERVAL="5 minutes"))
+        with self.assertRaises(ValueError):
+            auto_deployment.load_settings(dict(self.TEST_ENVIRONMENT, DEPLOYMENT_MODE="recreate"))
+
+    # Tests the stacks of all the regions are created concurrently, each with its own client, and waited for
+    def test_deploy_regions(self):
+        settings = auto_deployment.load_settings(dict(self.TEST_ENVIRONMENT, REGIONS="us-east-1,eu-west-1,ap-south-1"))
+        clients = {}
+        barrier = threading.Barrier(3, timeout=5)
+
+        def create_client(region):
+            # every region waits for the others, so the test hangs if the regions are deployed one after the other
+            barrier.wait()
+            clients[region] = StubCloudFormationClient(region)
+            return clients[region]
+
+        with mock.patch("auto_deployment._send_log"):
+            deployments = auto_deployment.deploy_regions(settings, client_factory=create_client, sleep=lambda s: None)
+        self.assertEqual([d.region for d in deployments], ["us-east-1", "eu-west-1", "ap-south-1"])
+        self.assertTrue(all(d.succeeded for d in deployments))
+        for region, client in clients.items():
+            self.assertEqual(client.created[0]["StackName"], "logzio-sm-{}-httpsexamplecomhttpslogzio".format(region))
+            parameters = {p["ParameterKey"]: p["ParameterValue"] for p in client.created[0]["Parameters"]}
+            self.assertEqual(parameters["memorySize"], "512")
+
+    # Tests the stack's status is polled with an exponential backoff until it's done
+    def test_wait_for_stack_backoff(self):
+        client = StubCloudFormationClient("us-east-1", ["CREATE_IN_PROGRESS"] * 5 + ["CREATE_COMPLETE"], parameters={})
+        delays = []
+        status = auto_deployment._wait_for_stack(client, "stack", time.monotonic() + 3600, delays.append)
+        self.assertEqual(status, "CREATE_COMPLETE")
+        self.assertEqual(delays, [2, 4, 8, 16, 20])
+
+    # Tests failed stacks and stacks that are still in progress at the deadline are not successful
+    def test_failed_deployments(self):
+        settings = auto_deployment.load_settings(dict(self.TEST_ENVIRONMENT, REGIONS="us-east-1,eu-west-1,ap-south-1"))
+        clients = {"us-east-1": StubCloudFormationClient("us-east-1", ["ROLLBACK_COMPLETE"]),
+                   "eu-west-1": StubCloudFormationClient("eu-west-1", ["CREATE_IN_PROGRESS"]),
+                   "ap-south-1": StubCloudFormationClient("ap-south-1", create_error=ValueError("limit exceeded"))}
+        with mock.patch("auto_deployment._send_log"):
+            deployments = auto_deployment.deploy_regions(settings, deadline=time.monotonic(),
+                                                         client_factory=clients.get, sleep=lambda s: None)
+        self.assertEqual([d.status for d in deployments], ["ROLLBACK_COMPLETE", "CREATE_IN_PROGRESS", None])
+        self.assertFalse(any(d.succeeded for d in deployments))
+        self.assertEqual(deployments[2].error, "limit exceeded")
+        summary = auto_deployment._format_deployment_summary(deployments, 1.5)
+        self.assertTrue(summary.startswith("Deployed 0/3 regions in 1.5s: us-east-1 created ROLLBACK_COMPLETE"))
+        self.assertIn("ap-south-1 limit exceeded", summary)
+
+    # Tests the handler deploys the regions and deletes the auto deployment stack without waiting for a fixed time
+    def test_lambda_handler(self):
+        clients = {}
+        event = {"ResponseURL": "https://example.com/response", "StackId": "stack-id", "RequestId": "request-id",
+                 "LogicalResourceId": "resource-id"}
+        context = mock.Mock(log_stream_name="log-stream", get_remaining_time_in_millis=lambda: 60000)
+
+        def create_client(region):
+            clients.setdefault(region, []).append(StubCloudFormationClient(region))
+            return clients[region][-1]
+
+        with requests_mock.Mocker() as m, mock.patch.dict(os.environ, self.TEST_ENVIRONMENT), \
+                mock.patch("auto_deployment._create_cloudformation_client", create_client), \
+                mock.patch("time.sleep") as sleep:
+            m.put(requests_mock.ANY)
+            m.post(requests_mock.ANY)
+            auto_deployment.lambda_handler(event, context)
+        self.assertEqual(len(clients["eu-west-1"][0].created), 1)
+        self.assertEqual(clients["us-east-1"][-1].deleted, "logzio-sm-auto-deployment")
+        self.assertTrue(all(call[0][0] <= auto_deployment.POLL_MAX_DELAY_SECONDS for call in sleep.call_args_list))
+        messages = [r.text for r in m.request_history if r.method == "POST"]
+        self.assertTrue(any("Deployed 2/2 regions" in message for message in messages))
+
+    # Tests reconcile mode creates missing stacks, updates stacks whose parameters changed and skips unchanged stacks
+    def test_reconcile_regions(self):
+        settings = auto_deployment.load_settings(dict(self.TEST_ENVIRONMENT, DEPLOYMENT_MODE="reconcile",
+                                                      REGIONS="us-east-1,eu-west-1,ap-south-1"))
+        desired = {p["ParameterKey"]: p["ParameterValue"] for p in auto_deployment._get_stack_parameters(settings)}
+        clients = {"us-east-1": StubCloudFormationClient("us-east-1"),
+                   "eu-west-1": StubCloudFormationClient("eu-west-1", ["UPDATE_IN_PROGRESS", "UPDATE_COMPLETE"],
+                                                         parameters=dict(desired, memorySize="1024")),
+                   "ap-south-1": StubCloudFormationClient("ap-south-1", ["CREATE_COMPLETE"], parameters=desired)}
+        with mock.patch("auto_deployment._send_log"):
+            deployments = auto_deployment.deploy_regions(settings, client_factory=clients.get, sleep=lambda s: None)
+        self.assertEqual([d.action for d in deployments], ["created", "updated", "unchanged"])
+        self.assertTrue(all(d.succeeded for d in deployments))
+        self.assertEqual(len(clients["us-east-1"].created), 1)
+        self.assertEqual((clients["eu-west-1"].created, len(clients["eu-west-1"].updated)), ([], 1))
+        self.assertEqual((clients["ap-south-1"].created, clients["ap-south-1"].updated), ([], []))
+        self.assertEqual(clients["eu-west-1"].parameters, desired)
+
+    # Tests only the parameters whose values differ are reported as changed
+    def test_changed_parameters(self):
+        settings = auto_deployment.load_settings(self.TEST_ENVIRONMENT)
+        parameters = auto_deployment._get_stack_parameters(settings)
+        stack = {"Parameters": [{"ParameterKey": p["ParameterKey"], "ParameterValue": p["ParameterValue"]}
+                                for p in parameters if p["ParameterKey"] != "shippingProtocol"]}
+        self.assertEqual(auto_deployment._get_changed_parameters(stack, parameters), ["shippingProtocol"])
+        stack["Parameters"][0]["ParameterValue"] = "https://listener.logz.io:8071"
+        self.assertEqual(auto_deployment._get_changed_parameters(stack, parameters),
+                         ["logzioURL", "shippingProtocol"])
@@ -113,4 +113,11 @@ class TestAWS(unittest.TestCase):
             m.post("{}/?token={}".format(self.TEST_LOGZIO_LISTENER, os.environ["LOGZIO_METRICS_TOKEN"]))
             lambda_function.lambda_handler(self.TEST_EVENT, self.TEST_CONTEXT)
             self.assertGreater(len(m.request_history), 0)
-            self.assertIn("metrics", json.loads(m.request_history[0].text))
+            self.assertIn("metrics", json.loads(m.request_history[0].text.splitlines()[0]))
+
+    # test_time_budget tests that a browser check's budget covers its page timeout and the check's overhead
+    def test_time_budget(self):
+        self.assertEqual(lambda_function.get_time_budget("browser", 20, 5.0), 20)
+        self.assertEqual(lambda_function.get_time_budget("browser", 20, 30.0),
+                         30.0 + lambda_function.CHECK_OVERHEAD_SECONDS)
+        self.assertEqual(lambda_function.get_time_budget("http", 20, 30.0), lambda_function.HttpProbe.TIMEOUT)
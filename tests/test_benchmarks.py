@@ -0,0 +1,26 @@
+from unittest import TestCase
+import sys
+sys.path.append('..')
+sys.path.append('../aws')
+sys.path.append('benchmarks')
+from run_benchmarks import run_benchmarks
+
+
+class TestBenchmarks(TestCase):
+
+    # Tests the http probe benchmarks check every page copy and count the listener requests and documents
+    def test_run_http_benchmarks(self):
+        results = run_benchmarks(copies=2, skip_browser=True)
+        self.assertEqual([result["scenario"] for result in results],
+                         ["cold-start-imports", "handler-http-threads", "handler-http-asyncio"])
+        cold_start = results[0]
+        self.assertGreater(cold_start["import_time.ms"], 0)
+        # the handler's cold start should not import the modules it only imports when they are used
+        self.assertEqual(cold_start["deferred_modules_imported"], "")
+        for result in results[1:]:
+            self.assertEqual(result["urls"], 8)
+            self.assertGreater(result["wall_time.ms"], 0)
+            self.assertGreater(result["listener_requests"], 0)
+            # a metrics document per url, the run's summary and self documents and a log per failing url
+            self.assertEqual(result["listener_documents"], 8 + 2 + 2)
+            self.assertGreater(result["peak_rss.mb"], 0)
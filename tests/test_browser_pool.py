@@ -0,0 +1,210 @@
+from unittest import TestCase
+import threading
+import sys
+sys.path.append('..')
+from browser_pool import BrowserPool, get_blocked_url_patterns, matches_url_pattern
+
+
+class FakeSwitchTo(object):
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.current_window_handle = handle
+
+
+class FakeDriver(object):
+    def __init__(self):
+        self.handles = ["tab-0"]
+        self.current_window_handle = "tab-0"
+        self.switch_to = FakeSwitchTo(self)
+        self.cdp_commands = []
+        self.is_quit = False
+        self.is_crashed = False
+        self.__next_tab = 1
+
+    @property
+    def window_handles(self):
+        return list(self.handles)
+
+    @property
+    def current_window_handle(self):
+        if self.is_crashed:
+            raise Exception("chrome is not reachable")
+        return self.__current_handle
+
+    @current_window_handle.setter
+    def current_window_handle(self, handle):
+        self.__current_handle = handle
+
+    def execute_script(self, script):
+        if "window.open" in script:
+            self.handles.append("tab-{}".format(self.__next_tab))
+            self.__next_tab += 1
+            return None
+        return "https://example.com"
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.cdp_commands.append(cmd)
+
+    def close(self):
+        self.handles.remove(self.current_window_handle)
+
+    def get_log(self, log_type):
+        return []
+
+    def quit(self):
+        self.is_quit = True
+
+
+class BrokenDriver(FakeDriver):
+    def execute_script(self, script):
+        raise Exception("chrome crashed")
+
+
+class TestBrowserPool(TestCase):
+    TEST_SYSTEM = "none"
+
+    # Tests the pool doesn't launch more drivers than max_browsers, even when many checks run concurrently
+    def test_bounded_launches(self):
+        launched = []
+
+        def factory(system):
+            driver = FakeDriver()
+            launched.append(driver)
+            return driver
+
+        pool = BrowserPool(self.TEST_SYSTEM, max_browsers=2, driver_factory=factory)
+
+        def check():
+            driver = pool.acquire(timeout=5)
+            pool.release(driver)
+
+        checks = [threading.Thread(target=check) for _ in range(20)]
+        for t in checks:
+            t.start()
+        for t in checks:
+            t.join()
+        self.assertLessEqual(len(launched), 2)
+        self.assertEqual(pool.size(), len(launched))
+        pool.close()
+        self.assertTrue(all(driver.is_quit for driver in launched))
+
+    # Tests a check that waits for a driver of a full pool launches one as soon as a busy driver is recycled
+    def test_waiter_wakes_up_on_recycle(self):
+        pool = BrowserPool(self.TEST_SYSTEM, max_browsers=1, driver_factory=lambda system: FakeDriver())
+        busy = pool.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(pool.acquire(timeout=3)))
+        waiter.start()
+        pool.release(busy, recycle=True)
+        waiter.join()
+        self.assertEqual(len(acquired), 1)
+        self.assertIsNot(acquired[0], busy)
+        self.assertEqual(pool.size(), 1)
+
+    # Tests a released driver is reused with a fresh tab and a cleared state
+    def test_release_resets_driver(self):
+        pool = BrowserPool(self.TEST_SYSTEM, max_browsers=1, driver_factory=lambda system: FakeDriver())
+        driver = pool.acquire()
+        pool.release(driver)
+        self.assertIs(pool.acquire(), driver)
+        self.assertEqual(driver.window_handles, ["tab-1"])
+        self.assertEqual(driver.current_window_handle, "tab-1")
+        self.assertIn("Network.clearBrowserCookies", driver.cdp_commands)
+        self.assertIn("Network.clearBrowserCache", driver.cdp_commands)
+
+    # Tests a driver that fails to reset is closed and replaced by a new one
+    def test_release_discards_broken_driver(self):
+        pool = BrowserPool(self.TEST_SYSTEM, max_browsers=1, driver_factory=lambda system: BrokenDriver())
+        driver = pool.acquire()
+        pool.release(driver)
+        self.assertTrue(driver.is_quit)
+        self.assertEqual(pool.size(), 0)
+        self.assertIsNot(pool.acquire(), driver)
+
+    # Tests a driver is recycled after max uses
+    def test_recycle_after_max_uses(self):
+        pool = BrowserPool(self.TEST_SYSTEM, max_browsers=1, max_uses=2, driver_factory=lambda system: FakeDriver())
+        driver = pool.acquire()
+        pool.release(driver)
+        self.assertIs(pool.acquire(), driver)
+        pool.release(driver)
+        self.assertTrue(driver.is_quit)
+        self.assertIsNot(pool.acquire(), driver)
+
+    # Tests a driver that's released with recycle is closed, and idle drivers are closed by close_idle
+    def test_recycle_and_close_idle(self):
+        pool = BrowserPool(self.TEST_SYSTEM, max_browsers=2, driver_factory=lambda system: FakeDriver())
+        recycled = pool.acquire()
+        pool.release(recycled, recycle=True)
+        self.assertTrue(recycled.is_quit)
+        self.assertEqual(pool.size(), 0)
+        idle = pool.acquire()
+        busy = pool.acquire()
+        pool.release(idle)
+        self.assertEqual(pool.close_idle(), 1)
+        self.assertTrue(idle.is_quit)
+        self.assertFalse(busy.is_quit)
+        self.assertEqual(pool.size(), 1)
+
+    # Tests an idle driver that stopped responding is replaced before it's handed out
+    def test_acquire_replaces_unhealthy_driver(self):
+        pool = BrowserPool(self.TEST_SYSTEM, max_browsers=1, driver_factory=lambda system: FakeDriver())
+        crashed = pool.acquire()
+        pool.release(crashed)
+        crashed.is_crashed = True
+        self.assertIsNot(pool.acquire(), crashed)
+        self.assertTrue(crashed.is_quit)
+
+    # Tests checks get drivers that were launched with their arguments, and a full pool closes an idle driver with
+    # other arguments to launch one
+    def test_acquire_with_launch_arguments(self):
+        launched = []
+
+        def factory(system, launch_arguments=()):
+            driver = FakeDriver()
+            launched.append((driver, launch_arguments))
+            return driver
+
+        pool = BrowserPool(self.TEST_SYSTEM, max_browsers=1, driver_factory=factory)
+        plain = pool.acquire()
+        pool.release(plain)
+        self.assertIs(pool.acquire(), plain)
+        pool.release(plain)
+        filtered = pool.acquire(launch_arguments=("--host-resolver-rules=MAP * ~NOTFOUND",))
+        self.assertIsNot(filtered, plain)
+        self.assertTrue(plain.is_quit)
+        self.assertEqual(launched[-1][1], ("--host-resolver-rules=MAP * ~NOTFOUND",))
+        self.assertEqual(pool.size(), 1)
+        pool.release(filtered)
+        self.assertIs(pool.acquire(launch_arguments=["--host-resolver-rules=MAP * ~NOTFOUND"]), filtered)
+        self.assertIn("Network.setBlockedURLs", filtered.cdp_commands)
+
+    # Tests resource types are blocked by the extension at the end of the url's path, so hosts that contain an
+    # extension are not blocked, and patterns that match the checked url are left out
+    def test_blocked_resource_types(self):
+        patterns = get_blocked_url_patterns(block_resource_types=["script", "media"])
+        blocked = ["https://example.com/app.js", "https://example.com/app.js?v=2", "https://example.com/a/movie.mov"]
+        allowed = ["https://cdn.jsdelivr.net/npm/app", "https://www.movies.com", "https://example.com/app.json",
+                   "https://example.com/?file=app.jsx"]
+        for url in blocked:
+            self.assertTrue(any(matches_url_pattern(url, pattern) for pattern in patterns), url)
+        for url in allowed:
+            self.assertFalse(any(matches_url_pattern(url, pattern) for pattern in patterns), url)
+        self.assertTrue(matches_url_pattern("https://ads.doubleclick.net/x?y", "*.doubleclick.net/*"))
+        # a check of a page whose url ends with a blocked extension doesn't block the page itself
+        patterns = get_blocked_url_patterns(["*.example.com/*"], ["media"], "https://www.example.com/trailer.mov")
+        self.assertNotIn("*.mov", patterns)
+        self.assertNotIn("*.example.com/*", patterns)
+        self.assertIn("*.mov?*", patterns)
+        self.assertIn("*.mp4", patterns)
+
+    # Tests the pool raises ValueError and TypeError for invalid max browsers
+    def test_invalid_max_browsers(self):
+        for max_browsers in [0, -1]:
+            with self.assertRaises(ValueError):
+                BrowserPool(self.TEST_SYSTEM, max_browsers=max_browsers)
+        for max_browsers in [None, 1.5, "2"]:
+            with self.assertRaises(TypeError):
+                BrowserPool(self.TEST_SYSTEM, max_browsers=max_browsers)
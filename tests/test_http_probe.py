@@ -0,0 +1,180 @@
+from unittest import TestCase
+import datetime
+import http.server
+import json
+import socket
+import threading
+import time
+from unittest import mock
+import requests_mock
+import sys
+sys.path.append('..')
+import input_validator
+from http_probe import HttpConnectionPool, HttpProbe, probe_url
+from shipper import BackgroundShipper
+
+
+class ProbedHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/slow-body":
+            # every byte of the body takes longer than half of the probe's timeout
+            self.send_response(200)
+            self.send_header("Content-Length", "10")
+            self.end_headers()
+            for _ in range(10):
+                self.wfile.write(b"x")
+                self.wfile.flush()
+                time.sleep(0.3)
+            return
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/health")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        status = 200 if self.path == "/health" else 503
+        body = json.dumps({"path": self.path}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# resolve_to_localhost resolves the test hostname to the local test server
+def resolve_to_localhost(host, port, *args, **kwargs):
+    return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", port))]
+
+
+class TestHttpProbe(TestCase):
+    TEST_HOST = "probe.example.com"
+    TEST_LOGS_TOKEN = "logsLogzioTokenlogzioTokenLogzio"
+    TEST_METRICS_TOKEN = "metricsLogzioTokenlogzioTokenLog"
+    TEST_LOGZIO_LISTENER = "https://example.com"
+    TEST_FUNCTION_NAME = "test-func"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ProbedHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = "http://{}:{}".format(cls.TEST_HOST, cls.server.server_port)
+        cls.resolver = mock.patch("http_probe.socket.getaddrinfo", side_effect=resolve_to_localhost)
+        cls.resolver.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.resolver.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    # Tests the probe follows redirects, records the phases and reuses the connection of the origin
+    def test_probe_url(self):
+        connection_pool = HttpConnectionPool()
+        result = probe_url(self.base_url + "/redirect", 5, connection_pool)
+        self.assertEqual(result["status_code"], 200)
+        self.assertEqual(result["body_size.bytes"], len(json.dumps({"path": "/health"})))
+        self.assertEqual(result["connection_reused"], 0)
+        for phase in ["dns.ms", "connect.ms", "time_to_first_byte.ms", "time_to_complete.ms"]:
+            self.assertGreater(result[phase], 0)
+        self.assertEqual(result["tls.ms"], 0)
+        self.assertEqual(probe_url(self.base_url + "/health", 5, connection_pool)["connection_reused"], 1)
+        connection_pool.close()
+
+    # Tests the timeout is the time of the whole probe, and not of every socket operation
+    def test_probe_deadline(self):
+        start = time.monotonic()
+        with self.assertRaises(socket.timeout):
+            probe_url(self.base_url + "/slow-body", 0.5, HttpConnectionPool())
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    # Tests every address of the host is tried in turn, so an unreachable first address doesn't fail the probe
+    def test_probe_next_address(self):
+        def resolve(host, port, *args, **kwargs):
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.2", port))] + \
+                resolve_to_localhost(host, port)
+
+        with mock.patch("http_probe.socket.getaddrinfo", side_effect=resolve):
+            result = probe_url(self.base_url + "/health", 5, HttpConnectionPool())
+        self.assertEqual(result["status_code"], 200)
+
+    # Tests the probe sends a metrics document with the same shape as the page metrics
+    def test_monitor(self):
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            for path, up in [("/health", HttpProbe.SUCCESS), ("/down", HttpProbe.FAILURE)]:
+                probe = HttpProbe(url=self.base_url + path,
+                                  logs_token=self.TEST_LOGS_TOKEN,
+                                  metrics_token=self.TEST_METRICS_TOKEN,
+                                  logzio_region_code="us",
+                                  logzio_listener=self.TEST_LOGZIO_LISTENER,
+                                  region="",
+                                  function_name=self.TEST_FUNCTION_NAME,
+                                  system="none")
+                probe.monitor()
+                metrics_requests = [r for r in m.request_history if self.TEST_METRICS_TOKEN in r.url]
+                document = json.loads(metrics_requests[-1].text)
+                self.assertEqual(document["type"], "synthetic-monitoring")
+                self.assertEqual(document["metrics"]["up"], up)
+                self.assertEqual(document["dimensions"], {"country": "US", "region": "", "url": probe.url})
+
+    # Tests a url that can't be reached is reported as down
+    def test_monitor_unreachable(self):
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            probe = HttpProbe(url="http://{}:1/health".format(self.TEST_HOST),
+                              logs_token=self.TEST_LOGS_TOKEN,
+                              metrics_token=self.TEST_METRICS_TOKEN,
+                              logzio_region_code="us",
+                              logzio_listener=self.TEST_LOGZIO_LISTENER,
+                              region="",
+                              function_name=self.TEST_FUNCTION_NAME,
+                              system="none")
+            probe.monitor()
+            metrics_requests = [r for r in m.request_history if self.TEST_METRICS_TOKEN in r.url]
+            self.assertEqual(json.loads(metrics_requests[0].text)["metrics"], {"up": HttpProbe.FAILURE})
+
+    # Tests the logs of several probes are batched in the logs shipper, instead of being sent one request at a time
+    def test_monitor_logs_shipper(self):
+        with requests_mock.Mocker() as m, mock.patch("http_probe.post_data") as post_data:
+            m.post(requests_mock.ANY)
+            logs_shipper = BackgroundShipper(self.TEST_LOGZIO_LISTENER, self.TEST_LOGS_TOKEN)
+            timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
+            for _ in range(3):
+                HttpProbe(url="http://{}:1/health".format(self.TEST_HOST),
+                          logs_token=self.TEST_LOGS_TOKEN,
+                          metrics_token=self.TEST_METRICS_TOKEN,
+                          logzio_region_code="us",
+                          logzio_listener=self.TEST_LOGZIO_LISTENER,
+                          region="",
+                          function_name=self.TEST_FUNCTION_NAME,
+                          system="none",
+                          logs_shipper=logs_shipper).send_result(timestamp, None, ConnectionRefusedError("refused"))
+            self.assertTrue(logs_shipper.close(5))
+            post_data.assert_not_called()
+            self.assertEqual(logs_shipper.get_stats()["sent"], 3)
+            logs_requests = [r for r in m.request_history if self.TEST_LOGS_TOKEN in r.url]
+            self.assertEqual(sum(len(r.text.splitlines()) for r in logs_requests), 3)
+
+    # Tests the per url settings raise ValueError and TypeError for invalid settings
+    def test_invalid_url_settings(self):
+        self.assertTrue(input_validator.validate_url_settings({"https://example.com": {"probe": "http"}}))
+        filters = {"block": ["*/analytics.js"], "block_resource_types": ["image", "media"],
+                   "allow_hosts": ["*.example.com"]}
+        self.assertTrue(input_validator.validate_url_settings({"https://example.com": filters}))
+        invalid_settings = [{"https://example.com": {"probe": "ftp"}},
+                            {"https://example.com": {"unknown": 1}},
+                            {"https://example.com": {"block_resource_types": ["xhr"]}},
+                            {"https://example.com": {"allow_hosts": ["example.com, evil.com"]}},
+                            {"just.a.string": {"probe": "http"}}]
+        for settings in invalid_settings:
+            with self.assertRaises(ValueError):
+                input_validator.validate_url_settings(settings)
+        for settings in [["https://example.com"], {"https://example.com": "http"},
+                         {"https://example.com": {"block": "*.js"}}]:
+            with self.assertRaises(TypeError):
+                input_validator.validate_url_settings(settings)
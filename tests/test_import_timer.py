@@ -0,0 +1,22 @@
+from unittest import TestCase
+import sys
+sys.path.append('..')
+from import_timer import ImportTimer
+
+
+class TestImportTimer(TestCase):
+
+    # Tests modules that are imported for the first time are timed, and modules that were already imported are not
+    def test_import_timer(self):
+        sys.modules.pop("wave", None)
+        with ImportTimer() as import_timer:
+            import wave
+            import json
+        self.assertIn("wave", import_timer.times_ms)
+        self.assertNotIn("json", import_timer.times_ms)
+        self.assertGreaterEqual(import_timer.total_ms, import_timer.times_ms["wave"])
+        metrics = import_timer.get_metrics(top_slowest=1)
+        self.assertEqual(metrics["import_total.ms"], import_timer.total_ms)
+        self.assertEqual(len([key for key in metrics if key.startswith("import_time.")]), 1)
+        self.assertIsNotNone(wave)
+        self.assertIsNotNone(json)
@@ -4,6 +4,68 @@ import requests_mock
 import sys
 sys.path.append('..')
 from lights import LightsMonitor
+from load_time_history import LoadTimeHistory
+from browser_pool import BrowserPool
+
+
+class FakePageDriver(object):
+    """
+    Stands in for a chrome web driver that loaded a page with the given resources
+    """
+    NAVIGATION_START = 1600000000000
+
+    def __init__(self, resources_count=3, status_code=200):
+        self.resources_count = resources_count
+        self.status_code = status_code
+        self.current_url = "https://example.com/"
+        self.scripts = []
+        self.async_scripts = []
+        self.cdp_commands = []
+
+    def get(self, url):
+        self.current_url = url
+
+    def set_script_timeout(self, timeout):
+        self.script_timeout = timeout
+
+    def set_page_load_timeout(self, timeout):
+        self.page_load_timeout = timeout
+
+    def execute_async_script(self, script, *args):
+        self.async_scripts.append(args)
+        return True
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.cdp_commands.append((cmd, params))
+
+    def execute_script(self, script, *args):
+        self.scripts.append(script)
+        resources = [{"name": "https://example.com/{}.js".format(i), "initiatorType": "script",
+                      "fetchStart": 100 + i, "responseEnd": 150 + i * 10, "duration": 50 + i * 9,
+                      "transferSize": 1000} for i in range(self.resources_count)]
+        return {"navigationStart": self.NAVIGATION_START, "requestStart": self.NAVIGATION_START + 10,
+                "responseStart": self.NAVIGATION_START + 60, "domComplete": self.NAVIGATION_START + 900,
+                "readyState": "complete", "resources": resources}
+
+    def get_log(self, log_type):
+        noise = [{"message": {"method": "Network.requestWillBeSent", "params": {"type": "Document"}}},
+                 {"message": {"method": "Network.responseReceived",
+                              "params": {"type": "Script", "response": {"status": 500}}}}]
+        message = {"message": {"method": "Network.responseReceived",
+                               "params": {"type": "Document",
+                                          "response": {"status": self.status_code, "protocol": "h2",
+                                                       "remoteIPAddress": "93.184.216.34",
+                                                       "mimeType": "text/html",
+                                                       "headers": {"content-type": "text/html"}}}}}
+        return [{"message": json.dumps(entry)} for entry in noise + [message]]
+
+
+class FakeDriverPool(BrowserPool):
+    def __init__(self, driver):
+        super().__init__("none", max_browsers=1, driver_factory=lambda system: driver)
+
+    def release(self, driver, recycle=False):
+        self.recycled = recycle
 
 
 class TestLightS(TestCase):
@@ -168,4 +230,289 @@ class TestLightS(TestCase):
                                    system="none")
             lightS.monitor()
             self.assertGreater(len(m.request_history), 0)
-            self.assertIn("metrics", json.loads(m.request_history[0].text))
+            self.assertIn("metrics", json.loads(m.request_history[0].text.splitlines()[0]))
+
+    # Tests the page and resource metrics are computed from a single performance snapshot of the page
+    def test_monitor_performance_snapshot(self):
+        driver = FakePageDriver(resources_count=3)
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            lightS = LightsMonitor(url=self.TEST_URL,
+                                   logs_token=self.TEST_LOGS_TOKEN,
+                                   metrics_token=self.TEST_METRICS_TOKEN,
+                                   logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                                   logzio_listener=self.TEST_LOGZIO_LISTENER,
+                                   region="",
+                                   function_name=self.TEST_FUNCTION_NAME,
+                                   system="none",
+                                   browser_pool=FakeDriverPool(driver))
+            lightS.monitor()
+            documents = [json.loads(line) for r in m.request_history if self.TEST_METRICS_TOKEN in r.url
+                         for line in r.text.splitlines()]
+        self.assertEqual(len(driver.scripts), 1)
+        self.assertEqual(driver.async_scripts, [("load", LightsMonitor.NETWORK_IDLE_MS)])
+        self.assertEqual(driver.page_load_timeout, LightsMonitor.MAX_DOM_COMPLETE)
+        self.assertAlmostEqual(driver.script_timeout, LightsMonitor.MAX_DOM_COMPLETE, delta=0.5)
+        page = documents[0]
+        self.assertEqual(page["metrics"]["time_to_complete.ms"], 900)
+        self.assertEqual(page["metrics"]["time_to_first_byte.ms"], 50)
+        self.assertEqual(page["metrics"]["status_code"], 200)
+        self.assertEqual(page["metrics"]["up"], LightsMonitor.SUCCESS)
+        resources = [d for d in documents if "resource_name" in d["dimensions"]]
+        self.assertEqual(len(resources), 3)
+        self.assertEqual(resources[2]["metrics"]["time_to_complete.ms"], 68)
+
+    # Tests the status code is taken from the main document's response in network status code mode
+    def test_monitor_network_status_code_mode(self):
+        driver = FakePageDriver(resources_count=0, status_code=404)
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            lightS = LightsMonitor(url=self.TEST_URL,
+                                   logs_token=self.TEST_LOGS_TOKEN,
+                                   metrics_token=self.TEST_METRICS_TOKEN,
+                                   logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                                   logzio_listener=self.TEST_LOGZIO_LISTENER,
+                                   region="",
+                                   function_name=self.TEST_FUNCTION_NAME,
+                                   system="none",
+                                   browser_pool=FakeDriverPool(driver),
+                                   status_code_mode="network")
+            lightS.monitor()
+            documents = [json.loads(line) for r in m.request_history for line in r.text.splitlines()]
+        page = [d for d in documents if "metrics" in d][0]
+        self.assertEqual(page["metrics"]["status_code"], 404)
+        self.assertEqual(page["metrics"]["up"], LightsMonitor.FAILURE)
+        logs = [d["message"] for d in documents if "message" in d]
+        self.assertTrue(any("404" in log and "protocol: h2" in log for log in logs))
+
+    # Tests monitor raises ValueError for an unsupported status code mode
+    def test_monitor_invalid_status_code_mode(self):
+        with self.assertRaises(ValueError):
+            LightsMonitor(url=self.TEST_URL,
+                          logs_token=self.TEST_LOGS_TOKEN,
+                          metrics_token=self.TEST_METRICS_TOKEN,
+                          logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                          logzio_listener="",
+                          region="",
+                          function_name=self.TEST_FUNCTION_NAME,
+                          system="none",
+                          status_code_mode="cdp")
+
+    # Tests monitor raises ValueError for an unsupported completion event
+    def test_monitor_invalid_completion_event(self):
+        with self.assertRaises(ValueError):
+            LightsMonitor(url=self.TEST_URL,
+                          logs_token=self.TEST_LOGS_TOKEN,
+                          metrics_token=self.TEST_METRICS_TOKEN,
+                          logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                          logzio_listener="",
+                          region="",
+                          function_name=self.TEST_FUNCTION_NAME,
+                          system="none",
+                          completion_event="readystatechange")
+
+    # Tests the aggregate resource metrics mode sends summaries per resource type and origin, and documents only for
+    # the slowest resources
+    def test_monitor_aggregate_resource_metrics(self):
+        driver = FakePageDriver(resources_count=20)
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            lightS = LightsMonitor(url=self.TEST_URL,
+                                   logs_token=self.TEST_LOGS_TOKEN,
+                                   metrics_token=self.TEST_METRICS_TOKEN,
+                                   logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                                   logzio_listener=self.TEST_LOGZIO_LISTENER,
+                                   region="",
+                                   function_name=self.TEST_FUNCTION_NAME,
+                                   system="none",
+                                   browser_pool=FakeDriverPool(driver),
+                                   resource_metrics="aggregate",
+                                   top_slowest_resources=3)
+            lightS.monitor()
+            documents = [json.loads(line) for r in m.request_history if self.TEST_METRICS_TOKEN in r.url
+                         for line in r.text.splitlines()]
+        by_type = [d for d in documents
+                   if "resource_type" in d["dimensions"] and "resource_name" not in d["dimensions"]]
+        self.assertEqual(len(by_type), 1)
+        self.assertEqual(by_type[0]["dimensions"]["resource_type"], "script")
+        self.assertEqual(by_type[0]["metrics"]["count"], 20)
+        self.assertEqual(by_type[0]["metrics"]["time_to_complete_max.ms"], 221)
+        self.assertEqual(by_type[0]["metrics"]["transfer_size_sum.bytes"], 20000)
+        by_origin = [d for d in documents if "resource_origin" in d["dimensions"]]
+        self.assertEqual([d["dimensions"]["resource_origin"] for d in by_origin], ["https://example.com"])
+        resources = [d for d in documents if "resource_name" in d["dimensions"]]
+        self.assertEqual([d["metrics"]["time_to_complete.ms"] for d in resources], [221, 212, 203])
+
+    # Tests monitor raises ValueError for an unsupported resource metrics mode
+    def test_monitor_invalid_resource_metrics(self):
+        with self.assertRaises(ValueError):
+            LightsMonitor(url=self.TEST_URL,
+                          logs_token=self.TEST_LOGS_TOKEN,
+                          metrics_token=self.TEST_METRICS_TOKEN,
+                          logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                          logzio_listener="",
+                          region="",
+                          function_name=self.TEST_FUNCTION_NAME,
+                          system="none",
+                          resource_metrics="none")
+
+    # Tests the blocked url patterns and resource types are blocked before the page is loaded, and the browser of a
+    # check with allowed hosts is launched with host resolver rules
+    def test_monitor_request_filters(self):
+        driver = FakePageDriver(resources_count=0)
+        launches = []
+
+        class LaunchRecordingPool(FakeDriverPool):
+            def acquire(self, timeout=None, launch_arguments=()):
+                launches.append(launch_arguments)
+                return driver
+
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            lightS = LightsMonitor(url=self.TEST_URL,
+                                   logs_token=self.TEST_LOGS_TOKEN,
+                                   metrics_token=self.TEST_METRICS_TOKEN,
+                                   logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                                   logzio_listener=self.TEST_LOGZIO_LISTENER,
+                                   region="",
+                                   function_name=self.TEST_FUNCTION_NAME,
+                                   system="none",
+                                   browser_pool=LaunchRecordingPool(driver),
+                                   block=["*.doubleclick.net/*"],
+                                   block_resource_types=["font"],
+                                   allow_hosts=["*.example.com"])
+            lightS.monitor()
+        blocked = [params["urls"] for cmd, params in driver.cdp_commands if cmd == "Network.setBlockedURLs"]
+        self.assertEqual(len(blocked), 1)
+        self.assertIn("*.doubleclick.net/*", blocked[0])
+        self.assertIn("*.woff", blocked[0])
+        self.assertIn("*.woff?*", blocked[0])
+        self.assertEqual(launches, [("--host-resolver-rules=MAP * ~NOTFOUND, EXCLUDE *.example.com, "
+                                     "EXCLUDE example.com",)])
+
+    # Tests the page timeout of the url is used for the page load, and the load time is added to the history
+    def test_monitor_max_dom_complete(self):
+        driver = FakePageDriver(resources_count=0)
+        history = LoadTimeHistory()
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            lightS = LightsMonitor(url=self.TEST_URL,
+                                   logs_token=self.TEST_LOGS_TOKEN,
+                                   metrics_token=self.TEST_METRICS_TOKEN,
+                                   logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                                   logzio_listener=self.TEST_LOGZIO_LISTENER,
+                                   region="",
+                                   function_name=self.TEST_FUNCTION_NAME,
+                                   system="none",
+                                   browser_pool=FakeDriverPool(driver),
+                                   max_dom_complete=12.0,
+                                   load_time_history=history)
+            lightS.monitor()
+        self.assertEqual(driver.page_load_timeout, 12.0)
+        self.assertAlmostEqual(driver.script_timeout, 12.0, delta=0.5)
+        self.assertEqual(history.get_timeout(self.TEST_URL, 5.0, factor=2, min_samples=1), 1.8)
+        for max_dom_complete in [0.0, -1.0]:
+            with self.assertRaises(ValueError):
+                LightsMonitor(url=self.TEST_URL,
+                              logs_token=self.TEST_LOGS_TOKEN,
+                              metrics_token=self.TEST_METRICS_TOKEN,
+                              logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                              logzio_listener="",
+                              region="",
+                              function_name=self.TEST_FUNCTION_NAME,
+                              system="none",
+                              max_dom_complete=max_dom_complete)
+
+    # Tests the time of every phase of the check is sent in a self metrics document, next to the supervision metric
+    def test_monitor_phase_timings(self):
+        driver = FakePageDriver(resources_count=2)
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            lightS = LightsMonitor(url=self.TEST_URL,
+                                   logs_token=self.TEST_LOGS_TOKEN,
+                                   metrics_token=self.TEST_METRICS_TOKEN,
+                                   logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                                   logzio_listener=self.TEST_LOGZIO_LISTENER,
+                                   region="",
+                                   function_name=self.TEST_FUNCTION_NAME,
+                                   system="none",
+                                   browser_pool=FakeDriverPool(driver))
+            lightS.monitor()
+            documents = [json.loads(line) for r in m.request_history if self.TEST_METRICS_TOKEN in r.url
+                         for line in r.text.splitlines()]
+        supervision = [d for d in documents if "metrics_sent" in d["metrics"]]
+        self.assertEqual(supervision[0]["metrics"]["metrics_sent"], 3)
+        self_documents = [d for d in documents if d["type"] == "synthetic-monitoring-self"]
+        self.assertEqual(len(self_documents), 1)
+        self.assertEqual(self_documents[0]["dimensions"]["url"], self.TEST_URL)
+        phases = self_documents[0]["metrics"]
+        for phase in ["driver_launch", "get", "dom_wait", "collection", "status_code", "serialization", "send",
+                      "driver_release", "total"]:
+            self.assertGreaterEqual(phases["{}.ms".format(phase)], 0)
+        self.assertGreaterEqual(phases["collection.ms"], phases["status_code.ms"])
+
+    # Tests the peak memory of the check is sent in the self metrics document, and the browser is recycled when the
+    # function's memory is above the threshold
+    def test_monitor_memory_threshold(self):
+        for memory_threshold_mb, is_recycled in [(None, False), (1024 * 1024, False), (1, True)]:
+            driver = FakePageDriver(resources_count=0)
+            pool = FakeDriverPool(driver)
+            with requests_mock.Mocker() as m:
+                m.post(requests_mock.ANY)
+                lightS = LightsMonitor(url=self.TEST_URL,
+                                       logs_token=self.TEST_LOGS_TOKEN,
+                                       metrics_token=self.TEST_METRICS_TOKEN,
+                                       logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                                       logzio_listener=self.TEST_LOGZIO_LISTENER,
+                                       region="",
+                                       function_name=self.TEST_FUNCTION_NAME,
+                                       system="none",
+                                       browser_pool=pool,
+                                       memory_threshold_mb=memory_threshold_mb)
+                lightS.monitor()
+                documents = [json.loads(line) for r in m.request_history if self.TEST_METRICS_TOKEN in r.url
+                             for line in r.text.splitlines()]
+            self.assertEqual(pool.recycled, is_recycled)
+            metrics = [d for d in documents if d["type"] == "synthetic-monitoring-self"][0]["metrics"]
+            self.assertGreater(metrics["python_peak_rss.mb"], 0)
+            self.assertGreater(metrics["total_peak_rss.mb"], 0)
+            # the fake driver has no processes to measure
+            self.assertNotIn("chrome_peak_rss.mb", metrics)
+        for memory_threshold_mb, error in [(0, ValueError), (-1, ValueError), ("512", TypeError)]:
+            with self.assertRaises(error):
+                LightsMonitor(url=self.TEST_URL,
+                              logs_token=self.TEST_LOGS_TOKEN,
+                              metrics_token=self.TEST_METRICS_TOKEN,
+                              logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                              logzio_listener="",
+                              region="",
+                              function_name=self.TEST_FUNCTION_NAME,
+                              system="none",
+                              memory_threshold_mb=memory_threshold_mb)
+
+    # Tests the logs of the check are added to the logs shipper, instead of being sent in their own requests
+    def test_monitor_logs_shipper(self):
+        logs = []
+
+        class ListShipper(object):
+            def add(self, document):
+                logs.append(document)
+                return True
+
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            lightS = LightsMonitor(url=self.TEST_URL,
+                                   logs_token=self.TEST_LOGS_TOKEN,
+                                   metrics_token=self.TEST_METRICS_TOKEN,
+                                   logzio_region_code=self.TEST_LOGZIO_REGION_CODE,
+                                   logzio_listener=self.TEST_LOGZIO_LISTENER,
+                                   region="",
+                                   function_name=self.TEST_FUNCTION_NAME,
+                                   system="none",
+                                   browser_pool=FakeDriverPool(FakePageDriver(resources_count=0)),
+                                   memory_threshold_mb=1,
+                                   logs_shipper=ListShipper())
+            lightS.monitor()
+            self.assertEqual([r for r in m.request_history if self.TEST_LOGS_TOKEN in r.url], [])
+        self.assertTrue(any("above the threshold" in log["message"] for log in logs))
+        self.assertEqual(logs[0]["url"], self.TEST_URL)
@@ -0,0 +1,34 @@
+from unittest import TestCase
+import sys
+sys.path.append('..')
+from load_time_history import LoadTimeHistory
+
+
+class TestLoadTimeHistory(TestCase):
+    TEST_URL = "https://example.com"
+
+    # Tests the default timeout is used until there are enough load times of the url
+    def test_default_timeout(self):
+        history = LoadTimeHistory()
+        for _ in range(4):
+            history.add(self.TEST_URL, 1000)
+        self.assertEqual(history.get_timeout(self.TEST_URL, 5.0, min_samples=5), 5.0)
+        self.assertEqual(history.get_timeout("https://other.example.com", 5.0), 5.0)
+
+    # Tests the timeout is the p99 load time multiplied by the factor, between the min and max timeouts
+    def test_adaptive_timeout(self):
+        history = LoadTimeHistory(max_samples=100)
+        for load_time in range(100, 1100, 10):
+            history.add(self.TEST_URL, load_time)
+        self.assertAlmostEqual(history.get_timeout(self.TEST_URL, 5.0, factor=2), 2.16)
+        self.assertEqual(history.get_timeout(self.TEST_URL, 5.0, factor=100, max_timeout=30), 30)
+        self.assertEqual(history.get_timeout(self.TEST_URL, 5.0, factor=0.1, min_timeout=1), 1)
+
+    # Tests only the last max_samples load times are kept
+    def test_max_samples(self):
+        history = LoadTimeHistory(max_samples=5)
+        for _ in range(5):
+            history.add(self.TEST_URL, 20000)
+        for _ in range(5):
+            history.add(self.TEST_URL, 1000)
+        self.assertEqual(history.get_timeout(self.TEST_URL, 5.0, factor=3), 3.0)
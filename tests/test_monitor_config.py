@@ -0,0 +1,66 @@
+from unittest import TestCase, mock
+import dataclasses
+import sys
+sys.path.append('..')
+import input_validator
+from monitor_config import MonitorConfig, create_monitor_config, get_monitor_config
+from lights import LightsMonitor
+from http_probe import HttpProbe
+
+
+class TestMonitorConfig(TestCase):
+    TEST_URL = "https://example.com"
+    TEST_ENVIRONMENT = {"LOGZIO_LOGS_TOKEN": "logsLogzioTokenlogzioTokenLogzio",
+                        "LOGZIO_METRICS_TOKEN": "metricsLogzioTokenlogzioTokenLog",
+                        "LOGZIO_REGION": "eu",
+                        "AWS_REGION": "us-east-1",
+                        "AWS_LAMBDA_FUNCTION_NAME": "test-func",
+                        "SYSTEM": "aws",
+                        "GZIP_COMPRESSION_LEVEL": "6"}
+
+    # Tests the config is parsed from the environment, and can't be changed or extended afterwards
+    def test_parse_config(self):
+        config = get_monitor_config(self.TEST_ENVIRONMENT)
+        self.assertEqual(config.logzio_listener, "https://listener-eu.logz.io:8071")
+        self.assertEqual(config.country_code, "US")
+        self.assertEqual(config.compression_level, 6)
+        self.assertEqual(config.completion_event, LightsMonitor.COMPLETION_EVENT_LOAD)
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            config.region = "eu-west-1"
+        self.assertFalse(hasattr(config, "__dict__"))
+        self.assertEqual(config.get_monitor_args()["config"], config)
+
+    # Tests the config is parsed once for the same environment, and parsed again when the environment changed
+    def test_config_cache(self):
+        config = get_monitor_config(self.TEST_ENVIRONMENT)
+        with mock.patch("monitor_config.parse_monitor_config") as parse:
+            self.assertIs(get_monitor_config(dict(self.TEST_ENVIRONMENT)), config)
+            parse.assert_not_called()
+        changed = get_monitor_config(dict(self.TEST_ENVIRONMENT, LOGZIO_REGION="uk"))
+        self.assertIsNot(changed, config)
+        self.assertEqual(changed.logzio_listener, "https://listener-uk.logz.io:8071")
+
+    # Tests invalid settings raise ValueError and TypeError when the config is created
+    def test_invalid_config(self):
+        with self.assertRaises(ValueError):
+            get_monitor_config(dict(self.TEST_ENVIRONMENT, LOGZIO_LOGS_TOKEN="invalid"))
+        with self.assertRaises(ValueError):
+            get_monitor_config(dict(self.TEST_ENVIRONMENT, COMPLETION_EVENT="idle"))
+        with self.assertRaises(TypeError):
+            create_monitor_config(None, "metricsLogzioTokenlogzioTokenLog", "", "", "us-east-1", "test-func", "aws")
+
+    # Tests checks that are created with a config validate only their url and its own settings
+    def test_checks_skip_shared_validation(self):
+        config = get_monitor_config(self.TEST_ENVIRONMENT)
+        with mock.patch("input_validator.is_valid_logzio_token", wraps=input_validator.is_valid_logzio_token) as \
+                is_valid_token:
+            LightsMonitor(url=self.TEST_URL, **config.get_monitor_args(), **config.get_browser_args())
+            HttpProbe(url=self.TEST_URL, **config.get_monitor_args())
+            is_valid_token.assert_not_called()
+            LightsMonitor(url=self.TEST_URL, **dict(config.get_monitor_args(), config=None))
+            self.assertEqual(is_valid_token.call_count, 2)
+        with self.assertRaises(ValueError):
+            LightsMonitor(url="just.a.string", **config.get_monitor_args())
+        with self.assertRaises(ValueError):
+            HttpProbe(url="just.a.string", **config.get_monitor_args())
+        self.assertIsInstance(config, MonitorConfig)
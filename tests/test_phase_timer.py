@@ -0,0 +1,30 @@
+from unittest import TestCase
+import time
+import sys
+sys.path.append('..')
+from phase_timer import PhaseTimer
+
+
+class TestPhaseTimer(TestCase):
+
+    # Tests the phases are timed in ms, and a phase that runs more than once adds up
+    def test_phases(self):
+        timer = PhaseTimer()
+        with timer.phase("get"):
+            time.sleep(0.05)
+        for _ in range(2):
+            with timer.phase("send"):
+                time.sleep(0.02)
+        timer.add("send", 10)
+        metrics = timer.get_metrics()
+        self.assertGreaterEqual(metrics["get.ms"], 50)
+        self.assertGreaterEqual(metrics["send.ms"], 50)
+        self.assertGreaterEqual(metrics["total.ms"], metrics["get.ms"] + metrics["send.ms"] - 10)
+
+    # Tests a phase is timed when its code raises
+    def test_phase_raises(self):
+        timer = PhaseTimer()
+        with self.assertRaises(ValueError):
+            with timer.phase("get"):
+                raise ValueError("failed")
+        self.assertIn("get.ms", timer.get_metrics())
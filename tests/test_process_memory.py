@@ -0,0 +1,39 @@
+from unittest import TestCase
+from unittest import mock
+import os
+import subprocess
+import sys
+sys.path.append('..')
+import process_memory
+from process_memory import PeakMemorySampler, get_peak_rss_mb, get_process_rss_mb, get_process_tree, \
+    get_process_tree_rss_mb
+
+
+class TestProcessMemory(TestCase):
+
+    # Tests the memory of the current process is measured, and its tree uses at least as much memory
+    def test_process_memory(self):
+        rss_mb = get_process_rss_mb(os.getpid())
+        self.assertGreater(rss_mb, 0)
+        self.assertGreaterEqual(get_process_tree_rss_mb(os.getpid()), rss_mb)
+        self.assertIsNone(get_process_tree_rss_mb(None))
+        self.assertGreaterEqual(get_peak_rss_mb(), rss_mb)
+
+    # Tests the process tree has the process's children, whether or not the kernel has children files
+    def test_process_tree(self):
+        child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(10)"])
+        self.addCleanup(child.wait)
+        self.addCleanup(child.kill)
+        self.assertIn(child.pid, get_process_tree(os.getpid()))
+        with mock.patch("process_memory._get_children", return_value=None):
+            self.assertIn(child.pid, get_process_tree(os.getpid()))
+        self.assertEqual(get_process_tree(2 ** 22 + 1), [2 ** 22 + 1])
+
+    # Tests the sampler samples on start and on stop, keeps the peak of every measurement, and skips measurements that
+    # can't be taken
+    def test_peak_memory_sampler(self):
+        samples = iter([30, 10])
+        with PeakMemorySampler({"sampled": lambda: next(samples), "unavailable": lambda: None,
+                                "failing": lambda: 1 / 0}, interval=60) as sampler:
+            pass
+        self.assertEqual(sampler.peaks_mb, {"sampled": 30})
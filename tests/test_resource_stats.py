@@ -0,0 +1,39 @@
+from unittest import TestCase
+import sys
+sys.path.append('..')
+from resource_stats import get_resource_origin, get_slowest_resources, percentile, summarize_resources
+
+
+# create_resource creates a resource entry of the performance snapshot
+def create_resource(name, initiator_type, duration, transfer_size=100):
+    return {"name": name, "initiatorType": initiator_type, "fetchStart": 10, "responseEnd": 10 + duration,
+            "duration": duration, "transferSize": transfer_size}
+
+
+class TestResourceStats(TestCase):
+
+    # Tests the nearest-rank percentiles
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 90), 7)
+
+    # Tests the resources are summarized by their type and by their origin
+    def test_summarize_resources(self):
+        resources = [create_resource("https://example.com/a.js", "script", 30),
+                     create_resource("https://example.com/b.js", "script", 10, transfer_size=None),
+                     create_resource("https://cdn.example.com:8443/c.css", "link", 20),
+                     create_resource("data:image/png;base64,AAAA", "img", 1, transfer_size=0)]
+        by_type = summarize_resources(resources, lambda resource: resource["initiatorType"])
+        self.assertEqual(set(by_type), {"script", "link", "img"})
+        self.assertEqual(by_type["script"]["count"], 2)
+        self.assertEqual(by_type["script"]["time_to_complete_sum.ms"], 40)
+        self.assertEqual(by_type["script"]["time_to_complete_p50.ms"], 10)
+        self.assertEqual(by_type["script"]["time_to_complete_max.ms"], 30)
+        self.assertEqual(by_type["script"]["transfer_size_sum.bytes"], 100)
+        by_origin = summarize_resources(resources, get_resource_origin)
+        self.assertEqual(set(by_origin), {"https://example.com", "https://cdn.example.com:8443", "data:"})
+        slowest = get_slowest_resources(resources, 2)
+        self.assertEqual([resource["name"] for resource in slowest],
+                         ["https://example.com/a.js", "https://cdn.example.com:8443/c.css"])
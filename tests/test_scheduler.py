@@ -0,0 +1,88 @@
+from unittest import TestCase
+import threading
+import time
+import sys
+sys.path.append('..')
+from scheduler import WorkerScheduler, get_max_concurrency, get_run_deadline, SAFETY_MARGIN_SECONDS
+
+
+class FakeContext(object):
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+class TestScheduler(TestCase):
+
+    # Tests the concurrency is derived from the memory size, unless it's set explicitly
+    def test_get_max_concurrency(self):
+        self.assertEqual(get_max_concurrency(128), 1)
+        self.assertEqual(get_max_concurrency(512), 2)
+        self.assertEqual(get_max_concurrency(2048), 9)
+        self.assertEqual(get_max_concurrency(512, 5), 5)
+        with self.assertRaises(ValueError):
+            get_max_concurrency(512, 0)
+        with self.assertRaises(TypeError):
+            get_max_concurrency(512, "5")
+
+    # Tests all the items are processed, with no more than max_workers tasks running at once
+    def test_run_is_bounded(self):
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+        done = []
+
+        def task(item):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+                done.append(item)
+
+        stats = WorkerScheduler(3).run(task, range(30))
+        self.assertEqual(sorted(done), list(range(30)))
+        self.assertLessEqual(peak[0], 3)
+        self.assertEqual(stats.total, 30)
+        self.assertEqual(stats.completed, 30)
+        self.assertEqual(stats.failed, 0)
+
+    # Tests a failing task is counted and doesn't stop the rest of the run
+    def test_run_records_failures(self):
+        def task(item):
+            if item % 2:
+                raise ValueError("invalid item {}".format(item))
+
+        stats = WorkerScheduler(2).run(task, range(10))
+        self.assertEqual(stats.completed, 5)
+        self.assertEqual(stats.failed, 5)
+        self.assertTrue(all(isinstance(e, ValueError) for e in stats.errors))
+
+    # Tests the deadline is the function's remaining time minus the reserved time, and is unknown without a context
+    # or an end time
+    def test_get_run_deadline(self):
+        deadline = get_run_deadline(FakeContext(60000), reserved_seconds=10)
+        self.assertAlmostEqual(deadline - time.monotonic(), 50 - SAFETY_MARGIN_SECONDS, delta=0.5)
+        self.assertIsNone(get_run_deadline("context"))
+        # a shard's end time that is before the function's timeout moves the deadline earlier
+        deadline = get_run_deadline(FakeContext(60000), reserved_seconds=10, end_time=time.time() + 30)
+        self.assertAlmostEqual(deadline - time.monotonic(), 20 - SAFETY_MARGIN_SECONDS, delta=0.5)
+        deadline = get_run_deadline("context", end_time=time.time() + 30)
+        self.assertAlmostEqual(deadline - time.monotonic(), 30 - SAFETY_MARGIN_SECONDS, delta=0.5)
+
+    # Tests items whose time budget ends after the deadline are skipped
+    def test_run_skips_items_after_deadline(self):
+        done = []
+
+        def task(item):
+            time.sleep(0.2)
+            done.append(item)
+
+        deadline = time.monotonic() + 0.6
+        stats = WorkerScheduler(1).run(task, range(10), deadline=deadline, get_budget=lambda item: 0.3)
+        self.assertEqual(done, [0, 1])
+        self.assertEqual(stats.completed, 2)
+        self.assertEqual(stats.skipped, 8)
@@ -0,0 +1,151 @@
+from unittest import TestCase
+import http.server
+import json
+import os
+import socket
+import threading
+import time
+from unittest import mock
+import requests_mock
+import sys
+sys.path.append('..')
+sys.path.append('../aws')
+import input_validator
+import lambda_function
+from sharding import InProcessInvoker, LambdaInvoker, ShardCoordinator, get_function_timeout, get_shard, \
+    get_shard_end_time, split_into_shards
+from scheduler import SAFETY_MARGIN_SECONDS
+
+
+class HealthHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+# resolve_to_localhost resolves the test hostnames to the local test server
+def resolve_to_localhost(host, port, *args, **kwargs):
+    return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", port))]
+
+
+class TestSharding(TestCase):
+    TEST_URLS = ["https://site{}.example.com/health".format(i) for i in range(40)]
+
+    # Tests every url lands in the same shard on every run, and the shards keep the order of the urls
+    def test_split_into_shards(self):
+        shards = split_into_shards(self.TEST_URLS, 4)
+        self.assertEqual(sorted(url for shard in shards for url in shard), sorted(self.TEST_URLS))
+        self.assertEqual(split_into_shards(list(reversed(self.TEST_URLS)), 4),
+                         [list(reversed(shard)) for shard in shards])
+        for index, shard in enumerate(shards):
+            self.assertTrue(all(get_shard(url, 4) == index for url in shard))
+        self.assertEqual(split_into_shards(self.TEST_URLS, 1), [self.TEST_URLS])
+
+    # Tests the coordinator invokes a worker per shard and collects the stats of every shard
+    def test_coordinator(self):
+        events = []
+
+        def handler(event, context):
+            events.append(event)
+            if event["shard"]["index"] == 1:
+                raise RuntimeError("worker timed out")
+            urls = event["shard"]["urls"]
+            return {"total": len(urls), "completed": len(urls) - 1, "failed": 1, "skipped": 0}
+
+        stats = ShardCoordinator(InProcessInvoker(handler), shard_count=3, max_parallel=2).run(self.TEST_URLS)
+        self.assertEqual(sorted(event["shard"]["index"] for event in events), [0, 1, 2])
+        self.assertEqual([shard_stats["shard"] for shard_stats in stats], [0, 1, 2])
+        self.assertEqual(sum(shard_stats["urls"] for shard_stats in stats), len(self.TEST_URLS))
+        self.assertEqual(stats[1]["error"], "worker timed out")
+        self.assertEqual(stats[1]["completed"], 0)
+        self.assertEqual(stats[0]["completed"], stats[0]["urls"] - 1)
+        self.assertIsNone(stats[0]["error"])
+
+    # Tests the workers get the coordinator's end time, and a worker that starts after it skips its urls
+    def test_shard_end_time(self):
+        context = mock.Mock(get_remaining_time_in_millis=lambda: 60000)
+        end_time = get_shard_end_time(context, reserved_seconds=10)
+        self.assertAlmostEqual(end_time - time.time(), 50 - SAFETY_MARGIN_SECONDS, delta=0.5)
+        self.assertIsNone(get_shard_end_time("context"))
+        events = []
+
+        def handler(event, context):
+            events.append(event)
+            return {}
+
+        ShardCoordinator(InProcessInvoker(handler), shard_count=2, end_time=end_time).run(self.TEST_URLS)
+        self.assertTrue(all(event["shard"]["end_time"] == end_time for event in events))
+        environment = {"LOGZIO_METRICS_TOKEN": "metricsLogzioTokenlogzioTokenLog",
+                       "LOGZIO_LOGS_TOKEN": "logsLogzioTokenlogzioTokenLogzio",
+                       "URLS": self.TEST_URLS[0],
+                       "AWS_LAMBDA_FUNCTION_NAME": "test-func",
+                       "LOGZIO_REGION": "us",
+                       "AWS_REGION": "us-east-1",
+                       "SYSTEM": "none",
+                       "DEFAULT_PROBE": "http",
+                       "SPOOL_DIR": ""}
+        with mock.patch.dict(os.environ, environment), requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            event = {"shard": {"index": 0, "count": 1, "urls": self.TEST_URLS[:3], "end_time": time.time() - 1}}
+            result = lambda_function.lambda_handler(event, context)
+        self.assertEqual(result["skipped"], 3)
+
+    # Tests the handler in coordinator mode checks every shard in a worker invocation of the handler
+    def test_handler_coordinator(self):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), HealthHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        urls = ["http://site{}.example.com:{}/health".format(i, server.server_port) for i in range(6)]
+        environment = {"LOGZIO_METRICS_TOKEN": "metricsLogzioTokenlogzioTokenLog",
+                       "LOGZIO_LOGS_TOKEN": "logsLogzioTokenlogzioTokenLogzio",
+                       "URLS": ",".join(urls),
+                       "AWS_LAMBDA_FUNCTION_NAME": "test-func",
+                       "LOGZIO_REGION": "us",
+                       "AWS_REGION": "us-east-1",
+                       "SYSTEM": "none",
+                       "DEFAULT_PROBE": "http",
+                       "SPOOL_DIR": "",
+                       "SHARD_COUNT": "3"}
+        try:
+            with mock.patch.dict(os.environ, environment), \
+                    mock.patch("http_probe.socket.getaddrinfo", side_effect=resolve_to_localhost), \
+                    requests_mock.Mocker() as m:
+                m.post(requests_mock.ANY)
+                invoker = InProcessInvoker(lambda_function.lambda_handler)
+                result = lambda_function.run_coordinator(invoker, urls, 3, 3, "https://example.com",
+                                                         environment["LOGZIO_METRICS_TOKEN"], None, 5,
+                                                         "us-east-1", "none", "test-func")
+                documents = [json.loads(line) for r in m.request_history for line in r.text.splitlines()]
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(sum(shard_stats["completed"] for shard_stats in result["shards"]), len(urls))
+        checked = [d["dimensions"]["url"] for d in documents if "url" in d.get("dimensions", {})]
+        self.assertEqual(sorted(checked), sorted(urls))
+        shard_documents = [d for d in documents if "shard" in d.get("dimensions", {})]
+        self.assertEqual(len(shard_documents), len(result["shards"]))
+
+    # Tests the shard count raises ValueError and TypeError for invalid counts
+    def test_invalid_shard_count(self):
+        with self.assertRaises(ValueError):
+            input_validator.is_valid_shard_count(0)
+        with self.assertRaises(TypeError):
+            input_validator.is_valid_shard_count("3")
+
+    # Tests the lambda client waits for the workers for up to the function's timeout, and doesn't retry invocations
+    def test_lambda_invoker_client(self):
+        boto3 = mock.Mock()
+        botocore_config = mock.Mock()
+        modules = {"boto3": boto3, "botocore": mock.Mock(), "botocore.config": botocore_config}
+        with mock.patch.dict(sys.modules, modules):
+            LambdaInvoker("worker", read_timeout=420)
+        botocore_config.Config.assert_called_once_with(read_timeout=420, retries={"max_attempts": 0})
+        boto3.client.assert_called_once_with("lambda", config=botocore_config.Config.return_value)
+        context = mock.Mock(get_remaining_time_in_millis=lambda: 419500)
+        self.assertEqual(get_function_timeout(context), 420)
+        self.assertEqual(get_function_timeout("context"), 900)
@@ -0,0 +1,187 @@
+from unittest import TestCase
+import gzip
+import json
+import shutil
+import tempfile
+from unittest import mock
+import requests
+import requests_mock
+import sys
+sys.path.append('..')
+import shipper
+from shipper import BackgroundShipper, BulkShipper
+from spool import Spool
+
+
+class TestShipper(TestCase):
+    TEST_LOGZIO_LISTENER = "https://example.com"
+    TEST_METRICS_TOKEN = "metricsLogzioTokenlogzioTokenLog"
+
+    # Tests the documents are buffered and sent as one newline-delimited bulk
+    def test_flush_sends_single_bulk(self):
+        with requests_mock.Mocker() as m:
+            m.post("{}/?token={}".format(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN))
+            bulk_shipper = BulkShipper(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN)
+            for i in range(150):
+                self.assertTrue(bulk_shipper.add({"metrics": {"index": i}}))
+            self.assertEqual(len(m.request_history), 0)
+            self.assertTrue(bulk_shipper.flush())
+            self.assertEqual(len(m.request_history), 1)
+            documents = [json.loads(line) for line in m.request_history[0].text.splitlines()]
+            self.assertEqual([d["metrics"]["index"] for d in documents], list(range(150)))
+            self.assertTrue(bulk_shipper.flush())
+            self.assertEqual(len(m.request_history), 1)
+
+    # Tests a bulk is sent when it reaches the max bulk size, and no bulk is bigger than the max size
+    def test_bulks_are_bounded(self):
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            bulk_shipper = BulkShipper(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN, max_bulk_size=1024)
+            for i in range(100):
+                bulk_shipper.add({"metrics": {"index": i}, "padding": "x" * 50})
+            bulk_shipper.flush()
+            self.assertGreater(len(m.request_history), 1)
+            self.assertTrue(all(len(r.body) <= 1024 for r in m.request_history))
+            lines = [line for r in m.request_history for line in r.body.splitlines()]
+            self.assertEqual(len(lines), 100)
+
+    # Tests documents are serialized with orjson when it's installed, and with json otherwise or when orjson can't
+    # serialize them
+    def test_serialize_document(self):
+        document = {"metrics": {"load_time.ms": 1.5}, "dimensions": {"url": "https://example.com"}}
+        self.assertEqual(json.loads(shipper.serialize_document(document)), document)
+        with mock.patch("shipper.orjson", None):
+            self.assertEqual(shipper.serialize_document(document), json.dumps(document).encode("utf-8"))
+        # orjson rejects integers bigger than 64 bits, json doesn't
+        big_document = {"metrics": {"bytes": 2 ** 70}}
+        self.assertEqual(json.loads(shipper.serialize_document(big_document)), big_document)
+
+    # Tests flush returns False when the listener rejects the bulk
+    def test_flush_rejected(self):
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY, status_code=500)
+            bulk_shipper = BulkShipper(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN)
+            bulk_shipper.add({"metrics": {"up": 1}})
+            self.assertFalse(bulk_shipper.flush())
+
+    # Tests the bulk is gzip compressed when a compression level is set
+    def test_gzip_bulk(self):
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            bulk_shipper = BulkShipper(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN, compression_level=6)
+            for i in range(50):
+                bulk_shipper.add({"metrics": {"time_to_complete.ms": i}, "dimensions": {"url": "https://example.com"}})
+            bulk_shipper.flush()
+            request = m.request_history[0]
+            self.assertEqual(request.headers["Content-Encoding"], "gzip")
+            body = gzip.decompress(request.body)
+            self.assertEqual(len(body.splitlines()), 50)
+            self.assertLess(len(request.body), len(body))
+
+    # Tests all the shippers share the same session
+    def test_shared_session(self):
+        self.assertIs(shipper.get_session(), shipper.get_session())
+
+    # Tests the background shipper sends all the queued documents before flush returns
+    def test_background_flush(self):
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            background_shipper = BackgroundShipper(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN)
+            for i in range(200):
+                self.assertTrue(background_shipper.add({"metrics": {"index": i}}))
+            self.assertTrue(background_shipper.close(timeout=5))
+            lines = [line for r in m.request_history for line in r.text.splitlines()]
+            self.assertEqual(len(lines), 200)
+            self.assertEqual(background_shipper.get_stats(),
+                             {"sent": 200, "retried": 0, "spooled": 0, "dropped": 0, "pending": 0})
+
+    # Tests bulks that failed with 429, 5xx or connection errors are retried
+    def test_background_retry(self):
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY, [{"status_code": 503},
+                                       {"exc": requests.exceptions.ConnectionError},
+                                       {"status_code": 429},
+                                       {"status_code": 200}])
+            background_shipper = BackgroundShipper(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN,
+                                                   backoff_seconds=0.01)
+            background_shipper.add({"metrics": {"up": 1}})
+            self.assertTrue(background_shipper.close(timeout=5))
+            self.assertEqual(len(m.request_history), 4)
+            stats = background_shipper.get_stats()
+            self.assertEqual(stats["sent"], 1)
+            self.assertEqual(stats["retried"], 3)
+            self.assertEqual(stats["dropped"], 0)
+
+    # Tests bulks are dropped when the listener rejects them, or when they run out of retries
+    def test_background_drop(self):
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY, status_code=400)
+            background_shipper = BackgroundShipper(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN)
+            background_shipper.add({"metrics": {"up": 1}})
+            self.assertTrue(background_shipper.close(timeout=5))
+            self.assertEqual(len(m.request_history), 1)
+            self.assertEqual(background_shipper.get_stats()["dropped"], 1)
+
+            m.post(requests_mock.ANY, status_code=500)
+            background_shipper = BackgroundShipper(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN,
+                                                   max_retries=2, backoff_seconds=0.01)
+            background_shipper.add({"metrics": {"up": 1}})
+            self.assertTrue(background_shipper.close(timeout=5))
+            self.assertEqual(background_shipper.get_stats()["dropped"], 1)
+            self.assertEqual(background_shipper.get_stats()["retried"], 2)
+
+    # Tests an unexpected error while sending a bulk drops the bulk, and the background thread keeps sending
+    def test_background_unexpected_error(self):
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            background_shipper = BackgroundShipper(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN)
+            with mock.patch("shipper.post_data", side_effect=TypeError("unexpected")):
+                background_shipper.add({"metrics": {"up": 1}})
+                self.assertTrue(background_shipper.flush(timeout=5))
+            self.assertEqual(background_shipper.get_stats()["dropped"], 1)
+            self.assertEqual(background_shipper.get_stats()["pending"], 0)
+            background_shipper.add({"metrics": {"up": 1}})
+            self.assertTrue(background_shipper.close(timeout=5))
+            self.assertEqual(background_shipper.get_stats()["sent"], 1)
+
+    # Tests the requests to the listener have a timeout
+    def test_request_timeout(self):
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY)
+            shipper.post_data(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN, "data")
+            self.assertEqual(m.request_history[0].timeout, shipper.REQUEST_TIMEOUT_SECONDS)
+
+    # Tests documents are dropped when the queue is full, and flush gives up at the deadline
+    def test_background_bounded_queue(self):
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY, status_code=503)
+            background_shipper = BackgroundShipper(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN,
+                                                   max_queue_size=2, max_retries=1, backoff_seconds=0.5)
+            results = [background_shipper.add({"metrics": {"index": i}}) for i in range(10)]
+            self.assertFalse(all(results))
+            self.assertGreater(background_shipper.get_stats()["dropped"], 0)
+            self.assertFalse(background_shipper.flush(timeout=0.1))
+            self.assertTrue(background_shipper.close(timeout=5))
+
+    # Tests documents that could not be sent before the deadline are spooled and replayed by the next shipper
+    def test_background_spool_and_replay(self):
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+        spool = Spool(spool_dir)
+        with requests_mock.Mocker() as m:
+            m.post(requests_mock.ANY, exc=requests.exceptions.ConnectionError)
+            background_shipper = BackgroundShipper(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN,
+                                                   max_retries=1, backoff_seconds=0.01, spool=spool)
+            for i in range(20):
+                background_shipper.add({"metrics": {"index": i}})
+            background_shipper.close(timeout=5)
+            self.assertEqual(background_shipper.get_stats()["spooled"], 20)
+            self.assertEqual(background_shipper.get_stats()["dropped"], 0)
+
+            m.post(requests_mock.ANY)
+            background_shipper = BackgroundShipper(self.TEST_LOGZIO_LISTENER, self.TEST_METRICS_TOKEN, spool=spool)
+            self.assertEqual(spool.replay(background_shipper.add_line), 20)
+            self.assertTrue(background_shipper.close(timeout=5))
+            self.assertEqual(background_shipper.get_stats()["sent"], 20)
+            spool.commit_replay()
+            self.assertEqual(spool.size(), 0)
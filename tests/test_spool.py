@@ -0,0 +1,84 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import sys
+sys.path.append('..')
+from spool import Spool
+
+
+class TestSpool(TestCase):
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+
+    # Tests spooled documents are replayed once, oldest first
+    def test_replay(self):
+        spool = Spool(self.spool_dir, max_file_size=100)
+        lines = [b'{"metrics": {"index": %d}}' % i for i in range(10)]
+        for line in lines:
+            spool.append([line])
+        replayed = []
+        self.assertEqual(spool.replay(replayed.append), 10)
+        self.assertEqual(replayed, lines)
+        spool.commit_replay()
+        self.assertEqual(spool.replay(replayed.append), 0)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    # Tests replayed documents are kept until the replay is committed, so a run that ended before committing doesn't
+    # lose them
+    def test_replay_without_commit(self):
+        spool = Spool(self.spool_dir)
+        spool.append([b'{"index": 1}', b'{"index": 2}'])
+        self.assertEqual(spool.replay(lambda line: None), 2)
+        replayed = []
+        self.assertEqual(Spool(self.spool_dir).replay(replayed.append), 2)
+        self.assertEqual(replayed, [b'{"index": 1}', b'{"index": 2}'])
+
+    # Tests a replay passes at most max_lines documents, and the documents that were not replayed are kept after the
+    # replay is committed
+    def test_replay_max_lines(self):
+        spool = Spool(self.spool_dir, max_file_size=100)
+        lines = [b'{"metrics": {"index": %d}}' % i for i in range(10)]
+        for line in lines:
+            spool.append([line])
+        replayed = []
+        self.assertEqual(spool.replay(replayed.append, max_lines=6), 6)
+        spool.commit_replay()
+        self.assertEqual(spool.replay(replayed.append, max_lines=6), 4)
+        spool.commit_replay()
+        self.assertEqual(replayed, lines)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    # Tests the spool keeps only the newest max_files rotated files
+    def test_size_cap(self):
+        spool = Spool(self.spool_dir, max_file_size=100, max_files=2)
+        for i in range(100):
+            spool.append([b'{"metrics": {"index": %d}}' % i])
+        self.assertLessEqual(spool.size(), 3 * 100 + 30)
+        self.assertGreater(spool.dropped_files, 0)
+        replayed = []
+        spool.replay(replayed.append)
+        self.assertEqual(replayed[-1], b'{"metrics": {"index": 99}}')
+
+    # Tests the files that were claimed for replay count toward max_files, so the spool stays bounded over runs that
+    # could not send the metrics and ended before committing the replay
+    def test_size_cap_over_runs(self):
+        for run in range(30):
+            spool = Spool(self.spool_dir, max_file_size=100, max_files=2)
+            spool.replay(lambda line: spool.append([line]))
+            for i in range(10):
+                spool.append([b'{"metrics": {"run": %d, "index": %d}}' % (run, i)])
+        self.assertLessEqual(len(os.listdir(self.spool_dir)), 3)
+        self.assertLessEqual(spool.size(), 3 * 100 + 40)
+
+    # Tests documents that were appended while replaying are kept for the next replay
+    def test_append_during_replay(self):
+        spool = Spool(self.spool_dir)
+        spool.append([b'{"index": 1}'])
+        spool.replay(lambda line: spool.append([line + b' ']))
+        spool.commit_replay()
+        replayed = []
+        spool.replay(replayed.append)
+        self.assertEqual(replayed, [b'{"index": 1} '])